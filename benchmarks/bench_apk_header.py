@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: apk_header fast manifest reader vs fdroidserver.common.get_apk_id
+
+Usage:
+  python3 benchmarks/bench_apk_header.py [APK or directory ...]   (default: apks/)
+
+Reports the cold import cost of each path (in a fresh interpreter), the
+per-APK parse time, and any APK where the two disagree.
+"""
+
+import sys
+import time
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+
+def import_time(statement: str, runs=3) -> float:
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=ROOT / "scripts", check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def collect(args):
+    paths = [Path(a) for a in args] or [ROOT / "apks"]
+    apks = []
+    for p in paths:
+        apks.extend(sorted(p.rglob("*.apk")) if p.is_dir() else [p])
+    return apks
+
+
+def time_each(fn, apks, rounds):
+    results, start = {}, time.perf_counter()
+    for _ in range(rounds):
+        for apk in apks:
+            try:
+                results[apk] = fn(apk)
+            except Exception as e:
+                results[apk] = ("error", type(e).__name__)
+    return results, (time.perf_counter() - start) / (rounds * len(apks))
+
+
+def main():
+    apks = collect(sys.argv[1:])
+    if not apks:
+        print("No APKs found")
+        return
+
+    import apk_header
+    from fdroidserver import common
+
+    def fast(apk):
+        m = apk_header.read_manifest(apk)
+        return m["package"], m["versionCode"], m["versionName"]
+
+    rounds = 5
+    fast_results, fast_avg = time_each(fast, apks, rounds)
+    ref_results, ref_avg = time_each(lambda apk: common.get_apk_id(str(apk)), apks, rounds)
+
+    fallbacks = [a for a, r in fast_results.items() if r[0] == "error"]
+    mismatches = [a for a, r in fast_results.items() if r[0] != "error" and r != ref_results[a]]
+
+    print(f"APKs:               {len(apks)} ({rounds} rounds)")
+    print(f"import apk_header:  {import_time('import apk_header') * 1000:8.1f} ms")
+    print(f"import fdroidserver:{import_time('from fdroidserver import common') * 1000:8.1f} ms")
+    print(f"apk_header:         {fast_avg * 1000:8.3f} ms/apk")
+    print(f"get_apk_id:         {ref_avg * 1000:8.3f} ms/apk")
+    print(f"speedup:            {ref_avg / fast_avg if fast_avg else 0:8.1f}x")
+    print(f"fallbacks:          {len(fallbacks)}")
+    for apk in fallbacks:
+        print(f"  {apk.name}: {fast_results[apk][1]}")
+    print(f"mismatches:         {len(mismatches)}")
+    for apk in mismatches:
+        print(f"  {apk.name}: {fast_results[apk]} != {ref_results[apk]}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
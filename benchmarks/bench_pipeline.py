@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-to-end runs of the repo scripts against a local mock GitHub
+
+For each catalog size a scratch workspace is created (a copy of scripts/ and
+fdroid/ plus a synthetic apps.yaml from synth_catalog.py) and the scripts are
+run in it as subprocesses, with GITHUB_API_URL pointing at mock_github.py:
+
+  setup            setup_apps.py                   cold, then warm (no changes)
+  download         update_fdroid_repo.py           cold, then warm (all on disk)
+  status           status_engine.py                cold, then warm (fresh report)
+  pipeline         pipeline.py setup..prune status in a fresh workspace, cold and warm
+
+Every run reports wall time, exit status, requests seen by the mock (API,
+GraphQL, downloads, 304s, rate-limited), bytes served, and the peak RSS of
+the child process; pipeline runs add their per-stage timings. With --json
+the results are written out, and --baseline compares against an earlier
+--json file so regressions show up as percentages.
+
+Usage:
+  python3 benchmarks/bench_pipeline.py [--sizes 59,500,5000] [--latency MS] [--bandwidth KBPS]
+                                       [--only setup,download] [--json out.json]
+                                       [--baseline old.json [--fail-over PCT]]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import synth_catalog  # noqa: E402
+from mock_github import MockGitHub  # noqa: E402
+
+SCENARIOS = {
+    "setup": ["scripts/setup_apps.py"],
+    "download": ["scripts/update_fdroid_repo.py"],
+    "status": ["scripts/status_engine.py"],
+    "pipeline": ["scripts/pipeline.py", "setup..prune", "status"],
+}
+
+STAGE_LINE = re.compile(r"^\[INFO\]\s+(\w+)\s+([\d.]+)s\s+(\w+)$")
+
+
+def make_workspace(base: Path, document: dict) -> Path:
+    """Scratch copy of the repo with the synthetic catalog"""
+    if base.exists():
+        shutil.rmtree(base)
+    base.mkdir(parents=True)
+    shutil.copytree(ROOT / "scripts", base / "scripts",
+                    ignore=shutil.ignore_patterns("__pycache__"))
+    shutil.copytree(ROOT / "fdroid", base / "fdroid",
+                    ignore=shutil.ignore_patterns("repo", "archive", "tmp"))
+    (base / "apks").mkdir()
+    (base / "docs").mkdir()
+    import yaml
+    (base / "apps.yaml").write_text(yaml.safe_dump(document, sort_keys=False, allow_unicode=True))
+    return base
+
+
+def child_env(api_url: str, graphql: bool) -> dict:
+    """The caller's environment without repo knobs, pointed at the mock"""
+    env = {k: v for k, v in os.environ.items()
+           if not k.startswith(("FDROID_", "GITHUB_", "GH_"))}
+    env.update(GITHUB_API_URL=api_url, GH_TOKEN="bench", PYTHONDONTWRITEBYTECODE="1")
+    if not graphql:
+        env["FDROID_GRAPHQL"] = "0"
+    return env
+
+
+def run_child(argv, cwd: Path, env: dict, log: Path) -> dict:
+    """Run one script; wall time, exit code and peak RSS (from wait4)"""
+    with open(log, "w") as out:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable] + argv, cwd=cwd, env=env,
+                                stdout=out, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"wall": wall, "exit": proc.returncode, "peak_rss": rss}
+
+
+def stage_timings(log: Path) -> dict:
+    stages = {}
+    for line in log.read_text(errors="replace").splitlines():
+        m = STAGE_LINE.match(line.strip())
+        if m and m.group(1) != "total":
+            stages[m.group(1)] = float(m.group(2))
+    return stages
+
+
+def bench_size(count: int, mock: MockGitHub, args, workdir: Path) -> list:
+    document = synth_catalog.generate(count)
+    mock.packages = synth_catalog.packages(document)
+    env = child_env(mock.url, not args.no_graphql)
+    results = []
+    shared = None
+    for scenario in args.only:
+        if scenario == "pipeline":
+            # the pipeline does everything itself, so it gets a fresh tree
+            workspace = make_workspace(workdir / f"{count}-pipeline", document)
+        else:
+            shared = shared or make_workspace(workdir / f"{count}-scripts", document)
+            workspace = shared
+        for phase in ("cold", "warm"):
+            mock.stats.reset()
+            mock.reset_limits()
+            log = workspace / f"{scenario}-{phase}.log"
+            result = run_child(SCENARIOS[scenario], workspace, env, log)
+            result.update(scenario=scenario, phase=phase, apps=count, **mock.stats.snapshot())
+            if scenario == "pipeline":
+                result["stages"] = stage_timings(log)
+            if result["exit"]:
+                print(f"  {scenario} ({phase}) exited {result['exit']}, see {log}", file=sys.stderr)
+            results.append(result)
+            print(format_row(result), flush=True)
+    return results
+
+
+HEADER = (f"{'scenario':<10} {'phase':<5} {'apps':>5} {'wall s':>8} {'exit':>4} {'req':>6} "
+          f"{'api':>6} {'gql':>4} {'dl':>6} {'304':>5} {'lim':>4} {'MB sent':>8} {'RSS MB':>7}")
+
+
+def format_row(r: dict) -> str:
+    row = (f"{r['scenario']:<10} {r['phase']:<5} {r['apps']:>5} {r['wall']:>8.2f} {r['exit']:>4} "
+           f"{r['requests']:>6} {r['api']:>6} {r['graphql']:>4} {r['downloads']:>6} "
+           f"{r['not_modified']:>5} {r['rate_limited']:>4} {r['bytes_sent'] / 1e6:>8.1f} "
+           f"{r['peak_rss'] / 1e6:>7.1f}")
+    if r.get("stages"):
+        row += "\n" + " " * 17 + "  ".join(f"{k} {v:.2f}s" for k, v in r["stages"].items())
+    return row
+
+
+def compare(results: list, baseline: list, fail_over) -> bool:
+    """Print changes against baseline; False if any wall time regressed past fail_over %"""
+    old = {(r["scenario"], r["phase"], r["apps"]): r for r in baseline}
+    ok = True
+    print("\nAgainst baseline:")
+    for r in results:
+        b = old.get((r["scenario"], r["phase"], r["apps"]))
+        if not b:
+            continue
+        deltas = []
+        for key in ("wall", "requests", "bytes_sent", "peak_rss"):
+            if b.get(key):
+                change = (r[key] - b[key]) / b[key] * 100
+                deltas.append(f"{key} {change:+.0f}%")
+                if key == "wall" and fail_over is not None and change > fail_over:
+                    ok = False
+        print(f"  {r['scenario']:<10} {r['phase']:<5} {r['apps']:>5}  {'  '.join(deltas)}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the repo scripts against a mock GitHub")
+    parser.add_argument("--sizes", default="59,500", help="catalog sizes, comma separated")
+    parser.add_argument("--only", default=",".join(SCENARIOS),
+                        help=f"scenarios to run ({', '.join(SCENARIOS)})")
+    parser.add_argument("--latency", type=float, default=20, help="mock response delay, ms")
+    parser.add_argument("--bandwidth", type=int, default=0, help="mock KB/s per response (0: unlimited)")
+    parser.add_argument("--releases", type=int, default=12, help="releases per repo")
+    parser.add_argument("--apk-kb", type=int, default=32, help="size of each served APK")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="mock core requests per hour")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="answer every Nth API request with a 429")
+    parser.add_argument("--no-graphql", action="store_true", help="REST only")
+    parser.add_argument("--workdir", type=Path, help="scratch directory (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch workspaces")
+    parser.add_argument("--json", type=Path, help="write results to this file")
+    parser.add_argument("--baseline", type=Path, help="compare against an earlier --json file")
+    parser.add_argument("--fail-over", type=float, help="exit 1 if a wall time regressed by more %%")
+    args = parser.parse_args()
+    args.only = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = [s for s in args.only if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="fdroid-bench-"))
+    mock = MockGitHub(latency=args.latency / 1000, bandwidth=args.bandwidth * 1024,
+                      releases=args.releases, apk_size=args.apk_kb * 1024,
+                      rate_limit=args.rate_limit, throttle_every=args.throttle_every)
+    mock.start()
+    print(f"Mock GitHub at {mock.url}, workspaces in {workdir}")
+    print(HEADER)
+    results = []
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            results.extend(bench_size(size, mock, args, workdir))
+    finally:
+        mock.stop()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    settings = {k: getattr(args, k) for k in ("latency", "bandwidth", "releases", "apk_kb",
+                                              "rate_limit", "throttle_every", "no_graphql")}
+    if args.json:
+        args.json.write_text(json.dumps({"settings": settings, "results": results}, indent=1))
+        print(f"\nResults written to {args.json}")
+    ok = True
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("settings") != settings:
+            print("\nNote: baseline was taken with different settings", file=sys.stderr)
+        ok = compare(results, baseline.get("results", []), args.fail_over)
+    if any(r["exit"] for r in results) or not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
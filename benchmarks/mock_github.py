@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the GitHub API and release downloads, for benchmarks
+
+Serves, for any owner/repo:
+
+  GET  /repos/<owner>/<repo>/releases[?per_page=&page=]   paginated, with Link
+  GET  /repos/<owner>/<repo>/releases/latest
+  GET  /repos/<owner>/<repo>/releases/tags/<tag>
+  POST /graphql                                           aliased repository() queries
+  GET  /dl/<owner>/<repo>/<tag>/<asset>.apk               HTTP Range supported
+
+Release history is synthetic but deterministic (derived from the repo name),
+so repeated runs see the same data. Each release carries an arm64, an x86_64
+and every few releases a generically named APK, which makes abi_select probe
+it with Range requests. APKs are real zips with a binary AndroidManifest.xml
+(package, versionCode, versionName, minSdk) and lib/<abi>/ entries, padded to
+the configured size, so apk_header and the APK index read them like the
+real thing.
+
+API responses carry ETags (If-None-Match gives a 304) and X-RateLimit-*
+headers from a core and a graphql bucket; an exhausted bucket answers 403,
+and --throttle-every N answers every Nth API request with a 429 and
+Retry-After. --latency delays every response and --bandwidth caps each
+response body's transfer rate.
+
+Used in-process by bench_pipeline.py; can also be run on its own:
+
+  mock_github.py [--port N] [--latency MS] [--bandwidth KBPS] [--releases N]
+"""
+
+import io
+import re
+import sys
+import json
+import time
+import zlib
+import struct
+import hashlib
+import zipfile
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ARM64 = "arm64-v8a"
+X86_64 = "x86_64"
+
+# android:* attribute resource ids, as apk_header.ATTR_IDS expects them
+ATTR_VERSION_CODE = 0x0101021b
+ATTR_VERSION_NAME = 0x0101021c
+ATTR_MIN_SDK = 0x0101020c
+ATTR_VERSION_CODE_MAJOR = 0x01010576
+
+DAY = 86400
+EPOCH = 1767225600  # 2026-01-01, newest synthetic release
+
+
+# -----------------------------------------
+# Synthetic APKs
+# -----------------------------------------
+def _string_pool(strings) -> bytes:
+    """UTF-16 ResStringPool chunk"""
+    offsets, data = [], b""
+    for s in strings:
+        offsets.append(len(data))
+        encoded = s.encode("utf-16-le")
+        data += struct.pack("<H", len(s)) + encoded + b"\0\0"
+    data += b"\0" * (-len(data) % 4)
+    header = 28
+    strings_start = header + 4 * len(strings)
+    body = struct.pack(f"<{len(offsets)}I", *offsets) + data
+    return struct.pack("<HHIIIIII", 0x0001, header, header + len(body), len(strings), 0, 0,
+                       strings_start, 0) + body
+
+
+def _start_element(name_idx: int, attrs) -> bytes:
+    """START_ELEMENT chunk; attrs is [(name index, raw string index or None, type, data)]"""
+    attr_bytes = b"".join(
+        struct.pack("<IIIHBBI", 0xFFFFFFFF, a_name, 0xFFFFFFFF if raw is None else raw,
+                    8, 0, vtype, data)
+        for a_name, raw, vtype, data in attrs)
+    ext = struct.pack("<IIHHHHHH", 0xFFFFFFFF, name_idx, 20, 20, len(attrs), 0, 0, 0)
+    body = struct.pack("<II", 1, 0xFFFFFFFF) + ext + attr_bytes
+    return struct.pack("<HHI", 0x0102, 16, 8 + len(body)) + body
+
+
+def binary_manifest(package: str, version_code: int, version_name: str, min_sdk=21,
+                    version_code_major=None) -> bytes:
+    # resource-mapped attribute names first, as aapt2 lays them out
+    strings = ["versionCode", "versionName", "minSdkVersion", "versionCodeMajor", "package",
+               "manifest", "uses-sdk", package, version_name]
+    pool = _string_pool(strings)
+    res_map = struct.pack("<HHI4I", 0x0180, 8, 24, ATTR_VERSION_CODE, ATTR_VERSION_NAME,
+                          ATTR_MIN_SDK, ATTR_VERSION_CODE_MAJOR)
+    attrs = [(4, 7, 0x03, 7), (0, None, 0x10, version_code), (1, 8, 0x03, 8)]
+    if version_code_major is not None:
+        attrs.append((3, None, 0x10, version_code_major))
+    manifest = _start_element(5, attrs)
+    uses_sdk = _start_element(6, [(2, None, 0x10, min_sdk)])
+    body = pool + res_map + manifest + uses_sdk
+    return struct.pack("<HHI", 0x0003, 8, 8 + len(body)) + body
+
+
+def build_apk(package: str, version_code: int, version_name: str, abi, size: int,
+              version_code_major=None) -> bytes:
+    """A zip that reads as an APK, padded with incompressible bytes to exactly size (if possible)"""
+    seed = hashlib.sha256(f"{package}:{version_code}:{abi}".encode()).digest()
+
+    def build(pad: int) -> bytes:
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as z:
+            z.writestr("AndroidManifest.xml",
+                       binary_manifest(package, version_code, version_name,
+                                       version_code_major=version_code_major))
+            if abi:
+                z.writestr(f"lib/{abi}/libbench.so", b"\x7fELF" + b"\0" * 60)
+            z.writestr("classes.dex", b"dex\n035\0" + b"\0" * 104)
+            z.writestr(zipfile.ZipInfo("assets/payload.bin"),
+                       (seed * (pad // len(seed) + 1))[:pad], zipfile.ZIP_STORED)
+        return buf.getvalue()
+
+    # the payload is stored, so the archive grows byte for byte with it
+    data = build(0)
+    return build(size - len(data)) if size > len(data) else data
+
+
+# -----------------------------------------
+# Synthetic release history
+# -----------------------------------------
+def _seed(repo: str) -> int:
+    return zlib.crc32(repo.lower().encode())
+
+
+def releases_for(repo: str, base_url: str, count: int, apk_size: int) -> list:
+    """Newest-first REST /releases items for repo"""
+    owner, name = repo.split("/", 1)
+    seed = _seed(repo)
+    cadence = (seed % 40 + 3) * DAY
+    releases = []
+    for i in range(count, 0, -1):
+        prerelease = i % 4 == 0
+        tag = f"v1.{i}.0" + ("-beta" if prerelease else "")
+        published = datetime.fromtimestamp(EPOCH - (count - i) * cadence, timezone.utc)
+        assets = []
+        variants = [ARM64, X86_64]
+        if i % 3 == 0:
+            variants.append("release")  # generic name, the ABI is only visible inside
+        for suffix in variants:
+            asset = f"{name}-{tag}-{suffix}.apk"
+            assets.append({
+                "name": asset,
+                "size": apk_size,
+                "content_type": "application/vnd.android.package-archive",
+                "browser_download_url": f"{base_url}/dl/{owner}/{name}/{tag}/{asset}",
+            })
+        releases.append({
+            "id": seed % 10**6 * 1000 + i,
+            "tag_name": tag, "name": tag, "draft": False, "prerelease": prerelease,
+            "published_at": published.strftime("%Y-%m-%dT%H:%M:%SZ"), "assets": assets,
+        })
+    return releases
+
+
+def _graphql_node(release: dict) -> dict:
+    return {
+        "databaseId": release["id"], "tagName": release["tag_name"], "name": release["name"],
+        "isPrerelease": release["prerelease"], "isDraft": release["draft"],
+        "publishedAt": release["published_at"],
+        "releaseAssets": {"nodes": [
+            {"name": a["name"], "size": a["size"], "contentType": a["content_type"],
+             "downloadUrl": a["browser_download_url"]} for a in release["assets"]]},
+    }
+
+
+# -----------------------------------------
+# Server
+# -----------------------------------------
+class Stats:
+    FIELDS = ("requests", "api", "graphql", "downloads", "not_modified", "rate_limited",
+              "bytes_sent")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.values = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self.values[key] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.values)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients dropping idle keep-alive connections is not worth a traceback
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+class MockGitHub:
+    """Threaded HTTP server; start() returns the base URL"""
+
+    def __init__(self, port=0, latency=0.0, bandwidth=0, releases=12, apk_size=256 * 1024,
+                 packages=None, rate_limit=5000, graphql_limit=5000, throttle_every=0):
+        self.latency = latency
+        self.bandwidth = bandwidth          # bytes per second per response, 0 = unlimited
+        self.release_count = releases
+        self.apk_size = apk_size
+        self.packages = dict(packages or {})  # {owner/repo: package id}
+        self.limits = {"core": rate_limit, "graphql": graphql_limit}
+        self.throttle_every = throttle_every
+        self.stats = Stats()
+        self._lock = threading.Lock()
+        self._apks = OrderedDict()
+        self._window = {}
+        self._api_calls = 0
+        self.server = _Server(("127.0.0.1", port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_limits(self):
+        with self._lock:
+            self._window = {}
+            self._api_calls = 0
+
+    def releases(self, repo: str) -> list:
+        return releases_for(repo, self.url, self.release_count, self.apk_size)
+
+    def apk(self, owner: str, name: str, tag: str, asset: str) -> bytes:
+        key = (owner, name, tag, asset)
+        with self._lock:
+            if key in self._apks:
+                self._apks.move_to_end(key)
+                return self._apks[key]
+        repo = f"{owner}/{name}"
+        package = self.packages.get(repo.lower()) or f"bench.{owner}.{name}".lower().replace("-", "_")
+        m = re.match(r"v1\.(\d+)\.0", tag)
+        code = int(m.group(1)) if m else 1
+        abi = X86_64 if asset.endswith("-x86_64.apk") else ARM64
+        data = build_apk(package, code, tag.lstrip("v"), abi, self.apk_size)
+        with self._lock:
+            self._apks[key] = data
+            while len(self._apks) > 256:
+                self._apks.popitem(last=False)
+        return data
+
+    def take_token(self, resource: str):
+        """(allowed, headers) for one API request against resource"""
+        now = int(time.time())
+        with self._lock:
+            self._api_calls += 1
+            call = self._api_calls
+            limit = self.limits[resource]
+            reset, used = self._window.get(resource, (now + 3600, 0))
+            if reset <= now:
+                reset, used = now + 3600, 0
+            allowed = used < limit
+            used += allowed
+            self._window[resource] = (reset, used)
+        headers = {"X-RateLimit-Limit": str(limit), "X-RateLimit-Remaining": str(limit - used),
+                   "X-RateLimit-Reset": str(reset), "X-RateLimit-Resource": resource}
+        if self.throttle_every and call % self.throttle_every == 0:
+            return "throttled", headers
+        return ("ok" if allowed else "exhausted"), headers
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, status, body: bytes, headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command == "HEAD" or not body:
+                    return
+                if mock.bandwidth:
+                    chunk = max(mock.bandwidth // 20, 4096)
+                    for i in range(0, len(body), chunk):
+                        self.wfile.write(body[i:i + chunk])
+                        time.sleep(min(chunk, len(body) - i) / mock.bandwidth)
+                else:
+                    self.wfile.write(body)
+                mock.stats.add(bytes_sent=len(body))
+
+            def send_json(self, payload, headers):
+                body = json.dumps(payload).encode()
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                headers = dict(headers, ETag=etag)
+                headers["Content-Type"] = "application/json; charset=utf-8"
+                if self.headers.get("If-None-Match") == etag:
+                    mock.stats.add(not_modified=1)
+                    return self.send_body(304, b"", headers)
+                self.send_body(200, body, headers)
+
+            def limited(self, resource: str):
+                """Apply rate limiting; returns headers to send, or None if already answered"""
+                state, headers = mock.take_token(resource)
+                if state == "ok":
+                    return headers
+                mock.stats.add(rate_limited=1)
+                if state == "throttled":
+                    body = b'{"message": "You have exceeded a secondary rate limit."}'
+                    self.send_body(429, body, dict(headers, **{"Retry-After": "1"}))
+                else:
+                    self.send_body(403, b'{"message": "API rate limit exceeded"}', headers)
+                return None
+
+            def do_GET(self):
+                mock.stats.add(requests=1)
+                if mock.latency:
+                    time.sleep(mock.latency)
+                parts = urlsplit(self.path)
+                m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/releases(/latest|/tags/[^/]+)?",
+                                 parts.path)
+                if m:
+                    return self.releases(m, parse_qs(parts.query), parts.path)
+                m = re.fullmatch(r"/dl/([^/]+)/([^/]+)/([^/]+)/([^/]+)", parts.path)
+                if m:
+                    return self.download(*m.groups())
+                self.send_body(404, b'{"message": "Not Found"}')
+
+            do_HEAD = do_GET
+
+            def releases(self, m, query, path):
+                mock.stats.add(api=1)
+                headers = self.limited("core")
+                if headers is None:
+                    return
+                releases = mock.releases(f"{m.group(1)}/{m.group(2)}")
+                if m.group(3) and m.group(3).startswith("/tags/"):
+                    tag = unquote(m.group(3)[len("/tags/"):])
+                    release = next((r for r in releases if r["tag_name"] == tag), None)
+                    if release is None:
+                        return self.send_body(404, b'{"message": "Not Found"}', headers)
+                    return self.send_json(release, headers)
+                if m.group(3):
+                    latest = next((r for r in releases if not r["prerelease"]), None)
+                    if latest is None:
+                        return self.send_body(404, b'{"message": "Not Found"}', headers)
+                    return self.send_json(latest, headers)
+                per_page = int(query.get("per_page", ["30"])[0])
+                page = int(query.get("page", ["1"])[0])
+                items = releases[(page - 1) * per_page:page * per_page]
+                if page * per_page < len(releases):
+                    headers["Link"] = (f'<{mock.url}{path}?per_page={per_page}&page={page + 1}>; '
+                                       f'rel="next"')
+                self.send_json(items, headers)
+
+            def download(self, owner, name, tag, asset):
+                mock.stats.add(downloads=1)
+                data = mock.apk(owner, name, tag, asset)
+                headers = {"Accept-Ranges": "bytes",
+                           "Content-Type": "application/vnd.android.package-archive"}
+                rng = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+                if not rng:
+                    return self.send_body(200, data, headers)
+                first, last = rng.groups()
+                if first:
+                    start, end = int(first), int(last) if last else len(data) - 1
+                else:
+                    start, end = max(len(data) - int(last), 0), len(data) - 1
+                if start >= len(data):
+                    return self.send_body(416, b"", {"Content-Range": f"bytes */{len(data)}"})
+                end = min(end, len(data) - 1)
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                self.send_body(206, data[start:end + 1], headers)
+
+            def do_POST(self):
+                mock.stats.add(requests=1, graphql=1)
+                if mock.latency:
+                    time.sleep(mock.latency)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if urlsplit(self.path).path != "/graphql":
+                    return self.send_body(404, b'{"message": "Not Found"}')
+                headers = self.limited("graphql")
+                if headers is None:
+                    return
+                request = json.loads(body or b"{}")
+                variables = request.get("variables") or {}
+                first = re.search(r"releases\(first: (\d+)", request.get("query", ""))
+                first = int(first.group(1)) if first else 10
+                data = {}
+                for key, owner in variables.items():
+                    if key.startswith("o"):
+                        i = key[1:]
+                        repo = f"{owner}/{variables.get('n' + i)}"
+                        nodes = [_graphql_node(r) for r in mock.releases(repo)[:first]]
+                        data[f"r{i}"] = {"releases": {"nodes": nodes}}
+                self.send_json({"data": data}, headers)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the GitHub releases API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="per-response delay, ms")
+    parser.add_argument("--bandwidth", type=int, default=0, help="per-response KB/s (0: unlimited)")
+    parser.add_argument("--releases", type=int, default=12, help="releases per repo")
+    parser.add_argument("--apk-kb", type=int, default=256, help="size of each APK")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="core requests per hour")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="answer every Nth API request with a 429")
+    args = parser.parse_args()
+
+    mock = MockGitHub(port=args.port, latency=args.latency / 1000, bandwidth=args.bandwidth * 1024,
+                      releases=args.releases, apk_size=args.apk_kb * 1024,
+                      rate_limit=args.rate_limit, throttle_every=args.throttle_every)
+    print(f"Serving on {mock.url} (GITHUB_API_URL={mock.url})", flush=True)
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(mock.stats.snapshot()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Synthetic catalog generator for benchmarks
+
+Writes an apps.yaml with N apps: the real entries of the repository's
+apps.yaml first, then generated ones modelled on them (same fields and
+channel mix, unique ids and github.com/bench-<k>/<name> sources spread over
+a few hundred owners). Generated entries have no icon URL. The output is
+deterministic for a given N.
+
+Usage:
+  synth_catalog.py N OUTPUT [--sharded]   (--sharded writes an apps.d/ directory)
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import catalog  # noqa: E402
+
+OWNERS = 300
+
+
+def real_catalog() -> dict:
+    with open(catalog.APPS_FILE, "rb") as f:
+        return yaml.load(f, Loader=catalog.SafeLoader)
+
+
+def generate(count: int) -> dict:
+    """apps.yaml document with count apps"""
+    data = real_catalog()
+    real = [e for e in data.get("apps", []) if isinstance(e, dict)]
+    apps = real[:count]
+    for n in range(len(apps), count):
+        template = real[n % len(real)]
+        name = f"bench-app-{n:05d}"
+        entry = {
+            "id": f"org.bench.app{n:05d}",
+            "name": f"Bench App {n}",
+            "author": f"bench-{n % OWNERS}",
+            "url": f"https://github.com/bench-{n % OWNERS}/{name}",
+            "classification": dict(template.get("classification") or {}),
+            "fdroid": {k: v for k, v in (template.get("fdroid") or {}).items()},
+        }
+        if template.get("permissions"):
+            entry["permissions"] = list(template["permissions"])
+        apps.append(entry)
+    return {"schemaVersion": data.get("schemaVersion", catalog.CATALOG_VERSION),
+            "meta": dict(data.get("meta") or {}, name="Benchmark catalog"), "apps": apps}
+
+
+def write(count: int, output: Path, sharded=False) -> dict:
+    """Write the catalog to output (a file, or a directory when sharded); returns the document"""
+    document = generate(count)
+    output = Path(output)
+    if sharded:
+        tmp = output.with_name(output.name + ".yaml.tmp")
+        tmp.write_text(yaml.safe_dump(document, sort_keys=False, allow_unicode=True))
+        catalog.split(tmp, output)
+        tmp.unlink()
+    else:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(yaml.safe_dump(document, sort_keys=False, allow_unicode=True))
+    return document
+
+
+def packages(document: dict) -> dict:
+    """{owner/repo (lower case): app id}, for the mock server's APK manifests"""
+    found = {}
+    for entry in document["apps"]:
+        repo = catalog.repo_from_url(entry.get("url") or "")
+        if repo:
+            found.setdefault(repo.lower(), entry["id"])
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic apps.yaml")
+    parser.add_argument("count", type=int)
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--sharded", action="store_true", help="write an apps.d/ directory")
+    args = parser.parse_args()
+    document = write(args.count, args.output, args.sharded)
+    print(f"{len(document['apps'])} apps written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
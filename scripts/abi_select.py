@@ -0,0 +1,161 @@
+"""
+ABI-aware release asset selection
+
+Classifies APK asset names with a precompiled rule table (whole tokens only,
+so "all" no longer matches "install"), prefers arm64 > universal > generic >
+32-bit arm, and never picks x86 or desktop builds. When the best candidates
+only have generic names, their real ABIs are read from the lib/<abi>/ entries
+of the remote zip central directory using HTTP Range requests for the last
+few kilobytes of the file, so only the right APK is downloaded.
+
+Probe results are kept in .cache/asset-abis.json (FDROID_ASSET_ABIS) keyed by
+asset URL and size.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from pathlib import Path
+
+import apk_header
+
+ROOT = Path(__file__).resolve().parents[1]
+ABI_CACHE = Path(os.environ.get("FDROID_ASSET_ABIS", ROOT / ".cache" / "asset-abis.json"))
+
+ARM64 = "arm64-v8a"
+ARMV7 = "armeabi-v7a"
+UNIVERSAL = "universal"
+SKIP = "skip"
+
+# First matching rule wins; tokens are delimited by anything but [a-z0-9]
+_TOKEN = r"(?<![a-z0-9])(?:{})(?![a-z0-9])"
+RULES = [(re.compile(_TOKEN.format(pattern)), kind) for pattern, kind in (
+    (r"desktop|windows|win(?:32|64)|linux|macos|darwin|mac", SKIP),
+    (r"x86[-_]?64|x86|x64|amd64|i[3-6]86", SKIP),
+    (r"arm64(?:[-_]v8a?)?|aarch64|armv8a?|v8a", ARM64),
+    (r"universal|all|fat|noarch", UNIVERSAL),
+    (r"armeabi(?:[-_]v7a)?|armv7a?|arm32|arm|v7a|eabi", ARMV7),
+)]
+
+SCORES = {ARM64: 3, UNIVERSAL: 2, None: 1, ARMV7: 0}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def classify(name: str):
+    """ABI kind implied by an asset name: ARM64, ARMV7, UNIVERSAL, SKIP or None (generic)"""
+    name = name.lower()
+    if name.endswith(".apk"):
+        name = name[:-4]
+    for rule, kind in RULES:
+        if rule.search(name):
+            return kind
+    return None
+
+
+def kind_from_abis(abis):
+    """ABI kind implied by the native libraries inside an APK"""
+    if not abis:
+        return UNIVERSAL  # no native code runs everywhere
+    if ARM64 in abis:
+        return ARM64
+    if any(a.startswith("arm") for a in abis):
+        return ARMV7
+    return SKIP
+
+
+def remote_abis(client, url: str):
+    """List lib/<abi>/ directories of a remote APK by reading only its central directory"""
+    with client.stream(url, headers={"Range": "bytes=-65557"}) as r:
+        if r.status_code != 206:
+            return None
+        tail = r.content
+        total = r.headers.get("Content-Range", "").rpartition("/")[2]
+    if not total.isdigit():
+        return None
+    tail_start = int(total) - len(tail)
+
+    entries, cd_size, cd_offset = apk_header.end_of_central_directory(tail)
+    if cd_offset >= tail_start:
+        buf, pos = tail, cd_offset - tail_start
+    else:
+        with client.stream(url, headers={"Range": f"bytes={cd_offset}-{cd_offset + cd_size - 1}"}) as r:
+            if r.status_code != 206:
+                return None
+            buf, pos = r.content, 0
+
+    abis = set()
+    for name, *_ in apk_header.central_directory(buf, pos, entries):
+        parts = name.split(b"/")
+        if len(parts) >= 3 and parts[0] == b"lib" and parts[1]:
+            abis.add(parts[1].decode("utf-8", "replace"))
+    return sorted(abis)
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            _cache = json.loads(ABI_CACHE.read_text())
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def probe(client, asset: dict):
+    """Cached remote_abis() for a release asset; None if the server can't tell us"""
+    key = f"{asset['browser_download_url']}#{asset.get('size')}"
+    with _cache_lock:
+        cached = _load_cache().get(key)
+    if cached is not None:
+        return cached
+    try:
+        abis = remote_abis(client, asset["browser_download_url"])
+    except Exception as e:
+        logging.debug(f"ABI probe failed for {asset['name']}: {e}")
+        abis = None
+    if abis is not None:
+        with _cache_lock:
+            _load_cache()[key] = abis
+    return abis
+
+
+def save_cache():
+    with _cache_lock:
+        if _cache is None:
+            return
+        ABI_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ABI_CACHE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(_cache, separators=(",", ":")))
+        os.replace(tmp, ABI_CACHE)
+
+
+def select_asset(client, release_assets):
+    """Pick the best APK of a release; returns (asset, score, kind)
+
+    Names decide when they are explicit about arm64 or universal builds;
+    otherwise generic-named candidates are probed for their real ABIs.
+    """
+    candidates = []
+    for asset in release_assets:
+        kind = classify(asset["name"])
+        if kind != SKIP:
+            candidates.append([asset, kind])
+
+    if candidates and not any(k in (ARM64, UNIVERSAL) for _, k in candidates):
+        for c in candidates:
+            if c[1] is None and client is not None:
+                abis = probe(client, c[0])
+                if abis is not None:
+                    c[1] = kind_from_abis(abis)
+        candidates = [c for c in candidates if c[1] != SKIP]
+
+    best_asset, best_score, best_kind = None, -1, None
+    for asset, kind in candidates:
+        score = SCORES[kind]
+        if score > best_score:
+            best_asset, best_score, best_kind = asset, score, kind
+    return best_asset, best_score, best_kind
@@ -0,0 +1,173 @@
+"""
+Resumable, verified APK downloader
+
+Downloads go to "<name>.part" next to the target and are renamed into place
+only after the size (and the GitHub-provided digest, when the release API
+returns one) has been checked, so a truncated file can never be picked up by
+prune() or the index. An interrupted single-stream download resumes with an
+HTTP Range request; large assets are fetched as parallel ranges whose
+progress is kept in "<name>.part.json" so they resume per range as well.
+
+Tuning (environment):
+  FDROID_SPLIT_MB     split assets at least this large into ranges (default 32)
+  FDROID_CHUNK_MB     size of each range (default 8)
+  FDROID_RANGE_JOBS   parallel ranges per asset (default 4)
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SPLIT_THRESHOLD = int(float(os.environ.get("FDROID_SPLIT_MB", "32")) * 1024 * 1024)
+CHUNK_SIZE = int(float(os.environ.get("FDROID_CHUNK_MB", "8")) * 1024 * 1024)
+RANGE_JOBS = int(os.environ.get("FDROID_RANGE_JOBS", "4"))
+BUFFER = 1 << 16
+
+
+class DownloadError(Exception):
+    pass
+
+
+def is_complete(target: Path, size=None) -> bool:
+    """True if target exists and, when the expected size is known, matches it"""
+    try:
+        return target.stat().st_size == size if size else target.exists()
+    except OSError:
+        return False
+
+
+def file_digest(path: Path, algorithm="sha256") -> str:
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _verify(part: Path, size=None, digest=None):
+    actual = part.stat().st_size
+    if size and actual != size:
+        raise DownloadError(f"{part.name}: size {actual} != expected {size}")
+    if digest and ":" in digest:
+        algorithm, expected = digest.split(":", 1)
+        if algorithm in hashlib.algorithms_available:
+            got = file_digest(part, algorithm)
+            if got != expected.lower():
+                raise DownloadError(f"{part.name}: {algorithm} mismatch ({got} != {expected})")
+
+
+def _probe(client, url: str):
+    """Return (size or None, accepts_ranges) using a one-byte range request"""
+    with client.stream(url, headers={"Range": "bytes=0-0"}) as r:
+        if r.status_code == 206:
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            return int(total) if total.isdigit() else None, True
+        r.raise_for_status()
+        length = r.headers.get("Content-Length")
+        return int(length) if length and length.isdigit() else None, False
+
+
+def _stream(client, url: str, part: Path) -> int:
+    """Single stream, resuming from whatever is already in part"""
+    while True:
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        written = 0
+        with client.stream(url, headers=headers) as r:
+            if r.status_code == 416 and offset:
+                # Stale part file longer than the asset; start over once the
+                # response (and its host slot) has been released
+                stale = True
+            else:
+                stale = False
+                r.raise_for_status()
+                mode = "ab" if offset and r.status_code == 206 else "wb"
+                with open(part, mode) as f:
+                    for chunk in r.iter_content(BUFFER):
+                        f.write(chunk)
+                        written += len(chunk)
+        if not stale:
+            return written
+        part.unlink()
+
+
+def _ranged(client, url: str, part: Path, size: int, jobs: int) -> int:
+    """Fetch size bytes as parallel CHUNK_SIZE ranges into a preallocated part file"""
+    state_file = part.with_name(part.name + ".json")
+    done = set()
+    if part.exists() and state_file.exists():
+        try:
+            state = json.loads(state_file.read_text())
+            if state.get("size") == size and state.get("chunk") == CHUNK_SIZE:
+                done = set(state.get("done", []))
+        except ValueError:
+            pass
+    if not done:
+        with open(part, "wb") as f:
+            f.truncate(size)
+
+    lock = threading.Lock()
+    written = 0
+
+    def fetch(index: int):
+        nonlocal written
+        start = index * CHUNK_SIZE
+        end = min(size, start + CHUNK_SIZE) - 1
+        with client.stream(url, headers={"Range": f"bytes={start}-{end}"}) as r:
+            if r.status_code != 206:
+                raise DownloadError(f"range {start}-{end}: HTTP {r.status_code}")
+            fd = os.open(part, os.O_WRONLY)
+            try:
+                pos = start
+                for chunk in r.iter_content(BUFFER):
+                    os.pwrite(fd, chunk, pos)
+                    pos += len(chunk)
+            finally:
+                os.close(fd)
+        if pos != end + 1:
+            raise DownloadError(f"range {start}-{end}: short read")
+        with lock:
+            done.add(index)
+            written += end + 1 - start
+            state_file.write_text(json.dumps({"size": size, "chunk": CHUNK_SIZE, "done": sorted(done)}))
+
+    todo = [i for i in range((size + CHUNK_SIZE - 1) // CHUNK_SIZE) if i not in done]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for fut in [pool.submit(fetch, i) for i in todo]:
+            fut.result()
+    state_file.unlink(missing_ok=True)
+    return written
+
+
+def download(client, url: str, target: Path, size=None, digest=None, jobs=RANGE_JOBS) -> int:
+    """Download url to target atomically; returns bytes transferred this run"""
+    target = Path(target)
+    part = target.with_name(target.name + ".part")
+
+    # Every request goes through the release URL rather than the signed
+    # redirect target, which expires after a few minutes
+    remote_size, ranges = _probe(client, url)
+    size = size or remote_size
+
+    if size and is_complete(part, size) and not part.with_name(part.name + ".json").exists():
+        # Finished last time but never renamed; just verify it
+        written = 0
+    elif ranges and size and size >= SPLIT_THRESHOLD and jobs > 1:
+        written = _ranged(client, url, part, size, jobs)
+    else:
+        if not ranges:
+            part.unlink(missing_ok=True)
+        written = _stream(client, url, part)
+
+    try:
+        _verify(part, size, digest)
+    except DownloadError:
+        part.unlink(missing_ok=True)
+        raise
+    os.replace(part, target)
+    logging.debug(f"Downloaded {target.name}: {written} bytes")
+    return written
@@ -0,0 +1,231 @@
+"""
+Lightweight APK manifest reader
+
+Reads package, versionCode, versionName and minSdk straight from an APK:
+the file is mmapped, AndroidManifest.xml is located through the zip central
+directory and only the <manifest> and <uses-sdk> elements of the binary XML
+are decoded. No androguard/fdroidserver import is needed for the common case.
+
+Anything unusual (zip64, duplicate manifest entries, resource references,
+versionCodeMajor, unexpected chunk layout) raises ApkHeaderError, and
+get_apk_id() then falls back to fdroidserver.common.get_apk_id.
+tests/test_apk_header.py checks both agree on generated APKs.
+"""
+
+import mmap
+import struct
+import zlib
+import logging
+
+EOCD_SIG = b"PK\x05\x06"
+CDIR_SIG = b"PK\x01\x02"
+LOCAL_SIG = b"PK\x03\x04"
+MANIFEST = b"AndroidManifest.xml"
+
+# Binary XML chunk types
+RES_XML_TYPE = 0x0003
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_XML_START_ELEMENT_TYPE = 0x0102
+
+# Typed value kinds
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+
+# android:* attribute resource ids (names may be stripped by obfuscators)
+ATTR_IDS = {
+    0x0101021b: "versionCode",
+    0x0101021c: "versionName",
+    0x0101020c: "minSdkVersion",
+    0x01010576: "versionCodeMajor",
+}
+
+
+class ApkHeaderError(Exception):
+    pass
+
+
+def end_of_central_directory(buf):
+    """Return (entry_count, cd_size, cd_offset) from the EOCD record in buf"""
+    eocd = buf.rfind(EOCD_SIG, max(0, len(buf) - 65557))
+    if eocd < 0:
+        raise ApkHeaderError("no end of central directory")
+    entries, cd_size, cd_offset = struct.unpack_from("<HII", buf, eocd + 10)
+    if cd_offset == 0xFFFFFFFF or entries == 0xFFFF:
+        raise ApkHeaderError("zip64 archive")
+    return entries, cd_size, cd_offset
+
+
+def central_directory(buf, pos, entries):
+    """Yield (name, flags, method, csize, usize, local_offset) for each entry at buf[pos:]"""
+    for _ in range(entries):
+        if buf[pos:pos + 4] != CDIR_SIG:
+            raise ApkHeaderError("corrupt central directory")
+        (flags, method, csize, usize, name_len, extra_len, comment_len,
+         local_offset) = struct.unpack_from("<4xHH8xIIHHH8xI", buf, pos + 4)
+        yield bytes(buf[pos + 46:pos + 46 + name_len]), flags, method, csize, usize, local_offset
+        pos += 46 + name_len + extra_len + comment_len
+
+
+def _find_manifest(buf):
+    """Return the uncompressed AndroidManifest.xml bytes using the central directory"""
+    entries, _, cd_offset = end_of_central_directory(buf)
+    found = None
+    for name, *info in central_directory(buf, cd_offset, entries):
+        if name == MANIFEST:
+            if found:
+                raise ApkHeaderError("duplicate AndroidManifest.xml")
+            found = info
+    if not found:
+        raise ApkHeaderError("no AndroidManifest.xml")
+
+    flags, method, csize, usize, offset = found
+    if flags & 0x1:
+        raise ApkHeaderError("encrypted entry")
+    if buf[offset:offset + 4] != LOCAL_SIG:
+        raise ApkHeaderError("bad local header")
+    name_len, extra_len = struct.unpack_from("<HH", buf, offset + 26)
+    if buf[offset + 30:offset + 30 + name_len] != MANIFEST:
+        raise ApkHeaderError("local/central name mismatch")
+    start = offset + 30 + name_len + extra_len
+    data = buf[start:start + csize]
+    if method == 0:
+        out = bytes(data)
+    elif method == 8:
+        out = zlib.decompressobj(-15).decompress(data)
+    else:
+        raise ApkHeaderError(f"compression method {method}")
+    if len(out) != usize:
+        raise ApkHeaderError("size mismatch")
+    return out
+
+
+def _string_pool(xml, pos):
+    """Decode a ResStringPool chunk into a list of str"""
+    header_size, size = struct.unpack_from("<HI", xml, pos + 2)
+    count, _styles, flags, strings_start, _ = struct.unpack_from("<IIIII", xml, pos + 8)
+    utf8 = bool(flags & 0x100)
+    offsets = struct.unpack_from(f"<{count}I", xml, pos + header_size)
+    base = pos + strings_start
+    strings = []
+    for off in offsets:
+        p = base + off
+        if utf8:
+            # utf16 length then utf8 byte length, each 1 or 2 bytes
+            p += 2 if xml[p] & 0x80 else 1
+            n = xml[p]
+            if n & 0x80:
+                n = ((n & 0x7F) << 8) | xml[p + 1]
+                p += 2
+            else:
+                p += 1
+            strings.append(xml[p:p + n].decode("utf-8", "replace"))
+        else:
+            n = struct.unpack_from("<H", xml, p)[0]
+            p += 2
+            if n & 0x8000:
+                n = ((n & 0x7FFF) << 16) | struct.unpack_from("<H", xml, p)[0]
+                p += 2
+            strings.append(xml[p:p + n * 2].decode("utf-16-le", "replace"))
+    return strings
+
+
+def parse_manifest(xml: bytes) -> dict:
+    """Extract package/versionCode/versionName/minSdk from binary AndroidManifest.xml"""
+    if len(xml) < 8 or struct.unpack_from("<H", xml, 0)[0] != RES_XML_TYPE:
+        raise ApkHeaderError("not binary XML")
+    strings, res_ids = [], []
+    result = {}
+    pos = struct.unpack_from("<H", xml, 2)[0]
+    end = min(len(xml), struct.unpack_from("<I", xml, 4)[0])
+    while pos + 8 <= end:
+        ctype, header_size, size = struct.unpack_from("<HHI", xml, pos)
+        if size < 8 or pos + size > end:
+            raise ApkHeaderError("bad chunk size")
+        if ctype == RES_STRING_POOL_TYPE:
+            strings = _string_pool(xml, pos)
+        elif ctype == RES_XML_RESOURCE_MAP_TYPE:
+            n = (size - header_size) // 4
+            res_ids = struct.unpack_from(f"<{n}I", xml, pos + header_size)
+        elif ctype == RES_XML_START_ELEMENT_TYPE:
+            ext = pos + header_size
+            _ns, name_idx, attr_start, attr_size, attr_count = struct.unpack_from("<IIHHH", xml, ext)
+            tag = strings[name_idx] if name_idx < len(strings) else None
+            if not result and tag != "manifest":
+                raise ApkHeaderError("<manifest> is not the first element")
+            attrs = {}
+            for i in range(attr_count):
+                a = ext + attr_start + i * attr_size
+                _ans, aname, raw, _vsize, _res0, vtype, data = struct.unpack_from("<IIIHBBI", xml, a)
+                key = ATTR_IDS.get(res_ids[aname]) if aname < len(res_ids) else None
+                key = key or (strings[aname] if aname < len(strings) else None)
+                if vtype == TYPE_STRING or raw != 0xFFFFFFFF:
+                    value = strings[raw] if raw < len(strings) else None
+                elif vtype in (TYPE_INT_DEC, TYPE_INT_HEX):
+                    value = data - (1 << 32) if data & 0x80000000 else data
+                elif vtype == TYPE_REFERENCE:
+                    value = "@%08x" % data
+                else:
+                    value = None
+                attrs[key] = value
+            if tag == "manifest":
+                if "versionCodeMajor" in attrs:
+                    # the long version code is left to fdroidserver
+                    raise ApkHeaderError("versionCodeMajor")
+                result["package"] = attrs.get("package")
+                result["versionCode"] = attrs.get("versionCode")
+                result["versionName"] = attrs.get("versionName")
+            elif tag == "uses-sdk":
+                result["minSdk"] = attrs.get("minSdkVersion")
+                break
+            elif tag == "application":
+                break
+        pos += size
+
+    if not result.get("package"):
+        raise ApkHeaderError("no package attribute")
+    code = result.get("versionCode")
+    if isinstance(code, str):
+        code = int(code, 16) if code.lower().startswith("0x") else int(code)
+    if not isinstance(code, int):
+        raise ApkHeaderError("no versionCode")
+    name = result.get("versionName")
+    if not isinstance(name, str) or not name or name.startswith("@"):
+        raise ApkHeaderError("versionName needs resource resolution")
+    result["versionCode"] = code
+    result["versionName"] = name.strip("\0")
+    min_sdk = result.get("minSdk")
+    result["minSdk"] = int(min_sdk) if isinstance(min_sdk, (int, str)) and str(min_sdk).isdigit() else None
+    return result
+
+
+def read_manifest(apk_path) -> dict:
+    """Fast path only; raises ApkHeaderError for anything it does not handle"""
+    with open(apk_path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ApkHeaderError("empty file")
+        try:
+            xml = _find_manifest(buf)
+        except (struct.error, IndexError, zlib.error) as e:
+            raise ApkHeaderError(f"zip: {e}")
+        finally:
+            buf.close()
+    try:
+        return parse_manifest(xml)
+    except (struct.error, IndexError, ValueError, UnicodeDecodeError) as e:
+        raise ApkHeaderError(f"axml: {e}")
+
+
+def get_apk_id(apk_path):
+    """Drop-in for fdroidserver.common.get_apk_id: (appid, versionCode, versionName)"""
+    try:
+        m = read_manifest(apk_path)
+        return m["package"], m["versionCode"], m["versionName"]
+    except ApkHeaderError as e:
+        logging.debug(f"{apk_path}: fast manifest read failed ({e}), using fdroidserver")
+    from fdroidserver import common
+    return common.get_apk_id(str(apk_path))
@@ -0,0 +1,200 @@
+"""
+Persistent APK metadata index for Fury's F-Droid Repository
+
+Caches what prune(), the ABI cleanup and the status pages need to know about
+each APK (packageName, versionCode, versionName, minSdk, ABIs, signer) so an
+APK is parsed once instead of on every run. The manifest is read with the
+lightweight apk_header reader; the signer is only computed (with fdroidserver)
+when someone asks for it.
+
+Downloads also record selectedAbi, the ABI kind abi_select picked the asset
+for (arm64-v8a, universal, armeabi-v7a, or None for a generic build), next to
+abis, the native libraries actually inside it.
+
+Entries are keyed by path and reused while size and mtime are unchanged; with
+FDROID_APK_INDEX_SHA256=1 a changed mtime falls back to comparing the sha256,
+which keeps the index useful when APKs are re-downloaded into a fresh
+checkout (as in CI).
+
+Tuning (environment):
+  FDROID_APK_INDEX         index file (default .cache/apk-index.json in the repo root)
+  FDROID_APK_INDEX_SHA256  also record and match on sha256 (default 0)
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import zipfile
+import threading
+from pathlib import Path
+
+import apk_header
+import metrics
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_PATH = Path(os.environ.get("FDROID_APK_INDEX", ROOT / ".cache" / "apk-index.json"))
+HASH_FILES = os.environ.get("FDROID_APK_INDEX_SHA256", "0") == "1"
+
+INDEX_VERSION = 2
+
+
+def sha256sum(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def native_abis(apk: Path):
+    """ABIs with native code in the APK (lib/<abi>/...), empty for pure-Java APKs"""
+    with zipfile.ZipFile(apk) as z:
+        return sorted({n.split("/")[1] for n in z.namelist()
+                       if n.startswith("lib/") and n.count("/") >= 2 and n.split("/")[1]})
+
+
+def read_apk(apk: Path) -> dict:
+    """Parse an APK; failures are recorded (versionCode -1) so they are not retried"""
+    try:
+        try:
+            m = apk_header.read_manifest(apk)
+            appid, version_code, version_name = m["package"], m["versionCode"], m["versionName"]
+            min_sdk = m["minSdk"]
+        except apk_header.ApkHeaderError:
+            from fdroidserver import common
+            appid, version_code, version_name = common.get_apk_id(str(apk))
+            min_sdk = None
+        return {"packageName": appid, "versionCode": int(version_code),
+                "versionName": version_name, "minSdk": min_sdk, "abis": native_abis(apk)}
+    except Exception as e:
+        logging.warning(f"Failed to parse {apk.name}: {e}")
+        return {"packageName": None, "versionCode": -1, "versionName": None,
+                "minSdk": None, "abis": [], "signer": None, "error": str(e)}
+
+
+class ApkIndex:
+    """Thread-safe {path: metadata} map persisted as compact JSON"""
+
+    def __init__(self, path=DEFAULT_PATH, hash_files=HASH_FILES):
+        self.path = Path(path)
+        self.hash_files = hash_files
+        self.entries = {}
+        self.stats = {"hits": 0, "parsed": 0}
+        self._dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.entries = data.get("apks", {})
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _key(apk: Path) -> str:
+        apk = Path(apk).resolve()
+        try:
+            return str(apk.relative_to(ROOT))
+        except ValueError:
+            return str(apk)
+
+    def get(self, apk: Path) -> dict:
+        """Metadata for apk, parsing it only if it changed since it was indexed"""
+        apk = Path(apk)
+        key = self._key(apk)
+        st = apk.stat()
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            self._count("hits")
+            return entry
+
+        sha = sha256sum(apk) if self.hash_files else None
+        if entry and sha and entry.get("sha256") == sha:
+            entry = dict(entry, mtime_ns=st.st_mtime_ns)
+            self._count("hits")
+        else:
+            start = time.perf_counter()
+            entry = dict(read_apk(apk), size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=sha)
+            metrics.count("apk_parse_seconds", time.perf_counter() - start)
+            self._count("parsed")
+
+        with self._lock:
+            self.entries[key] = entry
+            self._dirty = True
+        return entry
+
+    def sha256(self, apk: Path) -> str:
+        """sha256 of apk, from the index when it was already hashed"""
+        entry = self.get(apk)
+        if not entry.get("sha256"):
+            digest = sha256sum(apk)
+            with self._lock:
+                entry["sha256"] = digest
+                self._dirty = True
+        return entry["sha256"]
+
+    def signer(self, apk: Path):
+        """SHA-256 signer fingerprint of apk, computed on first request"""
+        entry = self.get(apk)
+        if "signer" not in entry:
+            from fdroidserver import common
+            try:
+                fingerprint = common.apk_signer_fingerprint(str(apk))
+            except Exception:
+                fingerprint = None
+            with self._lock:
+                entry["signer"] = fingerprint
+                self._dirty = True
+        return entry["signer"]
+
+    def annotate(self, apk: Path, **fields):
+        """Record fields (e.g. selectedAbi) on apk's entry; kept while the file is unchanged"""
+        entry = self.get(apk)
+        if any(entry.get(k, object()) != v for k, v in fields.items()):
+            with self._lock:
+                entry.update(fields)
+                self._dirty = True
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def forget(self, apk: Path):
+        with self._lock:
+            if self.entries.pop(self._key(apk), None) is not None:
+                self._dirty = True
+
+    def packages(self) -> dict:
+        """{packageName: [entry, ...]} for every indexed APK that still exists"""
+        result = {}
+        with self._lock:
+            items = list(self.entries.items())
+        for key, entry in items:
+            if entry.get("packageName") and (ROOT / key).exists():
+                result.setdefault(entry["packageName"], []).append(dict(entry, path=key))
+        return result
+
+    def latest(self, package: str):
+        """Highest-versionCode entry for package, or None"""
+        entries = self.packages().get(package) or []
+        return max(entries, key=lambda e: e["versionCode"], default=None)
+
+    def save(self):
+        """Write the index atomically, dropping entries whose file is gone"""
+        with self._lock:
+            stale = [k for k in self.entries if not (ROOT / k).exists()]
+            for k in stale:
+                del self.entries[k]
+            if not (self._dirty or stale):
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "apks": self.entries}, f,
+                          separators=(",", ":"), sort_keys=True)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        logging.info(f"APK index: {self.stats['hits']} reused, {self.stats['parsed']} parsed")
@@ -0,0 +1,539 @@
+"""
+Compiled app catalog for Fury's F-Droid Repository
+
+apps.yaml is parsed once (with the libyaml CSafeLoader when PyYAML was built
+with it), validated, and compiled into compact App records with __slots__.
+The compiled catalog is pickled to .cache/catalog.pickle together with the
+sha256 of the apps.yaml it came from, so later loads of an unchanged file are
+a hash plus one unpickle instead of a YAML parse.
+
+The catalog can also be kept as a directory, apps.d/, with one <id>.yml per
+app (the same mapping as an apps.yaml entry) and _catalog.yml holding
+schemaVersion and meta. apps.d/index.json is generated from it and records,
+per file, the app id, repo URL, owner/repo, file sha256 and entry digest,
+plus the file's size and mtime. Loading the directory only stats the files:
+a file whose size and mtime match the index is neither read nor hashed, one
+whose stat changed is hashed and only parsed when its hash differs too, and
+the index is rewritten when anything changed. Apps
+are compiled on first access, so a tool that needs a handful of apps, or only
+ids and repos, never parses the rest. When apps.d/ exists it is used instead
+of apps.yaml; an explicit path to either is always accepted.
+
+repo_from_url() is the one place that turns a GitHub URL into "owner/repo".
+
+Usage:
+  catalog.py split [apps.yaml] [apps.d]   write one file per app from apps.yaml
+  catalog.py index [apps.d] [--check]     regenerate index.json (--check: fail if stale)
+
+Tuning (environment):
+  FDROID_CATALOG_CACHE  compiled catalog file (default .cache/catalog.pickle, "0" disables)
+  FDROID_CATALOG_DIR    per-app catalog directory (default apps.d in the repo root)
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import logging
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML without libyaml
+    from yaml import SafeLoader
+
+ROOT = Path(__file__).resolve().parents[1]
+APPS_FILE = ROOT / "apps.yaml"
+CATALOG_DIR = Path(os.environ.get("FDROID_CATALOG_DIR", ROOT / "apps.d"))
+INDEX_NAME = "index.json"
+META_NAME = "_catalog.yml"
+CACHE_FILE = os.environ.get("FDROID_CATALOG_CACHE", str(ROOT / ".cache" / "catalog.pickle"))
+
+# Bump when App/Catalog change shape so stale pickles are recompiled
+CATALOG_VERSION = 3
+INDEX_VERSION = 1
+
+# Builds an app keeps in total, by its channel (stable or prerelease: true),
+# unless fdroid.retention.keep says otherwise;
+# retention.py and the download walk both use these
+KEEP_STABLE = 2
+KEEP_PRERELEASE = 2
+# Builds kept in the archive repo for apps with fdroid.archive: true
+ARCHIVE_KEEP = int(os.environ.get("FDROID_ARCHIVE_KEEP", "5"))
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+class CatalogError(Exception):
+    pass
+
+
+def repo_from_url(repo_url: str):
+    """Return "owner/repo" for a github.com URL, or None"""
+    if not repo_url or not isinstance(repo_url, str):
+        return None
+    if "://" not in repo_url:
+        repo_url = "https://" + repo_url
+    parts = urlsplit(repo_url.strip())
+    if (parts.hostname or "").lower() not in ("github.com", "www.github.com"):
+        return None
+    segments = [s for s in parts.path.split("/") if s]
+    if len(segments) < 2:
+        return None
+    owner, name = segments[0], segments[1]
+    if name.endswith(".git"):
+        name = name[:-4]
+    return f"{owner}/{name}" if name else None
+
+
+def parse_size(value):
+    """Bytes from 123, "500M", "1.5G" or "2GB"; None for empty or 0 (no limit)"""
+    if value in (None, "", 0, "0"):
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value) if value > 0 else None
+    text = str(value).strip().upper().removesuffix("B").removesuffix("I")
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+    try:
+        number = float(text[:-1] if unit else text)
+    except ValueError:
+        raise ValueError(f"not a size: {value!r}")
+    return int(number * SIZE_UNITS[unit]) if number > 0 else None
+
+
+def _positive(value, what: str):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f"fdroid.retention.{what} must be a non-negative number")
+    return value
+
+
+def entry_digest(entry: dict) -> str:
+    return hashlib.sha256(json.dumps(entry, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class App:
+    """One validated apps.yaml entry"""
+
+    __slots__ = ("id", "name", "author", "url", "repo", "prerelease", "archive", "keep",
+                 "max_age_days", "max_bytes", "archive_keep", "categories", "icon", "digest")
+
+    def __init__(self, entry: dict):
+        self.id = entry["id"]
+        self.name = entry.get("name")
+        self.author = entry.get("author", "")
+        self.url = entry.get("url")
+        self.repo = repo_from_url(self.url)
+        fdroid = entry.get("fdroid") or {}
+        self.prerelease = bool(fdroid.get("prefer_prerelease", False))
+        self.archive = bool(fdroid.get("archive", False))
+        # fdroid.retention: {keep, max_age_days, max_bytes, archive_keep}; see retention.py
+        retention = fdroid.get("retention") or {}
+        if not isinstance(retention, dict):
+            raise ValueError("fdroid.retention must be a mapping")
+        keep = _positive(retention.get("keep"), "keep")
+        self.keep = max(1, int(keep)) if keep is not None else (
+            KEEP_PRERELEASE if self.prerelease else KEEP_STABLE)
+        self.max_age_days = _positive(retention.get("max_age_days"), "max_age_days") or None
+        self.max_bytes = parse_size(retention.get("max_bytes"))
+        archive_keep = _positive(retention.get("archive_keep"), "archive_keep")
+        self.archive_keep = int(archive_keep) if archive_keep is not None else ARCHIVE_KEEP
+        self.categories = tuple(fdroid.get("categories") or ())
+        icon = (entry.get("assets") or {}).get("icon") or {}
+        self.icon = icon.get("url") if isinstance(icon, dict) else None
+        # Fingerprint of everything in the entry, for change detection
+        self.digest = entry_digest(entry)
+
+    @property
+    def owner(self):
+        return self.repo.split("/", 1)[0] if self.repo else None
+
+    @property
+    def channel(self) -> str:
+        return "prerelease" if self.prerelease else "stable"
+
+    def __getstate__(self):
+        return tuple(getattr(self, s) for s in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return f"App({self.id!r}, repo={self.repo!r})"
+
+
+class Catalog:
+    """Validated apps in file order, with lookup by id"""
+
+    __slots__ = ("meta", "apps", "by_id", "invalid", "sha256")
+
+    def __init__(self, meta: dict, apps, invalid, sha256: str):
+        self.meta = meta
+        self.apps = tuple(apps)
+        self.by_id = {a.id: a for a in self.apps}
+        self.invalid = tuple(invalid)
+        self.sha256 = sha256
+
+    def __iter__(self):
+        return iter(self.apps)
+
+    def __len__(self):
+        return len(self.apps)
+
+    def get(self, app_id: str):
+        return self.by_id.get(app_id)
+
+    def ids(self) -> list:
+        return [a.id for a in self.apps]
+
+    def repos(self) -> dict:
+        """{app id: "owner/repo"}, None for entries without a GitHub URL"""
+        return {a.id: a.repo for a in self.apps}
+
+    def digests(self) -> dict:
+        """{app id: entry digest}"""
+        return {a.id: a.digest for a in self.apps}
+
+    def subset(self, ids):
+        """The same catalog restricted to ids (unknown ids are ignored)"""
+        return Catalog(self.meta, [self.by_id[i] for i in ids if i in self.by_id], (), self.sha256)
+
+    def __getstate__(self):
+        return (self.meta, self.apps, self.invalid, self.sha256)
+
+    def __setstate__(self, state):
+        meta, apps, invalid, sha256 = state
+        self.__init__(meta, apps, invalid, sha256)
+
+
+def compile_catalog(raw: bytes, sha256: str) -> Catalog:
+    """Parse and validate apps.yaml content; bad entries are skipped and listed in .invalid"""
+    try:
+        data = yaml.load(raw, Loader=SafeLoader)
+    except yaml.YAMLError as e:
+        raise CatalogError(f"apps.yaml is not valid YAML: {e}")
+    if not isinstance(data, dict) or not isinstance(data.get("apps"), list):
+        raise CatalogError("apps.yaml format invalid. Expected a dict with 'apps' key.")
+
+    apps, invalid, seen = [], [], set()
+    for i, entry in enumerate(data["apps"]):
+        where = f"apps.yaml entry {i}"
+        if not isinstance(entry, dict) or not entry.get("id"):
+            invalid.append((where, "missing id"))
+            continue
+        if entry["id"] in seen:
+            invalid.append((where, f"duplicate id {entry['id']}"))
+            continue
+        try:
+            app = App(entry)
+        except ValueError as e:
+            invalid.append((where, f"{entry['id']}: {e}"))
+            continue
+        if not app.repo:
+            invalid.append((where, f"{app.id}: not a GitHub repository URL: {app.url}"))
+        seen.add(app.id)
+        apps.append(app)
+    return Catalog(data.get("meta") or {}, apps, invalid, sha256)
+
+
+def _parse_shard(raw: bytes, name: str):
+    """(App, None) for a per-app file, or (None, reason)"""
+    try:
+        entry = yaml.load(raw, Loader=SafeLoader)
+    except yaml.YAMLError as e:
+        return None, f"not valid YAML: {e}"
+    if not isinstance(entry, dict) or not entry.get("id"):
+        return None, "missing id"
+    try:
+        return App(entry), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def _index_record(name: str, sha256: str, app: App) -> dict:
+    return {"file": name, "sha256": sha256, "digest": app.digest, "url": app.url, "repo": app.repo}
+
+
+# A file changed again within this many seconds of being indexed could keep its
+# size and mtime (coarse timestamps), so its stat is not recorded until later
+RACY_NS = 2 * 10**9
+STAT_FIELDS = ("size", "mtime_ns")
+
+
+def _stat_fields(st, now_ns: int) -> dict:
+    if now_ns - st.st_mtime_ns < RACY_NS:
+        return {"size": None, "mtime_ns": None}
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def content(index: dict) -> dict:
+    """index without the stat fields, which differ between checkouts"""
+    apps = {app_id: {k: v for k, v in r.items() if k not in STAT_FIELDS}
+            for app_id, r in index.get("apps", {}).items()}
+    return dict(index, apps=apps)
+
+
+class ShardedCatalog:
+    """Catalog backed by a directory of per-app files; apps are compiled on first access"""
+
+    __slots__ = ("directory", "meta", "index", "invalid", "_apps")
+
+    def __init__(self, directory: Path, meta: dict, index: dict, invalid, apps=None):
+        self.directory = directory
+        self.meta = meta
+        self.index = index
+        self.invalid = tuple(invalid)
+        self._apps = apps if apps is not None else {}
+
+    @classmethod
+    def open(cls, directory: Path):
+        index, invalid, parsed = refresh_index(directory)
+        return cls(directory, index["meta"], index["apps"], invalid, parsed)
+
+    def __iter__(self):
+        return iter(self.apps)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def apps(self) -> tuple:
+        return tuple(self.get(app_id) for app_id in self.index)
+
+    def get(self, app_id: str):
+        app = self._apps.get(app_id)
+        if app is None and app_id in self.index:
+            path = self.directory / self.index[app_id]["file"]
+            try:
+                app, reason = _parse_shard(path.read_bytes(), path.name)
+            except OSError as e:
+                raise CatalogError(f"{path.name} missing: {e}")
+            if app is None or app.id != app_id:
+                raise CatalogError(f"{path.name} changed while loading, regenerate {INDEX_NAME}")
+            self._apps[app_id] = app
+        return app
+
+    def ids(self) -> list:
+        return list(self.index)
+
+    def repos(self) -> dict:
+        """{app id: "owner/repo"}, None for entries without a GitHub URL"""
+        return {app_id: record["repo"] for app_id, record in self.index.items()}
+
+    def digests(self) -> dict:
+        """{app id: entry digest}"""
+        return {app_id: record["digest"] for app_id, record in self.index.items()}
+
+    def subset(self, ids):
+        """The same catalog restricted to ids (unknown ids are ignored)"""
+        index = {i: self.index[i] for i in ids if i in self.index}
+        return ShardedCatalog(self.directory, self.meta, index, (), self._apps)
+
+
+def read_index(directory: Path) -> dict:
+    try:
+        index = json.loads((directory / INDEX_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+    return index if isinstance(index, dict) and index.get("version") == INDEX_VERSION else {}
+
+
+def refresh_index(directory: Path, write=True, trust_stat=True):
+    """Bring directory/index.json up to date, parsing only files whose sha256 changed
+
+    Files whose size and mtime match their record are taken as unchanged
+    without being read (trust_stat=False hashes every file).
+    Returns (index, invalid, {app id: App} for the files that were parsed).
+    """
+    previous = read_index(directory)
+    known = {r["file"]: (app_id, r) for app_id, r in previous.get("apps", {}).items()}
+
+    meta_path = directory / META_NAME
+    try:
+        meta_raw = meta_path.read_bytes()
+    except FileNotFoundError:
+        meta_raw = b""
+    meta_sha = hashlib.sha256(meta_raw).hexdigest()
+    if meta_sha == previous.get("meta_sha256"):
+        meta = previous.get("meta") or {}
+    else:
+        try:
+            data = yaml.load(meta_raw, Loader=SafeLoader) or {}
+        except yaml.YAMLError as e:
+            raise CatalogError(f"{META_NAME} is not valid YAML: {e}")
+        meta = (data.get("meta") or {}) if isinstance(data, dict) else {}
+        # as it will read back from index.json (dates become strings)
+        meta = json.loads(json.dumps(meta, default=str))
+
+    apps, invalid, parsed = {}, [], {}
+    now_ns = time.time_ns()
+    entries = sorted((e for e in os.scandir(directory)
+                      if e.name.endswith(".yml") and e.name != META_NAME and e.is_file()),
+                     key=lambda e: e.name)
+    for entry in entries:
+        path = Path(entry.path)
+        st = entry.stat()
+        app_id, record = known.get(path.name, (None, None))
+        if not (trust_stat and record is not None and record.get("mtime_ns") is not None
+                and record.get("size") == st.st_size and record["mtime_ns"] == st.st_mtime_ns):
+            raw = path.read_bytes()
+            sha256 = hashlib.sha256(raw).hexdigest()
+            if record is None or record.get("sha256") != sha256:
+                app, reason = _parse_shard(raw, path.name)
+                if app is None:
+                    invalid.append((f"{directory.name}/{path.name}", reason))
+                    continue
+                app_id, record = app.id, _index_record(path.name, sha256, app)
+                parsed[app_id] = app
+            record = dict(record, **_stat_fields(st, now_ns))
+        where = f"{directory.name}/{path.name}"
+        if app_id in apps:
+            invalid.append((where, f"duplicate id {app_id}"))
+            continue
+        if not record["repo"]:
+            invalid.append((where, f"{app_id}: not a GitHub repository URL: {record['url']}"))
+        apps[app_id] = record
+
+    index = {"version": INDEX_VERSION, "meta_sha256": meta_sha, "meta": meta, "apps": apps}
+    if write and index != previous:
+        try:
+            _write_json(directory / INDEX_NAME, index)
+        except OSError as e:
+            logging.debug(f"Could not write {INDEX_NAME}: {e}")
+    return index, invalid, parsed
+
+
+def split(apps_file: Path, directory: Path) -> int:
+    """Write one <id>.yml per valid apps.yaml entry, plus _catalog.yml and index.json"""
+    try:
+        data = yaml.load(apps_file.read_bytes(), Loader=SafeLoader)
+    except (OSError, yaml.YAMLError) as e:
+        raise CatalogError(f"Cannot read {apps_file}: {e}")
+    if not isinstance(data, dict) or not isinstance(data.get("apps"), list):
+        raise CatalogError(f"{apps_file.name} format invalid. Expected a dict with 'apps' key.")
+    directory.mkdir(parents=True, exist_ok=True)
+    header = {k: v for k, v in data.items() if k != "apps"}
+    (directory / META_NAME).write_text(
+        yaml.safe_dump(header, sort_keys=False, allow_unicode=True, default_flow_style=False))
+    written = set()
+    for entry in data.get("apps") or []:
+        if not isinstance(entry, dict) or not entry.get("id") or entry["id"] in written:
+            continue
+        write_shard(directory, entry)
+        written.add(entry["id"])
+    refresh_index(directory)
+    return len(written)
+
+
+def write_shard(directory: Path, entry: dict) -> Path:
+    """Write one app entry to directory/<id>.yml"""
+    path = directory / f"{entry['id']}.yml"
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(yaml.safe_dump(entry, sort_keys=False, allow_unicode=True,
+                                  default_flow_style=False, indent=2))
+    os.replace(tmp, path)
+    return path
+
+
+def _write_json(path: Path, data: dict):
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(data, indent=1) + "\n")
+    os.replace(tmp, path)
+
+
+def default_source() -> Path:
+    """apps.d/ when it exists, apps.yaml otherwise"""
+    return CATALOG_DIR if CATALOG_DIR.is_dir() else APPS_FILE
+
+
+def load(path=None, cache_file=CACHE_FILE):
+    """Catalog for path (apps.yaml or a catalog directory, default_source() if None)"""
+    path = Path(path) if path is not None else default_source()
+    if path.is_dir():
+        catalog = ShardedCatalog.open(path)
+    else:
+        catalog = _load_file(path, cache_file)
+    for where, reason in catalog.invalid:
+        logging.warning(f"{where}: {reason}")
+    return catalog
+
+
+def _load_file(path: Path, cache_file) -> Catalog:
+    """Compiled catalog for an apps.yaml, from the pickle cache when the file is unchanged"""
+    try:
+        raw = path.read_bytes()
+    except OSError as e:
+        raise CatalogError(f"{path.name} missing: {e}")
+    sha256 = hashlib.sha256(raw).hexdigest()
+
+    cache = Path(cache_file) if cache_file and cache_file != "0" else None
+    catalog = _read_cache(cache, sha256) if cache is not None else None
+    if catalog is None:
+        catalog = compile_catalog(raw, sha256)
+        if cache is not None:
+            _write_cache(cache, catalog)
+    return catalog
+
+
+def _read_cache(cache: Path, sha256: str):
+    try:
+        with open(cache, "rb") as f:
+            version, cached_sha, catalog = pickle.load(f)
+    except Exception:
+        return None
+    if version == CATALOG_VERSION and cached_sha == sha256:
+        return catalog
+    return None
+
+
+def _write_cache(cache: Path, catalog: Catalog):
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((CATALOG_VERSION, catalog.sha256, catalog), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache)
+    except OSError as e:
+        logging.debug(f"Could not write catalog cache: {e}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    args = sys.argv[1:]
+    command = args.pop(0) if args else None
+    try:
+        if command == "split" and len(args) <= 2:
+            apps_file = Path(args[0]) if args else APPS_FILE
+            directory = Path(args[1]) if len(args) > 1 else CATALOG_DIR
+            count = split(apps_file, directory)
+            logging.info(f"Wrote {count} app files to {directory}")
+        elif command == "index" and len([a for a in args if a != "--check"]) <= 1:
+            check = "--check" in args
+            paths = [a for a in args if a != "--check"]
+            directory = Path(paths[0]) if paths else CATALOG_DIR
+            before = read_index(directory)
+            index, invalid, parsed = refresh_index(directory, write=not check, trust_stat=not check)
+            for where, reason in invalid:
+                logging.warning(f"{where}: {reason}")
+            if check and content(index) != content(before):
+                logging.error(f"{directory / INDEX_NAME} is out of date, run catalog.py index")
+                sys.exit(1)
+            logging.info(f"{len(index['apps'])} apps indexed, {len(parsed)} files parsed")
+        else:
+            print(f"Usage: {sys.argv[0]} split [apps.yaml] [dir] | index [dir] [--check]")
+            sys.exit(2)
+    except CatalogError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,52 @@
 #!/usr/bin/env python3
-import requests, yaml, logging
+import sys, logging
 from pathlib import Path
 
+import catalog
+from github_client import GitHubClient
+from repo_query import RepoQuery, tag_matches
+from status_engine import lookup, release_fields
+
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
 ROOT = Path(__file__).resolve().parents[1]
-APPS = ROOT / "apps.yaml"
-
-with open(APPS, "r") as f:
-    apps = yaml.safe_load(f)
-
-for app in apps.get('apps', []):
-    repo_url = app.get('url')
-    app_id = app.get('id')
-    if not repo_url or not app_id:
-        logging.warning(f"Invalid entry: {app}")
-        continue
-
-    # Extract repo from URL
-    if 'github.com/' in repo_url:
-        parts = repo_url.split('github.com/')[1].split('/')
-        if len(parts) >= 2:
-            repo = f"{parts[0]}/{parts[1]}"
-        else:
-            logging.warning(f"Invalid repo URL: {repo_url}")
+
+
+def check(client: GitHubClient, apps: catalog.Catalog, query: RepoQuery = None) -> list:
+    """Compare each app's latest release with what the repo ships; returns the outdated ids"""
+    query = query if query is not None else RepoQuery.load()
+    shipped = query.shipped()
+    # Only the upstream side needs the network; shipped versions come from the local index
+    releases = lookup(client, sorted({app.repo for app in apps if app.repo}))
+    outdated = []
+    for app in apps:
+        app_id = app.id
+        if not app.repo:
+            # already reported by catalog.load()
+            continue
+
+        tag = release_fields(releases.get(app.repo))["latest"]
+        if not tag:
+            logging.warning(f"{app_id}: no latest release or invalid repo")
             continue
-    else:
-        logging.warning(f"Not a GitHub URL: {repo_url}")
-        continue
-
-    url = f"https://api.github.com/repos/{repo}/releases/latest"
-    r = requests.get(url)
-    if r.status_code != 200:
-        logging.warning(f"{app_id}: no latest release or invalid repo")
-        continue
-
-    tag = r.json().get("tag_name")
-    logging.info(f"{app_id}: latest = {tag}")
+
+        package = query.packages.get(app_id)
+        if package and any(tag_matches(tag, b.version_name) for b in package.builds):
+            logging.info(f"{app_id}: latest = {tag} (shipped)")
+        else:
+            logging.info(f"{app_id}: latest = {tag}, shipped {shipped.get(app_id) or 'nothing'}")
+            outdated.append(app_id)
+    logging.info(f"{len(outdated)} apps have a newer upstream release")
+    return outdated
+
+
+if __name__ == "__main__":
+    try:
+        apps = catalog.load()
+    except catalog.CatalogError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+    client = GitHubClient()
+    check(client, apps)
+    client.close()
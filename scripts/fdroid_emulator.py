@@ -1,19 +1,88 @@
 #!/usr/bin/env python3
-import subprocess, logging
+import sys, json, hashlib, subprocess, logging
 from pathlib import Path
 
+import index_v2
+
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
 ROOT = Path(__file__).resolve().parents[1]
 REPO = ROOT / "repo" / "index-v1.json"
+FDROID_REPO = ROOT / "fdroid" / "repo"
+
+
+def lint(index: Path = REPO, cwd=None) -> bool:
+    if not index.exists():
+        logging.error("index-v1.json missing. Run Phase 4 again.")
+        return False
+
+    try:
+        subprocess.run(["fdroid", "lint"], check=True, cwd=cwd)
+        logging.info("Repo lint OK.")
+        return True
+    except:
+        logging.error("FDroid Lint failed.")
+        return False
+
+
+def fetch(repo_dir: Path, file_entry: dict) -> bytes:
+    """Read a file listed in entry.json, checking its size and sha256 like the client does"""
+    data = (repo_dir / file_entry["name"].lstrip("/")).read_bytes()
+    if len(data) != file_entry["size"] or hashlib.sha256(data).hexdigest() != file_entry["sha256"]:
+        raise ValueError(f"{file_entry['name']} does not match entry.json")
+    return data
+
+
+def sync(old: dict, repo_dir: Path = FDROID_REPO):
+    """What a client holding index old ends up with: (index, bytes downloaded)"""
+    entry = json.loads((repo_dir / "entry.json").read_text())
+    if old and old["repo"]["timestamp"] == entry["timestamp"]:
+        return old, 0
+    diff = entry.get("diffs", {}).get(str(old["repo"]["timestamp"])) if old else None
+    if diff:
+        data = fetch(repo_dir, diff)
+        return index_v2.apply_diff(old, json.loads(data)), len(data)
+    data = fetch(repo_dir, entry["index"])
+    return json.loads(data), len(data)
+
+
+def verify_diffs(repo_dir: Path = FDROID_REPO) -> bool:
+    """Check that a client at every diffed timestamp reconstructs the current index-v2"""
+    try:
+        entry = json.loads((repo_dir / "entry.json").read_text())
+        current = json.loads(fetch(repo_dir, entry["index"]))
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"index-v2 unreadable: {e}")
+        return False
+
+    known = {**index_v2.snapshots(index_v2.HISTORY_DIR), **index_v2.snapshots(index_v2.TMP_DIR)}
+    ok = True
+    for ts in entry.get("diffs", {}):
+        path = known.get(int(ts))
+        if path is None:
+            logging.warning(f"index-v2: no copy of the {ts} index to replay its diff on")
+            continue
+        try:
+            result, size = sync(json.loads(path.read_text()), repo_dir)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"index-v2: diff from {ts} unusable: {e}")
+            ok = False
+            continue
+        if result != current:
+            logging.error(f"index-v2: diff from {ts} does not reproduce the current index")
+            ok = False
+        else:
+            logging.info(f"index-v2: client at {ts} syncs with {size} bytes "
+                         f"(full index {entry['index']['size']})")
+    if ok:
+        logging.info(f"index-v2 OK: {len(entry.get('diffs', {}))} diffs")
+    return ok
 
-if not REPO.exists():
-    logging.error("index-v1.json missing. Run Phase 4 again.")
-    raise SystemExit(1)
 
-try:
-    subprocess.run(["fdroid", "lint"], check=True)
-    logging.info("Repo lint OK.")
-except:
-    logging.error("FDroid Lint failed.")
-    raise SystemExit(1)
\ No newline at end of file
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["diffs"]:
+        ok = verify_diffs(Path(sys.argv[2]) if len(sys.argv) > 2 else FDROID_REPO)
+    else:
+        ok = lint()
+    if not ok:
+        raise SystemExit(1)
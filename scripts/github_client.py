@@ -0,0 +1,270 @@
+"""
+Shared GitHub HTTP client for Fury's F-Droid Repository
+
+One keep-alive connection pool for every API call and asset download, with a
+per-host concurrency cap so the worker threads never open more connections to
+a single host than it is configured for. API responses go through the shared
+on-disk ETag cache (http_cache.py) unless the client is created with cache=None.
+API requests are paced by a RateLimiter (rate_limit.py) fed from GitHub's
+X-RateLimit-* headers, and requests rejected by a primary or secondary rate
+limit are retried after the wait GitHub asks for.
+
+Tuning (environment):
+  GITHUB_API_URL      API base URL (default https://api.github.com)
+  FDROID_WORKERS      number of apps processed in parallel (default 8)
+  FDROID_HOST_LIMITS  per-host caps, e.g. "api.github.com=4,github.com=8"
+  FDROID_HOST_LIMIT   cap for hosts not listed above (default 6)
+  FDROID_RELEASES_PER_PAGE  releases fetched per page (default 10)
+  FDROID_MAX_RELEASES       how far back iter_releases() will walk (default 30)
+  FDROID_GRAPHQL_RELEASES   releases per repo in GraphQL batches (default: per page)
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from http_cache import ResponseCache
+from rate_limit import RateLimiter, RETRIES, resource_for
+
+API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+API_HOST = urlsplit(API_URL).hostname
+
+DEFAULT_WORKERS = int(os.environ.get("FDROID_WORKERS", "8"))
+RELEASES_PER_PAGE = int(os.environ.get("FDROID_RELEASES_PER_PAGE", "10"))
+MAX_RELEASES = int(os.environ.get("FDROID_MAX_RELEASES", "30"))
+# releases per repo in github_graphql's batches; read here so iter_releases()
+# knows the size of either kind of first page
+GRAPHQL_RELEASES = int(os.environ.get("FDROID_GRAPHQL_RELEASES", str(RELEASES_PER_PAGE)))
+DEFAULT_HOST_LIMIT = int(os.environ.get("FDROID_HOST_LIMIT", "6"))
+
+
+def _release_key(release) -> tuple:
+    """Identity of a release across REST pages and GraphQL batches"""
+    if not isinstance(release, dict):
+        return ("object", id(release))
+    if release.get("id") is not None:
+        return ("id", release["id"])
+    return ("tag", release.get("tag_name"))
+
+
+def parse_host_limits(spec: str) -> dict:
+    """Parse "host=n,host=n" into a dict, ignoring malformed pairs"""
+    limits = {}
+    for pair in (spec or "").split(","):
+        host, _, n = pair.strip().partition("=")
+        if host and n.strip().isdigit():
+            limits[host.strip()] = max(1, int(n))
+    return limits
+
+
+def next_link(link_header: str):
+    """Return the rel="next" URL from a Link header, or None"""
+    for part in (link_header or "").split(","):
+        url, _, params = part.partition(";")
+        if 'rel="next"' in params:
+            return url.strip().strip("<>")
+    return None
+
+
+class GitHubClient:
+    """Thread-safe wrapper around a pooled requests.Session"""
+
+    def __init__(self, token=None, workers=DEFAULT_WORKERS, host_limits=None,
+                 default_limit=DEFAULT_HOST_LIMIT, timeout=30, cache="default", limiter=None):
+        if token is None:
+            token = os.environ.get("GH_TOKEN", "")
+        if host_limits is None:
+            host_limits = parse_host_limits(os.environ.get("FDROID_HOST_LIMITS", ""))
+        if cache == "default":
+            cache = ResponseCache()
+
+        self.token = token
+        self.cache = cache
+        self.timeout = timeout
+        self.host_limits = host_limits
+        self.default_limit = default_limit
+        self.limiter = limiter if limiter is not None else RateLimiter()
+
+        # Size the pool so every permitted connection can be kept alive
+        pool_size = max([workers, default_limit] + list(host_limits.values()))
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            sem = self._slots.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.host_limits.get(host, self.default_limit))
+                self._slots[host] = sem
+            return sem
+
+    def _headers(self, url: str, headers=None) -> dict:
+        merged = {}
+        if urlsplit(url).hostname == API_HOST:
+            merged["Accept"] = "application/vnd.github+json"
+            if self.token:
+                merged["Authorization"] = f"token {self.token}"
+        merged.update(headers or {})
+        return merged
+
+    def request(self, method: str, url: str, headers=None, **kwargs) -> requests.Response:
+        """Send holding a slot for the target host; API calls are rate limited and retried"""
+        kwargs.setdefault("timeout", self.timeout)
+        parts = urlsplit(url)
+        api = parts.hostname == API_HOST
+        attempt = 0
+        while True:
+            if api:
+                self.limiter.acquire(resource_for(parts.path))
+            with self._slot(url):
+                start = time.perf_counter()
+                r = self.session.request(method, url, headers=self._headers(url, headers), **kwargs)
+                metrics.http(method, url, r.status_code, time.perf_counter() - start,
+                             len(r.content))
+            if not api:
+                return r
+            self.limiter.update(r.headers)
+            wait = self.limiter.backoff(r, attempt)
+            if wait is None or attempt >= RETRIES or wait > self.limiter.max_wait:
+                return r
+            attempt += 1
+            logging.warning(f"Rate limited (HTTP {r.status_code}) on {parts.path}, "
+                            f"retrying in {wait:.0f}s ({attempt}/{RETRIES})")
+            self.limiter.pause(wait)
+
+    def get(self, url: str, headers=None, **kwargs) -> requests.Response:
+        """GET holding a slot for the target host; the body is read before returning"""
+        return self.request("GET", url, headers, **kwargs)
+
+    def get_json(self, url: str, headers=None):
+        """GET a JSON document; returns (status_code, payload or None)
+
+        Cached documents are revalidated with If-None-Match/If-Modified-Since
+        and served from disk when GitHub answers 304 Not Modified.
+        """
+        status, payload, _ = self.get_page(url, headers)
+        return status, payload
+
+    def get_page(self, url: str, headers=None):
+        """Like get_json, but also returns the rel="next" URL for paginated lists"""
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry and self.cache.is_fresh(entry):
+            self.cache.record("hits")
+            metrics.count("http_cache", result="hit")
+            return entry["status"], entry["body"], next_link(entry["headers"].get("link"))
+
+        headers = dict(headers or {})
+        if entry:
+            headers.update(self.cache.validators(entry))
+
+        r = self.get(url, headers=headers)
+        if r.status_code == 304 and entry:
+            self.cache.record("not_modified")
+            metrics.count("http_cache", result="not_modified")
+            self.cache.revalidated(url, entry, r.headers)
+            return entry["status"], entry["body"], next_link(entry["headers"].get("link"))
+
+        try:
+            payload = r.json()
+        except ValueError:
+            payload = None
+
+        if self.cache:
+            self.cache.record("misses")
+            metrics.count("http_cache", result="miss")
+            if r.status_code == 200 and payload is not None:
+                self.cache.store(url, r.status_code, r.headers, payload)
+        return r.status_code, payload, next_link(r.headers.get("link"))
+
+    def post_json(self, url: str, body: dict, headers=None):
+        """POST a JSON body (GraphQL); returns (status_code, payload or None)"""
+        r = self.request("POST", url, headers, json=body)
+        try:
+            return r.status_code, r.json()
+        except ValueError:
+            return r.status_code, None
+
+    def releases(self, repo: str, per_page=RELEASES_PER_PAGE):
+        """The first REST page of a repo's releases, or None unless GitHub answered with a list"""
+        status, payload = self.get_json(f"{API_URL}/repos/{repo}/releases?per_page={per_page}")
+        return payload if status == 200 and isinstance(payload, list) else None
+
+    def iter_releases(self, repo: str, first_page=None, per_page=RELEASES_PER_PAGE,
+                      limit=MAX_RELEASES):
+        """Yield a repo's releases newest first, fetching further pages only on demand
+
+        first_page may hold releases already fetched elsewhere (a REST page or
+        a GraphQL batch, whose sizes can differ). Unless it is shorter than
+        both, and so the whole history, iteration continues with the REST page
+        holding the release after the last one yielded; releases already
+        yielded (by id) are skipped.
+        """
+        seen = set()
+        url = f"{API_URL}/repos/{repo}/releases?per_page={per_page}"
+        if first_page is not None:
+            for r in first_page[:limit]:
+                seen.add(_release_key(r))
+                yield r
+            if len(first_page) < min(per_page, GRAPHQL_RELEASES):
+                return
+            url = f"{url}&page={len(first_page[:limit]) // per_page + 1}"
+
+        while url and len(seen) < limit:
+            status, page, url = self.get_page(url)
+            if not isinstance(page, list):
+                logging.warning(f"{repo}: expected a list of releases, got HTTP {status}: {page}")
+                return
+            for r in page:
+                if len(seen) >= limit:
+                    return
+                key = _release_key(r)
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield r
+
+        while url and seen < limit:
+            status, page, url = self.get_page(url)
+            if not isinstance(page, list):
+                logging.warning(f"{repo}: expected a list of releases, got HTTP {status}: {page}")
+                return
+            for r in page:
+                if seen >= limit:
+                    return
+                seen += 1
+                yield r
+
+    @contextmanager
+    def stream(self, url: str, headers=None):
+        """Streaming GET that holds the host slot until the body has been consumed"""
+        with self._slot(url):
+            start = time.perf_counter()
+            with self.session.get(url, headers=self._headers(url, headers), stream=True,
+                                  timeout=self.timeout) as r:
+                try:
+                    yield r
+                finally:
+                    length = r.headers.get("Content-Length", "")
+                    metrics.http("GET", url, r.status_code, time.perf_counter() - start,
+                                 int(length) if length.isdigit() else 0)
+
+    def close(self):
+        """Release pooled connections, trim the response cache and log the quota left"""
+        self.session.close()
+        self.limiter.report()
+        if self.cache:
+            self.cache.evict()
+            self.cache.report()
@@ -0,0 +1,152 @@
+"""
+Batched GitHub release lookups over GraphQL
+
+Fetches the newest releases (with assets) of many repositories in one aliased
+GraphQL query and maps the result onto the REST release shape the scripts
+already read (tag_name, prerelease, published_at, assets[].name,
+assets[].browser_download_url), so callers can use either source unchanged.
+
+GraphQL's ReleaseAsset has no digest field, so mapped assets carry a
+release_url (the REST release by tag) instead; fill_digest() looks the
+sha256 up there for an asset that is about to be downloaded, so GraphQL and
+REST assets are verified alike.
+
+GraphQL needs a token. Without one, or with FDROID_GRAPHQL=0, batch_releases()
+returns an empty dict and callers keep using the per-repo REST endpoints.
+GITHUB_GRAPHQL_URL points the client at a local stand-in for testing.
+"""
+
+import os
+import logging
+from urllib.parse import quote
+
+from github_client import API_URL, GRAPHQL_RELEASES
+
+GRAPHQL_URL = os.environ.get("GITHUB_GRAPHQL_URL", f"{API_URL}/graphql")
+BATCH_SIZE = int(os.environ.get("FDROID_GRAPHQL_BATCH", "25"))
+RELEASES_PER_REPO = GRAPHQL_RELEASES
+
+RELEASE_FIELDS = """
+      nodes {
+        databaseId
+        tagName
+        name
+        isPrerelease
+        isDraft
+        publishedAt
+        releaseAssets(first: 50) {
+          nodes { name size contentType downloadUrl }
+        }
+      }"""
+
+
+def enabled(client) -> bool:
+    return bool(client.token) and os.environ.get("FDROID_GRAPHQL", "1") != "0"
+
+
+def build_query(repos, per_repo=RELEASES_PER_REPO):
+    """Return (query, variables) fetching releases for each "owner/name" as alias r<i>"""
+    params, fields, variables = [], [], {}
+    for i, repo in enumerate(repos):
+        owner, name = repo.split("/", 1)
+        variables[f"o{i}"], variables[f"n{i}"] = owner, name
+        params.append(f"$o{i}: String!, $n{i}: String!")
+        fields.append(
+            f"  r{i}: repository(owner: $o{i}, name: $n{i}) {{\n"
+            f"    releases(first: {per_repo}, orderBy: {{field: CREATED_AT, direction: DESC}}) {{"
+            f"{RELEASE_FIELDS}\n    }}\n  }}"
+        )
+    query = f"query({', '.join(params)}) {{\n" + "\n".join(fields) + "\n}"
+    return query, variables
+
+
+def release_from_node(node: dict) -> dict:
+    """Map a GraphQL Release node onto the REST /releases item shape"""
+    return {
+        "id": node.get("databaseId"),
+        "tag_name": node.get("tagName"),
+        "name": node.get("name"),
+        "prerelease": bool(node.get("isPrerelease")),
+        "draft": bool(node.get("isDraft")),
+        "published_at": node.get("publishedAt"),
+        "assets": [
+            {
+                "name": a.get("name"),
+                "size": a.get("size"),
+                "content_type": a.get("contentType"),
+                "browser_download_url": a.get("downloadUrl"),
+            }
+            for a in (node.get("releaseAssets") or {}).get("nodes") or []
+            if a
+        ],
+    }
+
+
+def parse_response(repos, payload):
+    """Return {repo: [release, ...]} for every alias that resolved"""
+    data = (payload or {}).get("data") or {}
+    result = {}
+    for i, repo in enumerate(repos):
+        node = data.get(f"r{i}")
+        if not node:
+            continue
+        nodes = (node.get("releases") or {}).get("nodes") or []
+        releases = [release_from_node(n) for n in nodes if n and not n.get("isDraft")]
+        for release in releases:
+            url = f"{API_URL}/repos/{repo}/releases/tags/{quote(release['tag_name'] or '', safe='')}"
+            for asset in release["assets"]:
+                asset["release_url"] = url
+        result[repo] = releases
+    return result
+
+
+def batch_releases(client, repos, per_repo=RELEASES_PER_REPO, batch_size=BATCH_SIZE) -> dict:
+    """Fetch releases for many repos; repos missing from the result need a REST lookup"""
+    if not enabled(client):
+        return {}
+
+    repos = list(dict.fromkeys(r for r in repos if r))
+    result = {}
+    for start in range(0, len(repos), batch_size):
+        chunk = repos[start:start + batch_size]
+        query, variables = build_query(chunk, per_repo)
+        try:
+            status, payload = client.post_json(GRAPHQL_URL, {"query": query, "variables": variables})
+        except Exception as e:
+            logging.warning(f"GraphQL batch failed, falling back to REST: {e}")
+            continue
+        if status != 200 or not isinstance(payload, dict):
+            logging.warning(f"GraphQL batch failed (HTTP {status}), falling back to REST")
+            continue
+        for err in payload.get("errors") or []:
+            logging.debug(f"GraphQL: {err.get('message')}")
+        result.update(parse_response(chunk, payload))
+
+    logging.info(f"GraphQL: resolved {len(result)}/{len(repos)} repos in "
+                 f"{(len(repos) + batch_size - 1) // batch_size} requests")
+    return result
+
+
+def fill_digest(client, asset: dict):
+    """The asset's "sha256:..." digest, looked up over REST for GraphQL-mapped assets"""
+    if "digest" in asset or not asset.get("release_url"):
+        return asset.get("digest")
+    status, release = client.get_json(asset["release_url"])
+    digest = None
+    if status == 200 and isinstance(release, dict):
+        digest = next((a.get("digest") for a in release.get("assets") or []
+                       if isinstance(a, dict) and a.get("name") == asset.get("name")), None)
+    else:
+        logging.warning(f"{asset.get('name')}: no digest, release lookup returned HTTP {status}")
+    asset["digest"] = digest
+    return digest
+
+
+def latest_release(releases):
+    """Pick what /releases/latest would return, falling back to the newest release"""
+    if not releases:
+        return None
+    for r in releases:
+        if not r.get("prerelease") and not r.get("draft"):
+            return r
+    return releases[0]
@@ -0,0 +1,140 @@
+"""
+On-disk HTTP response cache for Fury's F-Droid Repository
+
+Stores GitHub API responses keyed by URL together with their ETag and
+Last-Modified validators, so repeat runs can send conditional requests.
+GitHub does not count 304 responses against the rate limit, which keeps a
+no-change run fast and well under the token's quota.
+
+Tuning (environment):
+  FDROID_HTTP_CACHE       cache directory (default .cache/http in the repo root)
+  FDROID_CACHE_TTL_DAYS   drop entries not revalidated for this long (default 14)
+  FDROID_CACHE_MAX_MB     evict least recently used entries past this size (default 64)
+  FDROID_CACHE_MAX_AGE    serve entries younger than this many seconds without
+                          revalidating (default 0, always revalidate)
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_DIR = Path(os.environ.get("FDROID_HTTP_CACHE", ROOT / ".cache" / "http"))
+
+# Response headers worth keeping alongside the body
+KEPT_HEADERS = ("etag", "last-modified", "link")
+
+
+class ResponseCache:
+    """One JSON file per URL; safe to share between threads and scripts"""
+
+    def __init__(self, path=DEFAULT_DIR,
+                 ttl=float(os.environ.get("FDROID_CACHE_TTL_DAYS", "14")) * 86400,
+                 max_bytes=int(float(os.environ.get("FDROID_CACHE_MAX_MB", "64")) * 1024 * 1024),
+                 max_age=float(os.environ.get("FDROID_CACHE_MAX_AGE", "0"))):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = {"hits": 0, "not_modified": 0, "misses": 0, "stored": 0, "evicted": 0}
+        self._lock = threading.Lock()
+
+    def _file(self, url: str) -> Path:
+        return self.path / (hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def record(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def lookup(self, url: str):
+        """Return the cached entry for url, or None"""
+        try:
+            with open(self._file(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def is_fresh(self, entry: dict) -> bool:
+        return self.max_age > 0 and time.time() - entry.get("validated_at", 0) < self.max_age
+
+    @staticmethod
+    def validators(entry: dict) -> dict:
+        """Conditional request headers for a cached entry"""
+        headers = {}
+        kept = entry.get("headers", {})
+        if kept.get("etag"):
+            headers["If-None-Match"] = kept["etag"]
+        if kept.get("last-modified"):
+            headers["If-Modified-Since"] = kept["last-modified"]
+        return headers
+
+    def _write(self, url: str, entry: dict):
+        target = self._file(url)
+        tmp = target.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, separators=(",", ":"))
+        os.replace(tmp, target)
+
+    def store(self, url: str, status: int, headers, body):
+        """Cache a response if it carries a validator; returns True if stored"""
+        kept = {k: headers[k] for k in KEPT_HEADERS if headers.get(k)}
+        if "etag" not in kept and "last-modified" not in kept:
+            return False
+        now = time.time()
+        self._write(url, {"url": url, "status": status, "headers": kept, "body": body,
+                          "stored_at": now, "validated_at": now})
+        self.record("stored")
+        return True
+
+    def revalidated(self, url: str, entry: dict, headers=None):
+        """Mark an entry as confirmed by a 304, picking up any refreshed validators"""
+        for k in KEPT_HEADERS:
+            if headers and headers.get(k):
+                entry.setdefault("headers", {})[k] = headers[k]
+        entry["validated_at"] = time.time()
+        self._write(url, entry)
+
+    def evict(self):
+        """Drop expired entries, then the least recently validated ones over budget"""
+        now = time.time()
+        files = []
+        for f in self.path.glob("*.json"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            if self.ttl and now - st.st_mtime > self.ttl:
+                f.unlink(missing_ok=True)
+                self.record("evicted")
+            else:
+                files.append((st.st_mtime, st.st_size, f))
+
+        total = sum(size for _, size, _ in files)
+        for mtime, size, f in sorted(files):
+            if total <= self.max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+            self.record("evicted")
+
+        # Leftovers from a writer that was killed mid-write
+        for f in self.path.glob("*.tmp"):
+            try:
+                if now - f.stat().st_mtime > 3600:
+                    f.unlink()
+            except OSError:
+                pass
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"HTTP cache: {s['hits']} hits, {s['not_modified']} not modified (304), "
+                f"{s['misses']} misses, {s['stored']} stored, {s['evicted']} evicted")
+
+    def report(self):
+        logging.info(self.summary())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+App icon pipeline for Fury's F-Droid Repository
+
+For every app the icon source is, in order:
+
+  1. a hand-placed fdroid/metadata/icons/<id>.png (this script never writes
+     there, so any file in it is a source)
+  2. assets.icon.url from the catalog; github.com/<owner>/<repo>/blob/...
+     links are rewritten to raw.githubusercontent.com, and a bare repository
+     page is resolved by probing the usual icon paths on the default branch
+
+Sources are fetched concurrently over the shared GitHubClient with
+If-None-Match/If-Modified-Since, so an unchanged icon costs one 304. Each
+source is identified by its sha256; renders live in .cache/icons/renders/<sha256>/,
+one PNG per size, produced with Pillow in a process pool and only for
+sources that have not been rendered before. Sources are never upscaled: a
+size larger than the source gets the source at its own size. Outputs are
+hardlinked into place:
+
+  fdroid/metadata/<id>/en-US/icon.png      512px, published by fdroid update
+                                           as the app icon (no APK extraction)
+  fdroid/metadata/icons-generated/<id>.png 192px (xxxhdpi), copied to
+                                           repo/icons/ under hand-placed icons
+
+density_icon() hands out the per-density renders, which incremental_index.py
+uses for APK entries whose extracted icons were lost.
+
+Tuning (environment):
+  FDROID_ICON_CACHE    render cache and state directory (default .cache/icons)
+  FDROID_ICON_WORKERS  render processes (default: CPU count)
+"""
+
+import io
+import os
+import copy
+import sys
+import json
+import hashlib
+import logging
+import threading
+import multiprocessing
+from pathlib import Path
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from catalog import repo_from_url
+from stage_repo import place
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+METADATA_DIR = ROOT / "fdroid" / "metadata"
+HAND_PLACED = METADATA_DIR / "icons"
+GENERATED = METADATA_DIR / "icons-generated"
+CACHE_DIR = Path(os.environ.get("FDROID_ICON_CACHE", ROOT / ".cache" / "icons"))
+STATE_FILE = CACHE_DIR / "state.json"
+RENDERS = CACHE_DIR / "renders"
+RENDER_WORKERS = int(os.environ.get("FDROID_ICON_WORKERS", "0")) or os.cpu_count() or 1
+
+# fdroidserver screen densities -> launcher icon size (48dp), plus the hi-res store icon
+DENSITY_SIZES = {"120": 36, "160": 48, "240": 72, "320": 96, "480": 144, "640": 192}
+HIRES = 512
+SIZES = sorted(set(DENSITY_SIZES.values()) | {HIRES})
+
+# Where icons usually live in an Android project, probed for bare repo URLs
+ICON_PATHS = [
+    "fastlane/metadata/android/en-US/images/icon.png",
+    "metadata/en-US/images/icon.png",
+    "metadata/en-US/icon.png",
+    "app/src/main/res/mipmap-xxxhdpi/ic_launcher.png",
+    "app/src/main/res/mipmap-xxhdpi/ic_launcher.png",
+    "app/src/main/ic_launcher-playstore.png",
+    "app/src/main/res/mipmap-xhdpi/ic_launcher.png",
+    "app/src/main/res/drawable/ic_launcher.png",
+]
+
+STATE_VERSION = 1
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def source_urls(url: str) -> list:
+    """Candidate image URLs for an assets.icon.url value"""
+    if not url:
+        return []
+    parts = urlsplit(url if "://" in url else "https://" + url)
+    host = (parts.hostname or "").lower()
+    segments = [s for s in parts.path.split("/") if s]
+    if host in ("github.com", "www.github.com"):
+        if len(segments) > 4 and segments[2] in ("blob", "raw"):
+            return [f"https://raw.githubusercontent.com/{segments[0]}/{segments[1]}/"
+                    + "/".join(segments[3:])]
+        repo = repo_from_url(url)
+        if repo and len(segments) == 2:
+            return [f"https://raw.githubusercontent.com/{repo}/HEAD/{p}" for p in ICON_PATHS]
+        return []
+    return [url]
+
+
+def render_dir(sha256: str) -> Path:
+    return RENDERS / sha256
+
+
+def rendered(sha256: str, size: int) -> Path:
+    return render_dir(sha256) / f"{size}.png"
+
+
+def is_rendered(sha256: str) -> bool:
+    return all(rendered(sha256, size).exists() for size in SIZES)
+
+
+def render(job):
+    """Worker process: (sha256, image bytes) -> error string or None"""
+    sha256, data = job
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            im.load()
+            im = im.convert("RGBA")
+    except Exception as e:
+        return f"not an image: {e}"
+    # pad to a square on a transparent canvas, keeping the icon centred;
+    # sizes above the source's get it unscaled rather than blown up
+    side = max(im.size)
+    if im.size[0] != im.size[1]:
+        canvas = Image.new("RGBA", (side, side), (0, 0, 0, 0))
+        canvas.paste(im, ((side - im.size[0]) // 2, (side - im.size[1]) // 2))
+        im = canvas
+    out = render_dir(sha256)
+    out.mkdir(parents=True, exist_ok=True)
+    for size in SIZES:
+        target = out / f"{size}.png"
+        tmp = out / f".{size}.png.tmp"
+        (im if size >= side else im.resize((size, size), Image.LANCZOS)).save(
+            tmp, "PNG", optimize=True)
+        os.replace(tmp, target)
+    return None
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_sha256(path: Path):
+    try:
+        return _sha256(path.read_bytes())
+    except OSError:
+        return None
+
+
+def load_state() -> dict:
+    """{app id: icon state} from state.json, read once per process"""
+    global _state
+    with _state_lock:
+        if _state is None:
+            try:
+                data = json.loads(STATE_FILE.read_text())
+                _state = data.get("apps", {}) if data.get("version") == STATE_VERSION else {}
+            except (OSError, ValueError, AttributeError):
+                _state = {}
+        return _state
+
+
+class IconPipeline:
+    """Fetch, render and place app icons, remembering what was done in state.json"""
+
+    def __init__(self, client, workers=RENDER_WORKERS):
+        self.client = client
+        self.workers = workers
+        self.state = copy.deepcopy(load_state())
+        self.counts = {"unchanged": 0, "fetched": 0, "rendered": 0, "placed": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def hand_placed(self, app_id: str):
+        """The hand-placed icon for app_id, if any"""
+        path = HAND_PLACED / f"{app_id}.png"
+        return path if path.exists() else None
+
+    def drop_legacy_outputs(self):
+        """Remove 192px renders earlier versions wrote among the hand-placed icons"""
+        for app_id, state in self.state.items():
+            path = HAND_PLACED / f"{app_id}.png"
+            recorded = (state.get("outputs") or {}).pop(str(path.relative_to(ROOT)), None)
+            if recorded and recorded == _file_sha256(path):
+                logging.info(f"{app_id}: moving the generated icon out of {HAND_PLACED.name}/")
+                path.unlink()
+
+    def fetch(self, app):
+        """(sha256, bytes, source state) for the app's icon; bytes is None after a 304"""
+        old = self.state.get(app.id) or {}
+        local = self.hand_placed(app.id)
+        if local is not None:
+            data = local.read_bytes()
+            return _sha256(data), data, {"url": str(local.relative_to(ROOT))}
+
+        candidates = source_urls(app.icon)
+        if old.get("url") in candidates:
+            candidates.remove(old["url"])
+            candidates.insert(0, old["url"])
+        for url in candidates:
+            headers = {}
+            if url == old.get("url") and old.get("sha256") and is_rendered(old["sha256"]):
+                if old.get("etag"):
+                    headers["If-None-Match"] = old["etag"]
+                if old.get("last_modified"):
+                    headers["If-Modified-Since"] = old["last_modified"]
+            r = self.client.get(url, headers=headers)
+            if r.status_code == 304:
+                return old["sha256"], None, old
+            if r.status_code != 200 or "text/html" in r.headers.get("content-type", ""):
+                continue
+            state = {"url": url, "etag": r.headers.get("etag"),
+                     "last_modified": r.headers.get("last-modified")}
+            self._count("fetched")
+            return _sha256(r.content), r.content, state
+        raise RuntimeError(f"no icon found at {app.icon!r}")
+
+    def place_outputs(self, app_id: str, sha256: str) -> dict:
+        outputs = {
+            METADATA_DIR / app_id / "en-US" / "icon.png": rendered(sha256, HIRES),
+            GENERATED / f"{app_id}.png": rendered(sha256, DENSITY_SIZES["640"]),
+        }
+        recorded = {}
+        for target, src in outputs.items():
+            if not target.exists() or not os.path.samefile(src, target):
+                target.parent.mkdir(parents=True, exist_ok=True)
+                place(src, target)
+                self._count("placed")
+            recorded[str(target.relative_to(ROOT))] = _file_sha256(target)
+        return recorded
+
+    def refresh(self, apps) -> dict:
+        """Bring every app's icon up to date; returns counts"""
+        self.drop_legacy_outputs()
+        apps = [app for app in apps if app.icon or (HAND_PLACED / f"{app.id}.png").exists()]
+
+        def guarded(app):
+            try:
+                return self.fetch(app)
+            except Exception as e:
+                logging.warning(f"{app.id}: icon: {e}")
+                self._count("failed")
+                return None
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            fetched = dict(zip((a.id for a in apps), pool.map(guarded, apps)))
+
+        jobs = {}
+        for app_id, result in fetched.items():
+            if result is None:
+                continue
+            sha, data, _ = result
+            if sha == (self.state.get(app_id) or {}).get("sha256") and is_rendered(sha):
+                self.counts["unchanged"] += 1
+            elif data is not None and not is_rendered(sha):
+                jobs[sha] = data
+        if jobs:
+            # pipeline.py calls this from its stage threads, which may hold locks
+            # (metrics, http cache, sessions) a forked child would inherit
+            # locked; forkserver children start from a clean single thread
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)),
+                                     mp_context=multiprocessing.get_context("forkserver")) as pool:
+                errors = dict(zip(jobs, pool.map(render, jobs.items())))
+            self.counts["rendered"] += sum(1 for e in errors.values() if e is None)
+        else:
+            errors = {}
+
+        for app_id, result in fetched.items():
+            if result is None:
+                continue
+            sha, _, source = result
+            if errors.get(sha) or not is_rendered(sha):
+                logging.warning(f"{app_id}: icon: {errors.get(sha) or 'render missing'}")
+                self.counts["failed"] += 1
+                continue
+            outputs = self.place_outputs(app_id, sha)
+            self.state[app_id] = dict(source, sha256=sha, outputs=outputs)
+
+        self.gc()
+        self.save()
+        logging.info(f"Icons: {self.counts['unchanged']} unchanged, {self.counts['fetched']} fetched, "
+                     f"{self.counts['rendered']} rendered, {self.counts['placed']} placed, "
+                     f"{self.counts['failed']} failed")
+        return self.counts
+
+    def gc(self):
+        """Drop renders no app refers to any more, and the old upscaling layout"""
+        live = {s.get("sha256") for s in self.state.values()}
+        stale = [d for d in RENDERS.iterdir() if d.name not in live] if RENDERS.is_dir() else []
+        if CACHE_DIR.is_dir():
+            stale += [d for d in CACHE_DIR.iterdir() if len(d.name) == 64]
+        for directory in stale:
+            if directory.is_dir():
+                for f in directory.iterdir():
+                    f.unlink()
+                directory.rmdir()
+
+    def save(self):
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = STATE_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": STATE_VERSION, "apps": self.state}, indent=1,
+                                  sort_keys=True))
+        os.replace(tmp, STATE_FILE)
+        global _state
+        with _state_lock:
+            _state = dict(self.state)
+
+
+def density_icon(package: str, density: str):
+    """Rendered icon of package for an fdroid screen density, or None"""
+    state = load_state().get(package)
+    size = DENSITY_SIZES.get(density, DENSITY_SIZES["640"] if density in ("0", "65534") else None)
+    if not state or not size:
+        return None
+    path = rendered(state["sha256"], size)
+    return path if path.exists() else None
+
+
+def main():
+    import catalog
+    from github_client import GitHubClient
+
+    try:
+        apps = catalog.load()
+    except catalog.CatalogError as e:
+        logging.error(str(e))
+        sys.exit(1)
+    client = GitHubClient(cache=None)
+    IconPipeline(client).refresh(apps)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Incremental index builds for Fury's F-Droid Repository
+
+`fdroid update` only skips an APK when fdroid/tmp/apkcache.json has an entry
+for it with the same size and the cache file is newer than the APK. In CI the
+checkout is fresh, so every APK was rescanned, rehashed and had its icons
+re-extracted on every run. This script carries that cache across runs:
+
+  seed  (before fdroid update) rebuild fdroid/tmp/apkcache.json from the
+        persisted cache in .cache/fdroid/ or, when there is none, from the
+        previously published index-v1.json. An entry is only kept when the
+        staged APK has the same sha256 and all its icons could be restored,
+        so fdroid rescans exactly the new or changed APKs.
+  save  (after fdroid update) persist apkcache.json and the extracted icons
+        to .cache/fdroid/ for the next run.
+
+The index itself is still regenerated and signed by fdroid update.
+
+Tuning (environment):
+  FDROID_INDEX_CACHE     persisted cache directory (default .cache/fdroid in the repo root)
+  FDROID_PREVIOUS_INDEX  path or URL of the last published index-v1.json
+                         (default <repo_url>/index-v1.json from fdroid/config.yml, "0" disables)
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+import icons
+from apk_index import sha256sum
+from github_client import GitHubClient, DEFAULT_WORKERS
+from stage_repo import MANIFEST, REPO_DIR, place
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+FDROID_DIR = ROOT / "fdroid"
+CONFIG_FILE = FDROID_DIR / "config.yml"
+APKCACHE = FDROID_DIR / "tmp" / "apkcache.json"
+CACHE_DIR = Path(os.environ.get("FDROID_INDEX_CACHE", ROOT / ".cache" / "fdroid"))
+PREVIOUS_INDEX = os.environ.get("FDROID_PREVIOUS_INDEX", "")
+
+# Same layout as fdroidserver.update.get_icon_dir()
+SCREEN_DENSITIES = ["65534", "640", "480", "320", "240", "160", "120"]
+
+# Keys scan_apk() always sets but index-v1 drops when they are empty
+SCAN_DEFAULTS = {"uses-permission": [], "uses-permission-sdk-23": [], "features": [],
+                 "icons_src": {}, "icons": {}, "antiFeatures": {}}
+
+
+def icon_dir(density: str) -> str:
+    return "icons" if density in ("0", "65534") else f"icons-{density}"
+
+
+def load_config() -> dict:
+    try:
+        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError):
+        return {}
+
+
+def cache_header(config: dict) -> dict:
+    """The keys fdroidserver.update.get_cache() insists on, or {} if fdroidserver is missing"""
+    try:
+        from fdroidserver.update import METADATA_VERSION
+    except ImportError:
+        return {}
+    return {"METADATA_VERSION": METADATA_VERSION,
+            "allow_disabled_algorithms": bool(config.get("allow_disabled_algorithms", False))}
+
+
+def staged_hashes() -> dict:
+    """{repo file name: sha256} recorded by stage_repo.py"""
+    try:
+        return json.loads(MANIFEST.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def from_persisted(header: dict) -> dict:
+    """APK entries from the apkcache.json saved by the previous run"""
+    try:
+        cache = json.loads((CACHE_DIR / "apkcache.json").read_text())
+    except (OSError, ValueError):
+        return {}
+    if any(cache.get(k) != v for k, v in header.items()):
+        logging.info("Persisted apk cache was written by another fdroidserver version, ignoring it")
+        return {}
+    return {k: v for k, v in cache.items() if isinstance(v, dict)}
+
+
+def from_index(client: GitHubClient, source: str) -> dict:
+    """APK entries reconstructed from a published index-v1.json (path or URL)"""
+    try:
+        if source.startswith(("http://", "https://")):
+            r = client.get(source)
+            if r.status_code != 200:
+                logging.info(f"No previous index at {source} (HTTP {r.status_code})")
+                return {}
+            index = r.json()
+        else:
+            index = json.loads(Path(source).read_text())
+    except Exception as e:
+        logging.warning(f"Could not read previous index {source}: {e}")
+        return {}
+
+    entries = {}
+    for versions in index.get("packages", {}).values():
+        for package in versions:
+            apk = dict(SCAN_DEFAULTS, **package)
+            # make_v1() turns the antiFeatures dict into a list and dates into milliseconds
+            if isinstance(apk["antiFeatures"], list):
+                apk["antiFeatures"] = {a: {} for a in apk["antiFeatures"]}
+            if "added" in apk:
+                apk["added"] = apk["added"] / 1000
+            apk["icons"] = {}
+            entries[apk["apkName"]] = apk
+    return entries
+
+
+def fetch_icon(client: GitHubClient, base: str, path: str):
+    """Bytes of base/path (URL or directory), None if it does not exist"""
+    if not base.startswith(("http://", "https://")):
+        try:
+            return (Path(base) / path).read_bytes()
+        except FileNotFoundError:
+            return None
+    r = client.get(f"{base}/{path}")
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return r.content
+
+
+def fetch_icons(client: GitHubClient, base: str, apk: dict) -> bool:
+    """Copy the icons of an index-v1 entry into the persisted icon store"""
+    name = f"{apk['packageName']}.{apk['versionCode']}.png"
+    for density in SCREEN_DENSITIES:
+        dest = CACHE_DIR / "icons" / icon_dir(density) / name
+        if not dest.exists():
+            try:
+                data = fetch_icon(client, base, f"{icon_dir(density)}/{name}")
+            except Exception:
+                return False
+            if data is None:
+                continue
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dest.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, dest)
+        apk["icons"][density] = name
+    if apk["icons"]:
+        apk["icon"] = name
+    return True
+
+
+def restore_icons(apk: dict, repo_dir: Path) -> bool:
+    """Put the icons of a cached entry back into repo_dir; False if any is missing
+
+    Icons that were not persisted are filled in from the app's rendered icon
+    (icons.py) rather than sending the APK back to fdroid for extraction.
+    """
+    for density, name in apk.get("icons", {}).items():
+        target = repo_dir / icon_dir(density) / name
+        if target.exists():
+            continue
+        saved = CACHE_DIR / "icons" / icon_dir(density) / name
+        if not saved.exists():
+            saved = icons.density_icon(apk.get("packageName"), density)
+        if saved is None:
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        place(saved, target)
+    return True
+
+
+def seed(repo_dir: Path = REPO_DIR) -> dict:
+    """Write fdroid/tmp/apkcache.json with every entry that is still valid"""
+    config = load_config()
+    header = cache_header(config)
+    if not header:
+        logging.warning("fdroidserver is not installed, not seeding the apk cache")
+        return {"reused": 0, "rescan": 0}
+
+    entries = from_persisted(header)
+    source = "persisted cache"
+    client = None
+    if not entries and PREVIOUS_INDEX != "0":
+        index_url = PREVIOUS_INDEX or f"{str(config.get('repo_url', '')).rstrip('/')}/index-v1.json"
+        if index_url != "/index-v1.json":
+            client = GitHubClient(cache=None)
+            entries = from_index(client, index_url)
+            source = index_url
+            base = index_url.rsplit("/", 1)[0] if "/" in index_url else "."
+            with ThreadPoolExecutor(max_workers=DEFAULT_WORKERS) as pool:
+                fetched = dict(zip(entries, pool.map(lambda a: fetch_icons(client, base, a),
+                                                     entries.values())))
+            entries = {k: v for k, v in entries.items() if fetched[k]}
+
+    hashes = staged_hashes()
+    apks = sorted(p.name for p in repo_dir.glob("*.apk"))
+    cache = dict(header)
+    newest = 0.0
+    for name in apks:
+        apk = entries.get(name)
+        path = repo_dir / name
+        st = path.stat()
+        newest = max(newest, st.st_mtime)
+        if not apk or apk.get("size") != st.st_size:
+            continue
+        sha = hashes.get(name) or sha256sum(path)
+        if apk.get("hash") != sha or not restore_icons(apk, repo_dir):
+            continue
+        cache[name] = apk
+    if client is not None:
+        client.close()
+
+    APKCACHE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = APKCACHE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(cache, indent=2))
+    os.replace(tmp, APKCACHE)
+    # fdroid only trusts entries for APKs older than the cache file
+    stamp = max(time.time(), newest + 1)
+    os.utime(APKCACHE, (stamp, stamp))
+
+    reused = len(cache) - len(header)
+    counts = {"reused": reused, "rescan": len(apks) - reused}
+    logging.info(f"Seeded apk cache from {source}: {counts['reused']} reused, "
+                 f"{counts['rescan']} to scan")
+    return counts
+
+
+def save(repo_dir: Path = REPO_DIR):
+    """Persist apkcache.json and the icons it refers to after fdroid update"""
+    if not APKCACHE.exists():
+        logging.warning(f"{APKCACHE} missing, nothing to save")
+        return
+    cache = json.loads(APKCACHE.read_text())
+    live = set()
+    for apk in cache.values():
+        if not isinstance(apk, dict):
+            continue
+        for density, name in apk.get("icons", {}).items():
+            src = repo_dir / icon_dir(density) / name
+            dest = CACHE_DIR / "icons" / icon_dir(density) / name
+            if not src.exists():
+                continue
+            live.add(dest)
+            if not dest.exists():
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                place(src, dest)
+
+    for old in (CACHE_DIR / "icons").glob("*/*.png"):
+        if old not in live:
+            old.unlink()
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_DIR / "apkcache.json.tmp"
+    tmp.write_text(APKCACHE.read_text())
+    os.replace(tmp, CACHE_DIR / "apkcache.json")
+    logging.info(f"Saved apk cache: {sum(isinstance(v, dict) for v in cache.values())} APKs, "
+                 f"{len(live)} icons")
+
+
+def main():
+    if len(sys.argv) != 2 or sys.argv[1] not in ("seed", "save"):
+        print(f"Usage: {sys.argv[0]} seed|save")
+        sys.exit(2)
+    if sys.argv[1] == "seed":
+        seed()
+    else:
+        save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+index-v2 history for Fury's F-Droid Repository
+
+fdroid update writes index-v2.json and entry.json next to index-v1, plus one
+diff/<timestamp>.json per earlier index it still has in fdroid/tmp/
+(repo_<timestamp>.json, at most 10). A client at one of those timestamps
+fetches the small diff instead of the whole index. In CI fdroid/tmp/ starts
+empty, so no diffs were ever produced. This script carries the history:
+
+  restore  (before fdroid update) put the last N published indexes back into
+           fdroid/tmp/ from .cache/fdroid/index-v2/ or, when there are none,
+           from the published <repo_url>/index-v2.json
+  persist  (after fdroid update) save the newest N of them for the next run
+
+apply_diff() is the client side of fdroidserver's dict_diff(): null removes
+a key, objects are merged recursively, anything else replaces the old value.
+fdroid_emulator.py uses it to check that every published diff turns its base
+index into the current one.
+
+Tuning (environment):
+  FDROID_INDEX_HISTORY      history directory (default .cache/fdroid/index-v2)
+  FDROID_INDEX_DIFFS        indexes kept to diff against (default 10, fdroidserver's limit)
+  FDROID_PREVIOUS_INDEX_V2  path or URL of the last published index-v2.json
+                            (default <repo_url>/index-v2.json from fdroid/config.yml, "0" disables)
+"""
+
+import os
+import sys
+import json
+import logging
+from pathlib import Path
+
+from incremental_index import CACHE_DIR, FDROID_DIR, load_config
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+TMP_DIR = FDROID_DIR / "tmp"
+HISTORY_DIR = Path(os.environ.get("FDROID_INDEX_HISTORY", CACHE_DIR / "index-v2"))
+KEEP = int(os.environ.get("FDROID_INDEX_DIFFS", "10"))
+PREVIOUS_INDEX_V2 = os.environ.get("FDROID_PREVIOUS_INDEX_V2", "")
+
+
+def snapshot_name(timestamp, repo="repo") -> str:
+    """File name fdroidserver's make_v2() gives an index in tmp/"""
+    return f"{repo}_{int(timestamp)}.json"
+
+
+def timestamp_of(path: Path):
+    stem = path.stem.rpartition("_")[2]
+    return int(stem) if stem.isdigit() else None
+
+
+def snapshots(directory: Path, repo="repo") -> dict:
+    """{timestamp: path} of the saved indexes in directory"""
+    found = {}
+    for path in directory.glob(f"{repo}_*.json"):
+        ts = timestamp_of(path)
+        if ts is not None:
+            found[ts] = path
+    return dict(sorted(found.items()))
+
+
+def apply_diff(old, diff):
+    """The index a client gets by applying an index-v2 diff to old"""
+    if not isinstance(diff, dict) or not isinstance(old, dict):
+        return diff
+    result = dict(old)
+    for key, value in diff.items():
+        if value is None:
+            result.pop(key, None)
+        elif key in result:
+            result[key] = apply_diff(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def _copy(src: Path, dest: Path):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.tmp")
+    tmp.write_bytes(src.read_bytes())
+    os.replace(tmp, dest)
+
+
+def fetch_published(source: str):
+    """(timestamp, raw bytes) of a published index-v2.json (path or URL), or None"""
+    try:
+        if source.startswith(("http://", "https://")):
+            from github_client import GitHubClient
+            client = GitHubClient(cache=None)
+            try:
+                r = client.get(source)
+            finally:
+                client.close()
+            if r.status_code != 200:
+                logging.info(f"No published index-v2 at {source} (HTTP {r.status_code})")
+                return None
+            raw = r.content
+        else:
+            raw = Path(source).read_bytes()
+        timestamp = json.loads(raw)["repo"]["timestamp"]
+    except Exception as e:
+        logging.warning(f"Could not read published index-v2 {source}: {e}")
+        return None
+    return int(timestamp), raw
+
+
+def restore(keep: int = KEEP) -> int:
+    """Put up to keep earlier indexes into fdroid/tmp/; returns how many are there"""
+    present = snapshots(TMP_DIR)
+    saved = snapshots(HISTORY_DIR)
+    for ts, path in list(saved.items())[-keep:]:
+        if ts not in present:
+            _copy(path, TMP_DIR / snapshot_name(ts))
+    present = snapshots(TMP_DIR)
+    source = "persisted history"
+
+    if not present and PREVIOUS_INDEX_V2 != "0":
+        config = load_config()
+        source = PREVIOUS_INDEX_V2 or f"{str(config.get('repo_url', '')).rstrip('/')}/index-v2.json"
+        published = fetch_published(source) if source != "/index-v2.json" else None
+        if published:
+            ts, raw = published
+            TMP_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = TMP_DIR / f".{snapshot_name(ts)}.tmp"
+            tmp.write_bytes(raw)
+            os.replace(tmp, TMP_DIR / snapshot_name(ts))
+            present = snapshots(TMP_DIR)
+
+    # fdroidserver deletes the oldest beyond 10 itself; respect a smaller keep
+    for ts, path in list(present.items())[:-keep] if keep > 0 else present.items():
+        path.unlink()
+    count = min(len(present), keep)
+    logging.info(f"index-v2: {count} earlier indexes to diff against (from {source})")
+    return count
+
+
+def persist(keep: int = KEEP) -> int:
+    """Save the newest keep indexes from fdroid/tmp/ for the next run"""
+    present = snapshots(TMP_DIR)
+    wanted = dict(list(present.items())[-keep:]) if keep > 0 else {}
+    for ts, path in wanted.items():
+        dest = HISTORY_DIR / path.name
+        if not dest.exists():
+            _copy(path, dest)
+    for ts, path in snapshots(HISTORY_DIR).items():
+        if ts not in wanted:
+            path.unlink()
+    logging.info(f"index-v2: kept {len(wanted)} indexes for future diffs")
+    return len(wanted)
+
+
+def main():
+    if len(sys.argv) != 2 or sys.argv[1] not in ("restore", "persist"):
+        print(f"Usage: {sys.argv[0]} restore|persist")
+        sys.exit(2)
+    if sys.argv[1] == "restore":
+        restore()
+    else:
+        persist()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Run metrics for Fury's F-Droid Repository
+
+A process-wide recorder the scripts report into:
+
+  span(name, app=None)   time a block; spans opened with app= attribute
+                         everything recorded inside them on the same thread
+                         (HTTP calls, counters, nested spans) to that app
+  count(name, value)     add to a counter, e.g. count("pruned", reason="arch")
+  http(...)              one HTTP request: host, status, latency, bytes; called
+                         by GitHubClient for every request it sends
+
+At exit, finish(script) writes the run report as JSON and as an OpenMetrics
+text file:
+
+  .cache/metrics/<script>.json     latest run (also runs/<script>-<time>.json)
+  .cache/metrics/<script>.prom     same numbers for a node_exporter textfile
+                                   collector or any OpenMetrics scraper
+
+A report has per-span totals (stages), per-app totals (time, requests, bytes,
+HTTP time, cache hits, counters), per-host HTTP latency (p50/p95/max) and
+status counts, and the raw trace of spans. Reports have a fixed shape so
+they can be compared:
+
+  metrics.py show [REPORT]             summary, slowest apps and hosts
+  metrics.py compare OLD NEW [--top N] span and per-app changes between runs
+
+Tuning (environment):
+  FDROID_METRICS       "0" disables writing reports
+  FDROID_METRICS_DIR   report directory (default .cache/metrics)
+  FDROID_METRICS_KEEP  timestamped runs kept per script (default 50)
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from datetime import datetime, timezone
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+ENABLED = os.environ.get("FDROID_METRICS", "1") != "0"
+METRICS_DIR = Path(os.environ.get("FDROID_METRICS_DIR", ROOT / ".cache" / "metrics"))
+KEEP_RUNS = int(os.environ.get("FDROID_METRICS_KEEP", "50"))
+
+REPORT_VERSION = 1
+# Spans beyond this are aggregated but not kept in the trace
+MAX_TRACE = 20000
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+
+
+class Recorder:
+    """Thread-safe collector of spans, counters and HTTP requests"""
+
+    def __init__(self, clock=time.time, timer=time.perf_counter):
+        self.clock = clock
+        self.timer = timer
+        self.started = clock()
+        self._t0 = timer()
+        self.trace = []
+        self.spans = {}      # name: [count, seconds, max]
+        self.apps = {}       # app id: {field: value}
+        self.counters = {}   # (name, labels): value
+        self.hosts = {}      # host: {"latencies": [], "bytes": n, "status": {code: n}}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def current_app(self):
+        return getattr(self._local, "app", None)
+
+    def _app(self, app_id) -> dict:
+        # callers hold the lock
+        return self.apps.setdefault(app_id, {"seconds": 0.0, "requests": 0, "bytes": 0,
+                                             "http_seconds": 0.0, "spans": {}, "counters": {}})
+
+    @contextmanager
+    def span(self, name: str, app=None, **attrs):
+        """Time the block; with app set, attribute what happens inside it to that app"""
+        outer = self.current_app()
+        if app is not None:
+            self._local.app = str(app)
+        app = self.current_app()
+        start = self.timer()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = self.timer() - start
+            self._local.app = outer
+            with self._lock:
+                agg = self.spans.setdefault(name, [0, 0.0, 0.0])
+                agg[0] += 1
+                agg[1] += seconds
+                agg[2] = max(agg[2], seconds)
+                if app is not None:
+                    entry = self._app(app)
+                    entry["spans"][name] = entry["spans"].get(name, 0.0) + seconds
+                    if outer != app:
+                        entry["seconds"] += seconds  # outermost span of this app only
+                if len(self.trace) < MAX_TRACE:
+                    record = {"name": name, "start": round(start - self._t0, 6),
+                              "seconds": round(seconds, 6)}
+                    if app is not None:
+                        record["app"] = app
+                    if attrs:
+                        record["attrs"] = attrs
+                    if error:
+                        record["error"] = error
+                    self.trace.append(record)
+
+    def count(self, name: str, value=1, **labels):
+        """Add value to a counter; also to the current app's copy when inside an app span"""
+        app = self.current_app()
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if app is not None:
+                counters = self._app(app)["counters"]
+                label = f"{name}{{{key[1]}}}" if key[1] else name
+                counters[label] = counters.get(label, 0) + value
+
+    def http(self, method: str, url: str, status: int, seconds: float, nbytes: int):
+        host = urlsplit(url).hostname or ""
+        app = self.current_app()
+        with self._lock:
+            h = self.hosts.setdefault(host, {"latencies": [], "bytes": 0, "status": {}})
+            h["latencies"].append(seconds)
+            h["bytes"] += nbytes
+            h["status"][str(status)] = h["status"].get(str(status), 0) + 1
+            if app is not None:
+                entry = self._app(app)
+                entry["requests"] += 1
+                entry["bytes"] += nbytes
+                entry["http_seconds"] += seconds
+
+    def report(self, script: str) -> dict:
+        """The run report as a JSON-serialisable dict"""
+        with self._lock:
+            hosts = {}
+            for host, h in sorted(self.hosts.items()):
+                lat = h["latencies"]
+                hosts[host] = {"requests": len(lat), "bytes": h["bytes"],
+                               "seconds": round(sum(lat), 6),
+                               "p50": round(_percentile(lat, 0.5), 6),
+                               "p95": round(_percentile(lat, 0.95), 6),
+                               "max": round(max(lat, default=0.0), 6),
+                               "status": dict(sorted(h["status"].items()))}
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                counters[f"{name}{{{labels}}}" if labels else name] = value
+            return {
+                "version": REPORT_VERSION,
+                "script": script,
+                "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "seconds": round(self.timer() - self._t0, 6),
+                "commit": os.environ.get("GITHUB_SHA"),
+                "run_id": os.environ.get("GITHUB_RUN_ID"),
+                "spans": {name: {"count": c, "seconds": round(s, 6), "max": round(m, 6)}
+                          for name, (c, s, m) in sorted(self.spans.items())},
+                "apps": {app: dict(e, seconds=round(e["seconds"], 6),
+                                   http_seconds=round(e["http_seconds"], 6),
+                                   spans={k: round(v, 6) for k, v in sorted(e["spans"].items())})
+                         for app, e in sorted(self.apps.items())},
+                "http": hosts,
+                "counters": counters,
+                "trace": list(self.trace),
+            }
+
+
+def openmetrics(report: dict) -> str:
+    """OpenMetrics text exposition of a run report"""
+    script = report["script"]
+    lines = []
+
+    def esc(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def family(name, kind, help_text, samples):
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"# HELP {name} {help_text}")
+        suffix = "_total" if kind == "counter" else ""
+        for labels, value in samples:
+            labels = dict({"script": script}, **labels)
+            rendered = ",".join(f'{k}="{esc(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{suffix}{{{rendered}}} {value}")
+
+    family("fdroid_run_seconds", "gauge", "Wall time of the run.", [({}, report["seconds"])])
+    family("fdroid_span_seconds", "gauge", "Total time spent in each span.",
+           [({"span": k}, v["seconds"]) for k, v in report["spans"].items()])
+    family("fdroid_span", "counter", "Number of times each span ran.",
+           [({"span": k}, v["count"]) for k, v in report["spans"].items()])
+    family("fdroid_app_seconds", "gauge", "Time spent on each app.",
+           [({"app": k}, v["seconds"]) for k, v in report["apps"].items()])
+    family("fdroid_app_http_requests", "counter", "HTTP requests made for each app.",
+           [({"app": k}, v["requests"]) for k, v in report["apps"].items()])
+    family("fdroid_app_http_bytes", "counter", "HTTP bytes received for each app.",
+           [({"app": k}, v["bytes"]) for k, v in report["apps"].items()])
+    family("fdroid_http_requests", "counter", "HTTP requests by host and status.",
+           [({"host": h, "status": s}, n) for h, v in report["http"].items()
+            for s, n in v["status"].items()])
+    family("fdroid_http_bytes", "counter", "HTTP bytes received by host.",
+           [({"host": h}, v["bytes"]) for h, v in report["http"].items()])
+    family("fdroid_http_latency_seconds", "gauge", "HTTP latency quantiles by host.",
+           [({"host": h, "quantile": q}, v[key]) for h, v in report["http"].items()
+            for q, key in (("0.5", "p50"), ("0.95", "p95"), ("1", "max"))])
+    samples = []
+    for key, value in report["counters"].items():
+        name, _, labels = key.partition("{")
+        parsed = dict(p.split("=", 1) for p in labels.rstrip("}").split(",") if "=" in p)
+        samples.append((dict(parsed, counter=name), value))
+    family("fdroid_events", "counter", "Script counters (downloads, prune decisions, ...).", samples)
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+RECORDER = Recorder()
+span = RECORDER.span
+count = RECORDER.count
+http = RECORDER.http
+
+
+def _write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def finish(script: str, directory: Path = METRICS_DIR):
+    """Write the run report of this process; returns its path, None when disabled"""
+    if not ENABLED:
+        return None
+    report = RECORDER.report(script)
+    try:
+        text = json.dumps(report, indent=1)
+        stamp = datetime.fromtimestamp(RECORDER.started, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        _write(directory / "runs" / f"{script}-{stamp}.json", text)
+        _write(directory / f"{script}.json", text)
+        _write(directory / f"{script}.prom", openmetrics(report))
+        runs = sorted((directory / "runs").glob(f"{script}-*.json"))
+        for old in runs[:-KEEP_RUNS] if KEEP_RUNS > 0 else ():
+            old.unlink()
+    except OSError as e:
+        logging.warning(f"Could not write run metrics: {e}")
+        return None
+    logging.info(f"Run metrics written to {directory / (script + '.json')}")
+    return directory / f"{script}.json"
+
+
+# -----------------------------------------
+# CLI
+# -----------------------------------------
+def load(path) -> dict:
+    path = Path(path)
+    if not path.suffix:
+        path = METRICS_DIR / f"{path}.json"
+    report = json.loads(path.read_text())
+    if report.get("version") != REPORT_VERSION:
+        raise SystemExit(f"{path}: unsupported report version {report.get('version')}")
+    return report
+
+
+def show(report: dict, top: int):
+    print(f"{report['script']} run at {report['started']}: {report['seconds']:.2f}s")
+    print("\nSpans:")
+    for name, s in sorted(report["spans"].items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"  {name:<24} {s['seconds']:9.2f}s  x{s['count']:<6} max {s['max']:.2f}s")
+    print(f"\nSlowest apps (of {len(report['apps'])}):")
+    for app, a in sorted(report["apps"].items(), key=lambda kv: -kv[1]["seconds"])[:top]:
+        print(f"  {app:<45} {a['seconds']:8.2f}s  {a['requests']:>4} req  "
+              f"{a['bytes'] / 1e6:8.1f} MB  http {a['http_seconds']:.2f}s")
+    print("\nHosts:")
+    for host, h in report["http"].items():
+        print(f"  {host:<35} {h['requests']:>6} req  {h['bytes'] / 1e6:8.1f} MB  "
+              f"p50 {h['p50'] * 1000:.0f}ms  p95 {h['p95'] * 1000:.0f}ms  max {h['max'] * 1000:.0f}ms")
+    if report["counters"]:
+        print("\nCounters:")
+        for key, value in report["counters"].items():
+            print(f"  {key:<45} {value:g}")
+
+
+def _delta(old: float, new: float) -> str:
+    change = f"{(new - old) / old * 100:+.0f}%" if old else "new"
+    return f"{old:8.2f}s -> {new:8.2f}s  {change}"
+
+
+def compare(old: dict, new: dict, top: int):
+    print(f"{old['script']}: {old['started']} -> {new['started']}")
+    print(f"  {'run':<24} {_delta(old['seconds'], new['seconds'])}")
+    print("\nSpans:")
+    for name in sorted(set(old["spans"]) | set(new["spans"])):
+        o = old["spans"].get(name, {}).get("seconds", 0.0)
+        n = new["spans"].get(name, {}).get("seconds", 0.0)
+        print(f"  {name:<24} {_delta(o, n)}")
+    changes = []
+    for app in set(old["apps"]) | set(new["apps"]):
+        o = old["apps"].get(app, {}).get("seconds", 0.0)
+        n = new["apps"].get(app, {}).get("seconds", 0.0)
+        changes.append((n - o, app, o, n))
+    print(f"\nLargest per-app changes (top {top}):")
+    for diff, app, o, n in sorted(changes, key=lambda c: -abs(c[0]))[:top]:
+        print(f"  {app:<45} {_delta(o, n)}")
+    print("\nHosts:")
+    for host in sorted(set(old["http"]) | set(new["http"])):
+        o, n = old["http"].get(host, {}), new["http"].get(host, {})
+        print(f"  {host:<35} p95 {o.get('p95', 0) * 1000:6.0f}ms -> {n.get('p95', 0) * 1000:6.0f}ms  "
+              f"requests {o.get('requests', 0)} -> {n.get('requests', 0)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and compare run reports")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show_parser = sub.add_parser("show", help="summarise a run report")
+    show_parser.add_argument("report", nargs="?", default="pipeline",
+                             help="report file or script name (default: latest pipeline run)")
+    compare_parser = sub.add_parser("compare", help="compare two run reports")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new", nargs="?", default="pipeline")
+    for p in (show_parser, compare_parser):
+        p.add_argument("--top", type=int, default=10, help="apps to list")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "show":
+            show(load(args.report), args.top)
+        else:
+            compare(load(args.old), load(args.new), args.top)
+    except (OSError, ValueError) as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Single-process pipeline runner for Fury's F-Droid Repository
+
+Runs the repo build as a DAG of stages in one process:
+
+  setup     create apks/<id>/ and sync fdroid/metadata/*.yml    (setup_apps)
+  fetch     newest releases of every app (GraphQL batch + REST)
+  select    best APK asset per release, up to the retention target
+  download  fetch selected assets that are not complete on disk
+  prune     drop unwanted ABIs; archive or delete builds the
+            retention policy and disk budget leave out           (retention)
+  stage     hardlink APKs into fdroid/repo and fdroid/archive    (stage_repo)
+  icons     fetch, render and place app icons                    (icons)
+  index     seed apk cache and index-v2 history, fdroid update,
+            persist both                                         (incremental_index, index_v2)
+  status    docs/app-status.md and app-status.json               (status_engine)
+  lint      fdroid lint, replay of the index-v2 diffs            (fdroid_emulator)
+
+All stages share one Context: the compiled catalog (catalog.py) is loaded
+once, and there is a single GitHubClient (HTTP pool + response cache) and a
+single APK index. Releases are fetched most overdue first according to the
+poll schedule (poll_schedule.py); only plan.py (Phase 1) updates and saves
+it, the pipeline just reads it. A stage starts as soon as the stages it
+depends on have finished, so independent stages (setup, fetch and icons;
+stage and status) run concurrently. Per-stage wall time is reported at the end.
+
+Usage:
+  pipeline.py                      run every stage
+  pipeline.py fetch..prune         run a range of stages (in pipeline order)
+  pipeline.py download.. status    open-ended ranges and single stages mix
+  pipeline.py --list               show stages and their dependencies
+  pipeline.py --app ID fetch..prune  work on some apps only (repeatable); with a
+                                   catalog directory only their files are parsed
+
+Stages outside the selection are assumed to have already run; in-memory
+inputs they would have produced (releases, selections) are computed on demand.
+"""
+
+import sys
+import time
+import logging
+import argparse
+import subprocess
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import icons
+import abi_select
+import metrics
+import setup_apps
+import stage_repo
+import status_engine
+import fdroid_emulator
+import incremental_index
+import index_v2
+import retention
+import update_fdroid_repo
+from catalog import Catalog
+from github_client import GitHubClient, DEFAULT_WORKERS
+from github_graphql import batch_releases
+from poll_schedule import PollSchedule
+from repo_query import RepoQuery
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+FDROID_DIR = ROOT / "fdroid"
+
+
+class Context:
+    """State shared by all stages; expensive values are computed once, on first use"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, only=None):
+        self.workers = workers
+        self.only = only
+        self.apk_index = update_fdroid_repo.APK_INDEX
+        self.failed_apps = {}
+        # what setup, stage and icons changed this run; index is skipped when all are clean
+        self.changes = {}
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _once(self, name, compute):
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._values:
+                self._values[name] = compute()
+            return self._values[name]
+
+    @property
+    def catalog(self) -> Catalog:
+        return self._once("catalog", self._load_catalog)
+
+    @property
+    def repos(self) -> dict:
+        """{app id: owner/repo}, None for entries without a usable GitHub URL"""
+        return self._once("repos", self.catalog.repos)
+
+    @property
+    def client(self) -> GitHubClient:
+        return self._once("client", lambda: GitHubClient(workers=self.workers))
+
+    @property
+    def schedule(self) -> PollSchedule:
+        return self._once("schedule", PollSchedule)
+
+    @property
+    def releases(self) -> dict:
+        return self._once("releases", self._fetch_releases)
+
+    @property
+    def selections(self) -> dict:
+        return self._once("selections", self._select)
+
+    def _load_catalog(self) -> Catalog:
+        apps = update_fdroid_repo.load_apps()
+        if self.only:
+            unknown = [a for a in self.only if apps.get(a) is None]
+            if unknown:
+                raise SystemExit(f"Unknown app: {', '.join(unknown)}")
+            apps = apps.subset(self.only)
+        return apps
+
+    def _fetch_releases(self) -> dict:
+        """{owner/repo: first page of releases}, GraphQL batches then REST for the rest"""
+        order = self.schedule.order(self.repos)
+        repos = list(dict.fromkeys(self.repos[a] for a in order if self.repos[a]))
+        releases = batch_releases(self.client, repos)
+
+        def first_page(item):
+            _, repo = item
+            return self.client.releases(repo)
+
+        # (app id, repo) so failures and metrics are reported per app
+        owners = {}
+        for app_id in order:
+            if self.repos[app_id]:
+                owners.setdefault(self.repos[app_id], app_id)
+        missing = [(owners[r], r) for r in repos if r not in releases]
+        for (_, repo), page in zip(missing, self.map(first_page, missing, "fetch")):
+            if page is not None:
+                releases[repo] = page
+        return releases
+
+    def _select(self) -> dict:
+        """{app id: [(asset, score, abi, published), ...]}"""
+        releases = self.releases
+        apps = self.catalog.apps
+        selected = self.map(lambda app: update_fdroid_repo.select_assets(self.client, app, releases),
+                            apps, "select")
+        return {app.id: s for app, s in zip(apps, selected) if s is not None}
+
+    def map(self, fn, items, stage: str) -> list:
+        """Run fn over items in the worker pool; failures are recorded per app, result None"""
+        def guarded(item):
+            key = getattr(item, "id", item)
+            if isinstance(key, tuple):
+                key = key[0]  # (app id, ...) work items
+            try:
+                with metrics.span(stage, app=key):
+                    return fn(item)
+            except Exception as e:
+                logging.error(f"{stage}: {key}: {e}")
+                with self._lock:
+                    self.failed_apps.setdefault(str(key), stage)
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(guarded, items))
+
+    def close(self):
+        if "client" in self._values:
+            self.client.close()
+        self.apk_index.save()
+        abi_select.save_cache()
+
+
+# -----------------------------------------
+# Stages
+# -----------------------------------------
+def run_setup(ctx: Context):
+    ctx.changes["metadata"] = setup_apps.setup(ctx.catalog)
+
+
+def run_fetch(ctx: Context):
+    logging.info(f"fetch: releases for {len(ctx.releases)}/{len(ctx.repos)} repos")
+
+
+def run_select(ctx: Context):
+    count = sum(len(s) for s in ctx.selections.values())
+    logging.info(f"select: {count} assets for {len(ctx.selections)} apps")
+
+
+def run_download(ctx: Context):
+    ctx.map(lambda item: update_fdroid_repo.download_assets(ctx.client, *item),
+            list(ctx.selections.items()), "download")
+
+
+def run_prune(ctx: Context):
+    apps = ctx.catalog.apps
+    results = ctx.map(update_fdroid_repo.cleanup, apps, "prune")
+    held = {app.id: r for app, r in zip(apps, results) if r is not None}
+    with metrics.span("retention"):
+        changed = retention.finish(apps, ctx.apk_index, held)
+    if changed:
+        # ArchivePolicy is metadata too; only add, so a skipped setup stays unknown
+        ctx.changes.setdefault("metadata", set()).update(changed)
+
+
+def run_stage(ctx: Context):
+    counts = stage_repo.stage(ctx.apk_index)
+    ctx.changes["apks"] = counts["added"] + counts["removed"]
+    logging.info(f"stage: {counts['added']} added, {counts['kept']} unchanged, "
+                 f"{counts['removed']} removed")
+
+
+def run_icons(ctx: Context):
+    counts = icons.IconPipeline(ctx.client).refresh(ctx.catalog)
+    ctx.changes["icons"] = counts["placed"]
+
+
+def run_index(ctx: Context):
+    clean = all(k in ctx.changes and not ctx.changes[k] for k in ("metadata", "apks", "icons"))
+    if clean and (FDROID_DIR / "repo" / "index-v1.json").exists():
+        logging.info("index: no metadata, APK or icon changes, keeping the current index")
+        return
+    if ctx.changes.get("metadata"):
+        logging.info(f"index: metadata changed for {', '.join(sorted(ctx.changes['metadata']))}")
+    with metrics.span("index seed"):
+        incremental_index.seed()
+        index_v2.restore()
+    with metrics.span("fdroid update"):
+        subprocess.run(["fdroid", "update", "--create-metadata", "--delete-unknown"],
+                       cwd=FDROID_DIR, check=True)
+    with metrics.span("index save"):
+        incremental_index.save()
+        index_v2.persist()
+
+
+def run_status(ctx: Context):
+    shipped = RepoQuery.load(apks=ctx.apk_index).shipped()
+    report = status_engine.refresh(ctx.catalog, ctx.client, prefetched=ctx.releases,
+                                   shipped=shipped)
+    status_engine.write_reports(report)
+
+
+def run_lint(ctx: Context):
+    if not fdroid_emulator.lint(FDROID_DIR / "repo" / "index-v1.json", cwd=FDROID_DIR):
+        raise RuntimeError("fdroid lint failed")
+    if (FDROID_DIR / "repo" / "entry.json").exists() and not fdroid_emulator.verify_diffs():
+        raise RuntimeError("index-v2 diffs do not reproduce the current index")
+
+
+# name: (function, dependencies); the order here is the pipeline order
+STAGES = {
+    "setup": (run_setup, []),
+    "fetch": (run_fetch, []),
+    "select": (run_select, ["fetch"]),
+    "download": (run_download, ["select"]),
+    "prune": (run_prune, ["download"]),
+    "stage": (run_stage, ["prune"]),
+    "icons": (run_icons, []),
+    "index": (run_index, ["setup", "stage", "icons"]),
+    "status": (run_status, ["fetch", "prune"]),
+    "lint": (run_lint, ["index"]),
+}
+
+
+def parse_selection(args) -> list:
+    """Expand stage names and a..b / a.. / ..b ranges into pipeline order"""
+    order = list(STAGES)
+    chosen = set()
+    for arg in args or [".."]:
+        if ".." in arg:
+            start, end = arg.split("..", 1)
+            for name in filter(None, (start, end)):
+                if name not in STAGES:
+                    raise SystemExit(f"Unknown stage: {name}")
+            i = order.index(start) if start else 0
+            j = order.index(end) if end else len(order) - 1
+            chosen.update(order[i:j + 1])
+        elif arg in STAGES:
+            chosen.add(arg)
+        else:
+            raise SystemExit(f"Unknown stage: {arg}")
+    return [s for s in order if s in chosen]
+
+
+def run(selected: list, ctx: Context) -> dict:
+    """Run the selected stages as a DAG; returns {stage: (status, seconds)}"""
+    pending = {name: [d for d in STAGES[name][1] if d in selected] for name in selected}
+    results = {}
+
+    def timed(name):
+        start = time.perf_counter()
+        with metrics.span(f"stage {name}"):
+            STAGES[name][0](ctx)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=len(selected) or 1) as pool:
+        running = {}
+        while pending or running:
+            for name, deps in list(pending.items()):
+                if any(results.get(d, ("ok",))[0] != "ok" for d in deps if d in results):
+                    results[name] = ("skipped", 0.0)
+                    del pending[name]
+                elif all(d in results for d in deps):
+                    logging.info(f"==> {name}")
+                    running[pool.submit(timed, name)] = (name, time.perf_counter())
+                    del pending[name]
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, start = running.pop(fut)
+                try:
+                    results[name] = ("ok", fut.result())
+                except BaseException as e:
+                    logging.error(f"Stage {name} failed: {e}")
+                    results[name] = ("failed", time.perf_counter() - start)
+    return results
+
+
+def report(results: dict, total: float):
+    logging.info("Stage timings:")
+    for name in STAGES:
+        if name in results:
+            status, seconds = results[name]
+            logging.info(f"  {name:<9} {seconds:8.2f}s  {status}")
+    logging.info(f"  {'total':<9} {total:8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the repo build as a DAG of stages")
+    parser.add_argument("stages", nargs="*", help="stage names or ranges like fetch..prune")
+    parser.add_argument("--list", action="store_true", help="list stages and exit")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--app", action="append", metavar="ID", help="only work on this app")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (_, deps) in STAGES.items():
+            print(f"{name:<9} after: {', '.join(deps) or '-'}")
+        return
+
+    selected = parse_selection(args.stages)
+    ctx = Context(workers=args.workers, only=args.app)
+    if args.app:
+        ctx.catalog  # reject unknown ids before any stage starts
+    start = time.perf_counter()
+    try:
+        results = run(selected, ctx)
+    finally:
+        ctx.close()
+    report(results, time.perf_counter() - start)
+    metrics.count("failed_apps", len(ctx.failed_apps))
+    metrics.finish("pipeline")
+
+    if ctx.failed_apps:
+        logging.error("Failed apps: " + ", ".join(f"{a} ({s})" for a, s in sorted(ctx.failed_apps.items())))
+    if ctx.failed_apps or any(status != "ok" for status, _ in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Change-detection planner for Fury's F-Droid Repository
+
+Phase 1 runs `plan.py compute`, which fingerprints everything the published
+repo depends on:
+
+  - the release state of every app in the catalog (tag, channel and APK
+    assets of its newest releases, fetched in batched GraphQL queries where
+    possible)
+  - each app's catalog entry and fdroid/metadata/<id>.yml; with apps.d/ the
+    entry digests come from its index, so no per-app file is parsed
+  - global inputs: fdroid/config.yml, the repo icon, requirements.txt and the
+    pipeline scripts themselves
+
+and compares it with the fingerprint published next to the last deployed
+index (<repo_url>/fingerprint.json). The result is written to <output>/:
+
+  fingerprint.json  the new fingerprint, published with the repo by Phase 3/4
+  changes.json      {"changed", "full_rebuild", "added", "removed",
+                     "releases", "metadata", "global", "unresolved", "deferred"}
+
+Releases are only looked up for apps the poll schedule (poll_schedule.py)
+says are due, most overdue first; the others keep their published state and
+are listed as "deferred". --force polls every app.
+
+Later phases run `plan.py gate <dir>`, which prints changed=true|false (also
+to $GITHUB_OUTPUT) and skip their work when nothing changed. The gate only
+needs the standard library. A missing or unreadable manifest counts as
+changed, so the pipeline fails open.
+
+Tuning (environment):
+  FDROID_PREVIOUS_FINGERPRINT  path or URL of the last published fingerprint.json
+                               (default <repo_url>/fingerprint.json, "0" disables)
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import logging
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+METADATA_DIR = ROOT / "fdroid" / "metadata"
+CONFIG_FILE = ROOT / "fdroid" / "config.yml"
+
+FINGERPRINT_VERSION = 1
+PREVIOUS_FINGERPRINT = os.environ.get("FDROID_PREVIOUS_FINGERPRINT", "")
+
+# Inputs that affect every app; a change to any of them rebuilds everything
+GLOBAL_INPUTS = ["fdroid/config.yml", "fdroid/icon.png", "requirements.txt", "scripts/*.py"]
+
+
+def digest(obj) -> str:
+    """Stable sha256 of a JSON-serialisable value or of raw bytes"""
+    if not isinstance(obj, bytes):
+        obj = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.sha256(obj).hexdigest()
+
+
+def file_digest(path: Path):
+    try:
+        return digest(path.read_bytes())
+    except OSError:
+        return None
+
+
+def global_inputs() -> dict:
+    result = {}
+    for pattern in GLOBAL_INPUTS:
+        for path in sorted(ROOT.glob(pattern)):
+            result[str(path.relative_to(ROOT))] = file_digest(path)
+    return result
+
+
+def release_state(releases) -> list:
+    """The parts of a release list that change what gets downloaded"""
+    return [
+        {
+            "tag": r.get("tag_name"),
+            "prerelease": bool(r.get("prerelease")),
+            "apks": sorted((a.get("name"), a.get("size")) for a in r.get("assets", [])
+                           if str(a.get("name", "")).lower().endswith(".apk")),
+        }
+        for r in releases or [] if not r.get("draft")
+    ]
+
+
+def fetch_releases(client, apps, only) -> dict:
+    """{app id: releases or None} for the apps in only, GraphQL batches then REST"""
+    from concurrent.futures import ThreadPoolExecutor
+    from github_client import DEFAULT_WORKERS
+    from github_graphql import batch_releases
+
+    all_repos = apps.repos()
+    repos = {app_id: all_repos[app_id] for app_id in only}
+    prefetched = batch_releases(client, list(repos.values()))
+
+    def lookup(app_id):
+        repo = repos[app_id]
+        if not repo:
+            return None
+        if repo in prefetched:
+            return prefetched[repo]
+        try:
+            return client.releases(repo)
+        except Exception as e:
+            logging.warning(f"{app_id}: release lookup failed: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=DEFAULT_WORKERS) as pool:
+        return dict(zip(repos, pool.map(lookup, repos)))
+
+
+def fingerprint(client, apps, poll, schedule=None) -> dict:
+    """Fingerprint of every app; release state only for the apps in poll"""
+    releases = fetch_releases(client, apps, poll)
+    result = {"version": FINGERPRINT_VERSION, "global": global_inputs(), "apps": {}}
+    for app_id, entry in apps.digests().items():
+        found = releases.get(app_id)
+        if found is not None and schedule is not None:
+            schedule.observe(app_id, found)
+        state = release_state(found) if found is not None else None
+        result["apps"][app_id] = {
+            "release": digest(state) if state is not None else None,
+            "latest": state[0]["tag"] if state else None,
+            "metadata": digest([entry, file_digest(METADATA_DIR / f"{app_id}.yml")]),
+        }
+    return result
+
+
+def load_previous(source: str, client):
+    """Last published fingerprint (path or URL), or None"""
+    try:
+        if source.startswith(("http://", "https://")):
+            r = client.get(source)
+            if r.status_code != 200:
+                logging.info(f"No published fingerprint at {source} (HTTP {r.status_code})")
+                return None
+            data = r.json()
+        else:
+            data = json.loads(Path(source).read_text())
+    except Exception as e:
+        logging.warning(f"Could not read previous fingerprint {source}: {e}")
+        return None
+    return data if data.get("version") == FINGERPRINT_VERSION else None
+
+
+def diff(previous, current: dict, deferred=()) -> dict:
+    """Change manifest between two fingerprints; unresolved and deferred apps keep their old state"""
+    changes = {"added": [], "removed": [], "releases": {}, "metadata": [],
+               "global": [], "unresolved": [], "deferred": []}
+    if previous is None:
+        changes["added"] = sorted(current["apps"])
+        changes["full_rebuild"] = True
+        changes["changed"] = True
+        return changes
+
+    before, after = previous.get("apps", {}), current["apps"]
+    changes["added"] = sorted(set(after) - set(before))
+    changes["removed"] = sorted(set(before) - set(after))
+    for app_id in sorted(set(after) & set(before)):
+        old, new = before[app_id], after[app_id]
+        if app_id in deferred:
+            changes["deferred"].append(app_id)
+            new["release"], new["latest"] = old.get("release"), old.get("latest")
+        elif new["release"] is None:
+            # lookup failed; carry the published state over rather than guessing
+            changes["unresolved"].append(app_id)
+            new["release"], new["latest"] = old.get("release"), old.get("latest")
+        elif new["release"] != old.get("release"):
+            changes["releases"][app_id] = {"from": old.get("latest"), "to": new["latest"]}
+        if new["metadata"] != old.get("metadata"):
+            changes["metadata"].append(app_id)
+
+    old_global, new_global = previous.get("global", {}), current["global"]
+    changes["global"] = sorted(k for k in set(old_global) | set(new_global)
+                               if old_global.get(k) != new_global.get(k))
+    changes["full_rebuild"] = bool(changes["global"])
+    changes["changed"] = bool(changes["added"] or changes["removed"] or changes["releases"]
+                              or changes["metadata"] or changes["global"])
+    return changes
+
+
+def write_output(name: str, value: str):
+    print(f"{name}={value}")
+    path = os.environ.get("GITHUB_OUTPUT")
+    if path:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"{name}={value}\n")
+
+
+def write_json(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, indent=1, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def compute(output: Path, force=False) -> dict:
+    import yaml
+    import catalog
+    from github_client import GitHubClient
+    from poll_schedule import PollSchedule
+
+    try:
+        apps = catalog.load()
+    except catalog.CatalogError as e:
+        logging.error(str(e))
+        sys.exit(1)
+    with open(CONFIG_FILE, "r") as f:
+        repo_url = str((yaml.safe_load(f) or {}).get("repo_url", "")).rstrip("/")
+
+    client = GitHubClient()
+    previous = None
+    if PREVIOUS_FINGERPRINT != "0" and (PREVIOUS_FINGERPRINT or repo_url):
+        previous = load_previous(PREVIOUS_FINGERPRINT or f"{repo_url}/fingerprint.json", client)
+
+    schedule = PollSchedule()
+    ids = apps.ids()
+    if force or previous is None:
+        poll = schedule.order(ids)
+    else:
+        published = previous.get("apps", {})
+        poll = [a for a in ids if a not in published] + schedule.due([a for a in ids if a in published])
+    logging.info(f"Polling {len(poll)}/{len(ids)} apps, {len(ids) - len(poll)} not due yet")
+    current = fingerprint(client, apps, poll, schedule)
+    client.close()
+    schedule.forget_missing(ids)
+    schedule.save()
+
+    changes = diff(previous, current, deferred=set(ids) - set(poll))
+    if force:
+        changes["changed"] = changes["full_rebuild"] = True
+    current["digest"] = digest(current["apps"])
+
+    write_json(output / "fingerprint.json", current)
+    write_json(output / "changes.json", changes)
+    logging.info(f"Plan: {len(changes['added'])} added, {len(changes['removed'])} removed, "
+                 f"{len(changes['releases'])} new releases, {len(changes['metadata'])} metadata, "
+                 f"{len(changes['global'])} global inputs changed, "
+                 f"{len(changes['unresolved'])} unresolved, {len(changes['deferred'])} deferred")
+    for app_id, change in changes["releases"].items():
+        logging.info(f"  {app_id}: {change['from']} -> {change['to']}")
+    write_output("changed", str(changes["changed"]).lower())
+    return changes
+
+
+def gate(directory: Path) -> bool:
+    """Read a change manifest written by compute(); anything unreadable counts as a change"""
+    try:
+        changed = bool(json.loads((directory / "changes.json").read_text())["changed"])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"No usable change manifest in {directory} ({e}), assuming changes")
+        changed = True
+    if not changed:
+        logging.info("Nothing changed since the last published repo")
+    write_output("changed", str(changed).lower())
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("compute", help="fingerprint the current state and write a change manifest")
+    p.add_argument("--output", type=Path, default=ROOT / "plan")
+    p.add_argument("--force", action="store_true", help="mark the plan as changed regardless")
+    p = sub.add_parser("gate", help="print changed=true|false for a manifest directory")
+    p.add_argument("directory", type=Path, nargs="?", default=ROOT / "plan")
+    args = parser.parse_args()
+
+    if args.command == "compute":
+        compute(args.output, args.force)
+    else:
+        gate(args.directory)
+
+
+if __name__ == "__main__":
+    main()
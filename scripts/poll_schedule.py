@@ -0,0 +1,132 @@
+"""
+Adaptive release polling for Fury's F-Droid Repository
+
+Polling every app on every run wastes most of the API quota on projects that
+release once a year. The schedule learns each app's release cadence from the
+publish dates of the releases it has already seen and polls it at a fraction
+of that cadence:
+
+  cadence   median gap between the newest releases
+  expected  the cadence, or half the time since the last release if the
+            project has gone quieter than that; the time since the last
+            release when there is only one; MAX for apps with no releases
+  interval  FACTOR * expected, clamped to [MIN, MAX]
+
+An app is due once its interval has passed since it was last checked. due()
+returns the due apps most overdue first, so the likely-active ones are asked
+first while quota lasts. Apps never checked are always due.
+
+State is kept in .cache/poll-schedule.json.
+
+Tuning (environment):
+  FDROID_POLL_STATE   schedule state file (default .cache/poll-schedule.json)
+  FDROID_POLL_MIN     shortest interval, seconds (default 3600)
+  FDROID_POLL_MAX     longest interval, seconds (default 259200, 3 days)
+  FDROID_POLL_FACTOR  fraction of the expected gap between releases (default 0.1)
+"""
+
+import os
+import json
+import time
+import logging
+import statistics
+import threading
+from pathlib import Path
+from datetime import datetime
+
+ROOT = Path(__file__).resolve().parents[1]
+STATE_FILE = Path(os.environ.get("FDROID_POLL_STATE", ROOT / ".cache" / "poll-schedule.json"))
+MIN_INTERVAL = float(os.environ.get("FDROID_POLL_MIN", "3600"))
+MAX_INTERVAL = float(os.environ.get("FDROID_POLL_MAX", str(3 * 86400)))
+FACTOR = float(os.environ.get("FDROID_POLL_FACTOR", "0.1"))
+
+SCHEDULE_VERSION = 1
+
+
+def published(release: dict):
+    """published_at of a release as a unix timestamp, or None"""
+    value = release.get("published_at") or release.get("created_at")
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def expected_gap(releases, now: float):
+    """Seconds until the next release is likely, from a newest-first release list"""
+    dates = sorted((d for d in map(published, releases or []) if d is not None), reverse=True)
+    if not dates:
+        return None
+    age = max(now - dates[0], 0)
+    gaps = [a - b for a, b in zip(dates, dates[1:]) if a > b]
+    if not gaps:
+        return age
+    return max(statistics.median(gaps), age / 2)
+
+
+class PollSchedule:
+    """Per-app poll intervals learned from release history"""
+
+    def __init__(self, path=STATE_FILE, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 factor=FACTOR):
+        self.path = Path(path)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.apps = {}
+        self._lock = threading.Lock()
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get("version") == SCHEDULE_VERSION:
+                self.apps = data.get("apps", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def interval(self, releases, now: float) -> float:
+        gap = expected_gap(releases, now)
+        if gap is None:
+            return self.max_interval
+        return min(max(self.factor * gap, self.min_interval), self.max_interval)
+
+    def priority(self, app_id: str, now: float) -> float:
+        """How overdue an app is: elapsed / interval (inf if never checked)"""
+        state = self.apps.get(app_id)
+        if not state:
+            return float("inf")
+        return (now - state["checked"]) / max(state["interval"], 1)
+
+    def order(self, app_ids, now=None) -> list:
+        """app_ids sorted most overdue first"""
+        now = time.time() if now is None else now
+        return sorted(app_ids, key=lambda a: self.priority(a, now), reverse=True)
+
+    def due(self, app_ids, now=None) -> list:
+        """The apps whose interval has passed, most overdue first"""
+        now = time.time() if now is None else now
+        return [a for a in self.order(app_ids, now) if self.priority(a, now) >= 1]
+
+    def observe(self, app_id: str, releases, now=None):
+        """Record a completed check of app_id that returned releases (newest first)"""
+        now = time.time() if now is None else now
+        latest = next((r.get("tag_name") for r in releases or [] if not r.get("draft")), None)
+        with self._lock:
+            self.apps[app_id] = {"checked": now, "interval": self.interval(releases, now),
+                                 "latest": latest}
+
+    def forget_missing(self, app_ids):
+        keep = set(app_ids)
+        with self._lock:
+            self.apps = {k: v for k, v in self.apps.items() if k in keep}
+
+    def save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with self._lock:
+                tmp.write_text(json.dumps({"version": SCHEDULE_VERSION, "apps": self.apps},
+                                          indent=1, sort_keys=True))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save poll schedule: {e}")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Deploy tree manifest for Fury's F-Droid Repository
+
+Walks the deploy tree (public/ in Phase 5) and writes publish-manifest.json
+at its top: size and sha256 of every file. sync_plan.py compares the next
+build with the live copy of it, so only changed files travel between the
+phases, and diff() turns two manifests into the exact added/changed/removed
+list.
+
+The site is served by GitHub Pages, which compresses responses itself and
+never serves .gz/.br siblings as Content-Encoding variants, so none are
+written. File names are kept as they are: F-Droid clients fetch
+index-v1.jar, entry.jar and friends by fixed name.
+
+Hashes are kept in .cache/publish/manifest.json with each file's size and
+mtime, so a file whose stat did not change since the last publish is not
+hashed again.
+
+Usage:
+  publish.py [TREE] [--changes FILE]   (default public/; FILE gets the diff
+                                        against the previous publish)
+
+Tuning (environment):
+  FDROID_PUBLISH_CACHE      last manifest with stat data (default .cache/publish)
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_index import sha256sum
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_TREE = ROOT / "public"
+CACHE_DIR = Path(os.environ.get("FDROID_PUBLISH_CACHE", ROOT / ".cache" / "publish"))
+LAST_MANIFEST = CACHE_DIR / "manifest.json"
+
+MANIFEST_NAME = "publish-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _load(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(data, indent=1, sort_keys=True) + "\n")
+    os.replace(tmp, path)
+
+
+def scan(tree: Path, previous: dict) -> dict:
+    """{relative path: {"size", "mtime_ns", "sha256"}}; hashes reused for unchanged stat"""
+    names = set()
+    for dirpath, dirnames, filenames in os.walk(tree):
+        prefix = Path(dirpath).relative_to(tree).as_posix()
+        names.update(name if prefix == "." else f"{prefix}/{name}"
+                     for name in filenames if not name.startswith("."))
+    names.discard(MANIFEST_NAME)
+    stats = {}
+    for rel in names:
+        st = (tree / rel).stat()
+        stats[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def digest(rel):
+        old = previous.get(rel) or {}
+        st = stats[rel]
+        if old.get("size") == st["size"] and old.get("mtime_ns") == st["mtime_ns"] and old.get("sha256"):
+            return old["sha256"]
+        return sha256sum(tree / rel)
+
+    names = sorted(stats)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for rel, sha in zip(names, pool.map(digest, names)):
+            stats[rel]["sha256"] = sha
+    return stats
+
+
+def publish(tree: Path = DEFAULT_TREE) -> dict:
+    """Write tree's manifest; returns it"""
+    previous = _load(LAST_MANIFEST).get("files", {})
+    files = scan(tree, previous)
+    manifest = {"version": MANIFEST_VERSION,
+                "generated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "files": files}
+    _write_json(LAST_MANIFEST, manifest)
+    _write_json(tree / MANIFEST_NAME, public_manifest(manifest))
+
+    logging.info(f"Published {len(files)} files, "
+                 f"{sum(e['size'] for e in files.values()) / 1e6:.1f} MB")
+    return manifest
+
+
+def public_manifest(manifest: dict) -> dict:
+    """The manifest without local stat data, as written into the tree"""
+    files = {rel: {k: v for k, v in e.items() if k != "mtime_ns"}
+             for rel, e in manifest["files"].items()}
+    return dict(manifest, files=files)
+
+
+def flatten(manifest: dict) -> dict:
+    """{path: sha256} for every file in a manifest"""
+    return {rel: entry["sha256"] for rel, entry in (manifest or {}).get("files", {}).items()}
+
+
+def diff(old: dict, new: dict) -> dict:
+    """{"added", "changed", "removed"}: sorted paths between two manifests"""
+    a, b = flatten(old), flatten(new)
+    return {"added": sorted(p for p in b if p not in a),
+            "changed": sorted(p for p in b if p in a and a[p] != b[p]),
+            "removed": sorted(p for p in a if p not in b)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the deploy tree's content-hash manifest")
+    parser.add_argument("tree", nargs="?", type=Path, default=DEFAULT_TREE)
+    parser.add_argument("--changes", type=Path,
+                        help="write the added/changed/removed paths since the last publish here")
+    args = parser.parse_args()
+    if not args.tree.is_dir():
+        logging.error(f"{args.tree} is not a directory")
+        sys.exit(1)
+    previous = _load(LAST_MANIFEST)
+    changes = diff(previous, publish(args.tree))
+    logging.info(f"Since last publish: {len(changes['added'])} added, "
+                 f"{len(changes['changed'])} changed, {len(changes['removed'])} removed")
+    if args.changes:
+        _write_json(args.changes, changes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+GitHub rate-limit tracking for Fury's F-Droid Repository
+
+Every API response carries X-RateLimit-Limit/Remaining/Reset/Resource. The
+RateLimiter keeps one token bucket per resource (core, graphql, search, ...)
+filled from those headers: each request takes a token before it is sent,
+and the bucket is re-synced from the headers of every response (a new Reset
+value starts a new window). When a bucket is down to the reserve, callers
+wait for the reset instead of burning the rest of the quota, or get
+RateLimitExceeded if the reset is further away than they may wait.
+
+backoff() decides how long to wait after a rejected request:
+
+  403/429 with X-RateLimit-Remaining: 0   until X-RateLimit-Reset
+  403/429 with Retry-After                 the given number of seconds
+  429 or a secondary rate limit 403        1, 2, 4 ... minutes (GitHub asks for
+                                           at least a minute between retries)
+
+Tuning (environment):
+  FDROID_RATE_RESERVE   requests left untouched in each bucket (default 50)
+  FDROID_RATE_MAX_WAIT  longest wait for a reset or retry, seconds (default 900)
+  FDROID_RATE_RETRIES   retries of a rate-limited request (default 3)
+"""
+
+import os
+import time
+import logging
+import threading
+
+RESERVE = int(os.environ.get("FDROID_RATE_RESERVE", "50"))
+MAX_WAIT = float(os.environ.get("FDROID_RATE_MAX_WAIT", "900"))
+RETRIES = int(os.environ.get("FDROID_RATE_RETRIES", "3"))
+
+SECONDARY_BACKOFF = 60
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, resource: str, reset: float):
+        self.resource = resource
+        self.reset = reset
+        super().__init__(f"GitHub {resource} rate limit exhausted until "
+                         f"{time.strftime('%H:%M:%S', time.localtime(reset))}")
+
+
+def resource_for(path: str) -> str:
+    """Rate-limit resource a request to this API path is counted against"""
+    if path.rstrip("/").endswith("/graphql"):
+        return "graphql"
+    if "/search/" in path:
+        return "search"
+    return "core"
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Bucket:
+    __slots__ = ("limit", "remaining", "reset")
+
+    def __init__(self, limit: int, remaining: int, reset: float):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+
+
+class RateLimiter:
+    """Token buckets per rate-limit resource; safe to share between threads"""
+
+    def __init__(self, reserve=RESERVE, max_wait=MAX_WAIT, clock=time.time, sleep=time.sleep):
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, resource: str = "core"):
+        """Take a token, waiting for the window to reset when the bucket is at the reserve"""
+        while True:
+            with self._lock:
+                bucket = self.buckets.get(resource)
+                if bucket is None:
+                    return  # nothing known yet; the first response fills the bucket
+                now = self.clock()
+                if bucket.reset <= now:
+                    bucket.remaining = bucket.limit
+                if bucket.remaining > self.reserve:
+                    bucket.remaining -= 1
+                    return
+                wait = bucket.reset - now + 1
+                reset = bucket.reset
+            if wait > self.max_wait:
+                raise RateLimitExceeded(resource, reset)
+            logging.warning(f"GitHub {resource} rate limit at {self.reserve} requests left, "
+                            f"waiting {wait:.0f}s for the reset")
+            self.pause(wait)
+
+    def update(self, headers) -> str:
+        """Sync the bucket of the response's resource from its X-RateLimit-* headers"""
+        resource = headers.get("x-ratelimit-resource") or "core"
+        limit = _int(headers.get("x-ratelimit-limit"))
+        remaining = _int(headers.get("x-ratelimit-remaining"))
+        reset = _int(headers.get("x-ratelimit-reset"))
+        if limit is None or remaining is None or reset is None:
+            return resource
+        with self._lock:
+            bucket = self.buckets.get(resource)
+            if bucket is None or reset > bucket.reset:
+                self.buckets[resource] = Bucket(limit, remaining, reset)
+            else:
+                # requests still in flight already took their token locally
+                bucket.limit = limit
+                bucket.remaining = min(bucket.remaining, remaining)
+        return resource
+
+    def backoff(self, response, attempt: int):
+        """Seconds to wait before retrying a rate-limited response, None if it was not one"""
+        if response.status_code not in (403, 429):
+            return None
+        headers = response.headers
+        retry_after = _int(headers.get("retry-after"))
+        if retry_after is not None:
+            return max(retry_after, 1)
+        if headers.get("x-ratelimit-remaining") == "0":
+            reset = _int(headers.get("x-ratelimit-reset"))
+            if reset is not None:
+                return max(reset - self.clock(), 0) + 1
+        if response.status_code == 429 or "secondary rate limit" in (response.text or "").lower():
+            return SECONDARY_BACKOFF * 2 ** attempt
+        return None  # a plain 403: permissions, not rate limiting
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.waited += seconds
+        self.sleep(seconds)
+
+    def report(self):
+        now = self.clock()
+        for resource, bucket in sorted(self.buckets.items()):
+            logging.info(f"GitHub {resource} rate limit: {bucket.remaining}/{bucket.limit} left, "
+                         f"resets in {max(bucket.reset - now, 0) / 60:.0f} min")
+        if self.waited:
+            logging.info(f"Waited {self.waited:.0f}s for rate limits")
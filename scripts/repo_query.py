@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Offline queries against the generated repo for Fury's F-Droid Repository
+
+Loads fdroid/repo/index-v1.json and the APK index (apk_index.py) into compact
+Package/Build records with __slots__, merged per package: builds in the
+published index plus APKs downloaded since the last index build. The compiled
+form is pickled to .cache/repo-query.pickle keyed by the size and mtime of
+both inputs, so repeated queries skip the JSON parse.
+
+Questions answered in memory, without network access:
+
+  versions       current versionCode (and versionName) per package
+  stale DAYS     packages whose newest build is older than DAYS days
+  behind         upstream tag (from docs/app-status.json) vs shipped version
+
+Usage:
+  repo_query.py versions
+  repo_query.py stale 90
+  repo_query.py behind
+
+Tuning (environment):
+  FDROID_REPO_INDEX    index to read (default fdroid/repo/index-v1.json)
+  FDROID_QUERY_CACHE   compiled cache file (default .cache/repo-query.pickle, "0" disables)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import pickle
+import logging
+import argparse
+from pathlib import Path
+
+import apk_index
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+INDEX_FILE = Path(os.environ.get("FDROID_REPO_INDEX", ROOT / "fdroid" / "repo" / "index-v1.json"))
+CACHE_FILE = os.environ.get("FDROID_QUERY_CACHE", str(ROOT / ".cache" / "repo-query.pickle"))
+STATUS_JSON = ROOT / "docs" / "app-status.json"
+
+# Bump when Package/Build change shape so stale pickles are rebuilt
+QUERY_VERSION = 1
+
+
+class Build:
+    """One APK of a package, from the published index or only downloaded so far"""
+
+    __slots__ = ("version_code", "version_name", "added", "apk_name", "size", "min_sdk", "published")
+
+    def __init__(self, version_code, version_name, added, apk_name, size, min_sdk, published):
+        self.version_code = version_code
+        self.version_name = version_name
+        self.added = added
+        self.apk_name = apk_name
+        self.size = size
+        self.min_sdk = min_sdk
+        self.published = published
+
+    def __getstate__(self):
+        return tuple(getattr(self, s) for s in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+
+class Package:
+    """A package and its builds, newest versionCode first"""
+
+    __slots__ = ("id", "name", "last_updated", "builds")
+
+    def __init__(self, package_id, name, last_updated, builds):
+        self.id = package_id
+        self.name = name
+        self.last_updated = last_updated
+        self.builds = tuple(sorted(builds, key=lambda b: b.version_code, reverse=True))
+
+    @property
+    def current(self):
+        return self.builds[0] if self.builds else None
+
+    def __getstate__(self):
+        return (self.id, self.name, self.last_updated, self.builds)
+
+    def __setstate__(self, state):
+        self.id, self.name, self.last_updated, self.builds = state
+
+
+def _stamp(path: Path):
+    try:
+        st = path.stat()
+        return (str(path), st.st_size, st.st_mtime_ns)
+    except OSError:
+        return (str(path), None, None)
+
+
+def compile_packages(index_file: Path, apks: apk_index.ApkIndex) -> dict:
+    """{package id: Package} from index-v1.json plus APKs not yet in it"""
+    try:
+        index = json.loads(index_file.read_text())
+    except (OSError, ValueError) as e:
+        logging.warning(f"No usable {index_file.name} ({e}), using downloaded APKs only")
+        index = {}
+
+    names, updated, builds = {}, {}, {}
+    for app in index.get("apps", []):
+        names[app["packageName"]] = app.get("name") or (app.get("localized", {})
+                                                         .get("en-US", {}).get("name"))
+        if app.get("lastUpdated"):
+            updated[app["packageName"]] = app["lastUpdated"] / 1000
+    for package_id, versions in index.get("packages", {}).items():
+        builds[package_id] = {
+            v["versionCode"]: Build(v["versionCode"], v.get("versionName"),
+                                    v["added"] / 1000 if v.get("added") else None,
+                                    v.get("apkName"), v.get("size"), v.get("minSdkVersion"), True)
+            for v in versions
+        }
+
+    for package_id, entries in apks.packages().items():
+        known = builds.setdefault(package_id, {})
+        for e in entries:
+            if e["versionCode"] not in known:
+                known[e["versionCode"]] = Build(e["versionCode"], e.get("versionName"),
+                                                e["mtime_ns"] / 1e9, Path(e["path"]).name,
+                                                e.get("size"), e.get("minSdk"), False)
+
+    packages = {}
+    for package_id, by_code in builds.items():
+        newest = max((b.added or 0 for b in by_code.values()), default=0) or None
+        packages[package_id] = Package(package_id, names.get(package_id),
+                                       updated.get(package_id, newest), by_code.values())
+    return packages
+
+
+class RepoQuery:
+    """In-memory view of the published repo and downloaded APKs"""
+
+    def __init__(self, packages: dict):
+        self.packages = packages
+
+    @classmethod
+    def load(cls, index_file=INDEX_FILE, apks=None, cache_file=CACHE_FILE):
+        """Query view; the pickle cache is only used when reading the APK index from disk"""
+        index_file = Path(index_file)
+        cache = Path(cache_file) if cache_file and cache_file != "0" and apks is None else None
+        key = (QUERY_VERSION, _stamp(index_file), _stamp(apk_index.DEFAULT_PATH))
+        if cache is not None:
+            try:
+                with open(cache, "rb") as f:
+                    cached_key, packages = pickle.load(f)
+                if cached_key == key:
+                    return cls(packages)
+            except Exception:
+                pass
+
+        packages = compile_packages(index_file, apks if apks is not None else apk_index.ApkIndex())
+        if cache is not None:
+            try:
+                cache.parent.mkdir(parents=True, exist_ok=True)
+                tmp = cache.with_suffix(".tmp")
+                with open(tmp, "wb") as f:
+                    pickle.dump((key, packages), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, cache)
+            except OSError as e:
+                logging.debug(f"Could not write query cache: {e}")
+        return cls(packages)
+
+    def current_versions(self) -> dict:
+        """{package id: (versionCode, versionName)} of the newest build"""
+        return {p.id: (p.current.version_code, p.current.version_name)
+                for p in self.packages.values() if p.current}
+
+    def shipped(self) -> dict:
+        """{package id: versionName} of the newest build, for status reports"""
+        return {package_id: name for package_id, (_, name) in self.current_versions().items()}
+
+    def stale(self, days: float, now=None) -> list:
+        """[(package id, last updated)] not updated in days, oldest first"""
+        now = time.time() if now is None else now
+        cutoff = now - days * 86400
+        found = [(p.id, p.last_updated) for p in self.packages.values()
+                 if p.last_updated is not None and p.last_updated < cutoff]
+        return sorted(found, key=lambda item: item[1])
+
+    def behind(self, upstream: dict) -> list:
+        """[(package id, upstream tag, shipped versionName)] where the tag is not shipped"""
+        result = []
+        for package_id, tag in sorted(upstream.items()):
+            package = self.packages.get(package_id)
+            shipped = package.current.version_name if package and package.current else None
+            if tag and not (package and any(tag_matches(tag, b.version_name) for b in package.builds)):
+                result.append((package_id, tag, shipped))
+        return result
+
+
+def normalize_version(value) -> str:
+    """Compare-friendly form of a tag or versionName: lower case, no v/release prefixes"""
+    value = str(value or "").strip().lower()
+    value = re.sub(r"^(release[-_ ]?|version[-_ ]?)", "", value)
+    return value[1:] if re.match(r"v\d", value) else value
+
+
+def tag_matches(tag, version_name) -> bool:
+    """Whether a release tag names this versionName (v1.2.3 ~ 1.2.3, 1.2.3-r1 ~ 1.2.3)"""
+    tag, name = normalize_version(tag), normalize_version(version_name)
+    if not tag or not name:
+        return False
+    return tag == name or tag.startswith(name + "-") or name.startswith(tag + "-") \
+        or name.startswith(tag + "+") or name.startswith(tag + " ")
+
+
+def upstream_tags(path: Path = STATUS_JSON) -> dict:
+    """{package id: latest upstream tag} from the last status report"""
+    try:
+        apps = json.loads(path.read_text()).get("apps", {})
+    except (OSError, ValueError):
+        return {}
+    return {package_id: e.get("latest") for package_id, e in apps.items()}
+
+
+def _day(ts) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts)) if ts else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline queries against the generated repo")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("versions", help="current versionCode per package")
+    p = sub.add_parser("stale", help="packages not updated in DAYS days")
+    p.add_argument("days", type=float)
+    sub.add_parser("behind", help="upstream tag vs shipped version (from docs/app-status.json)")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    query = RepoQuery.load()
+    if args.command == "versions":
+        result = {k: {"versionCode": c, "versionName": n}
+                  for k, (c, n) in sorted(query.current_versions().items())}
+        rows = [f"{k:<45} {v['versionCode']:>12}  {v['versionName']}" for k, v in result.items()]
+    elif args.command == "stale":
+        found = query.stale(args.days)
+        result = {k: _day(ts) for k, ts in found}
+        rows = [f"{k:<45} {day}" for k, day in result.items()]
+    else:
+        upstream = upstream_tags()
+        if not upstream:
+            logging.error(f"No upstream tags in {STATUS_JSON}, run status_engine.py first")
+            sys.exit(1)
+        found = query.behind(upstream)
+        result = {k: {"upstream": tag, "shipped": shipped} for k, tag, shipped in found}
+        rows = [f"{k:<45} {v['upstream']:<20} shipped {v['shipped'] or '-'}"
+                for k, v in result.items()]
+
+    if args.json:
+        print(json.dumps(result, indent=1))
+    else:
+        print("\n".join(rows) if rows else "(none)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+APK retention for Fury's F-Droid Repository
+
+Decides which downloaded builds stay in the repo, which move to the archive
+repo and which are deleted. Per app (apps.yaml, all optional):
+
+  fdroid:
+    archive: true          evicted builds go to the archive instead of away
+    retention:
+      keep: 3              builds in the repo (default 2, KEEP_STABLE or
+                           KEEP_PRERELEASE by the app's channel)
+      max_age_days: 365    older builds leave the repo
+      max_bytes: 300M      total size of the app's repo builds
+      archive_keep: 5      builds kept in the archive (FDROID_ARCHIVE_KEEP)
+
+An app follows one channel (select_assets() skips releases of the other), so
+keep counts every build in its directory; the old prune() kept 2 stable and 2
+prerelease builds, a split only directories mixing both channels ever saw.
+An app's newest build always stays. Builds are evicted oldest versionCode
+first, so the repo holds an app's newest N builds and the archive the ones
+before them, which is exactly the split fdroid update's archive_old_apks()
+makes for ArchivePolicy: N. archive_older in fdroid/config.yml is non-zero
+only so fdroid builds the archive repo, so ArchivePolicy: N is written into
+the metadata of archive apps, and of other apps only when they keep more than
+archive_older builds (fdroid would move the extra ones); everywhere else the
+field is dropped. Either way fdroid never moves an APK on its own.
+select_assets() asks admit() before taking a release, so nothing retention
+would evict is downloaded.
+
+Archived builds live in apks-archive/<id>/ and are staged into fdroid/archive/
+by stage_repo.py. Age is the release's published_at, which download_assets()
+stamps on the APK as its mtime.
+
+With FDROID_DISK_BUDGET set, apks/ and the archive together are kept under it:
+archived builds go first, then builds that are not an app's newest, each time
+picking the largest size x age. Builds evicted from the repo for the budget
+are remembered in .cache/retention.json so they are not downloaded again, and
+are let back in once there is room for them.
+
+Usage:
+  retention.py [--budget 4G]    apply the policy to apks/ as it is on disk
+
+Tuning (environment):
+  FDROID_ARCHIVE_DIR     archived builds (default apks-archive in the repo root)
+  FDROID_ARCHIVE_KEEP    default archive_keep (default 5)
+  FDROID_DISK_BUDGET     size cap for apks/ plus the archive, e.g. 4G (default: none)
+  FDROID_RETENTION_STATE budget eviction record (default .cache/retention.json)
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+import yaml
+
+import catalog
+import metrics
+from catalog import SafeLoader, parse_size
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+APKS_DIR = ROOT / "apks"
+ARCHIVE_DIR = Path(os.environ.get("FDROID_ARCHIVE_DIR", ROOT / "apks-archive"))
+METADATA_DIR = ROOT / "fdroid" / "metadata"
+CONFIG_FILE = ROOT / "fdroid" / "config.yml"
+STATE_FILE = Path(os.environ.get("FDROID_RETENTION_STATE", ROOT / ".cache" / "retention.json"))
+DISK_BUDGET = parse_size(os.environ.get("FDROID_DISK_BUDGET"))
+
+DAY = 86400
+FDROID_ARCHIVE_OLDER = 3  # fdroidserver's default when config.yml sets none
+
+_state = None
+_state_lock = threading.Lock()
+
+
+class Build:
+    """One APK on disk, in the repo or the archive"""
+
+    __slots__ = ("path", "app_id", "version", "size", "released", "archived")
+
+    def __init__(self, path: Path, app_id: str, version: int, size: int, released: float,
+                 archived: bool):
+        self.path = path
+        self.app_id = app_id
+        self.version = version
+        self.size = size
+        self.released = released
+        self.archived = archived
+
+    def score(self, now: float) -> float:
+        """Eviction priority under the disk budget: big and old first"""
+        return self.size * (max(0.0, now - self.released) / DAY + 1)
+
+    def __repr__(self):
+        return f"Build({self.path.name!r}, {self.version}, archived={self.archived})"
+
+
+def admit(app, kept: int, kept_bytes: int, size: int, released, now=None) -> bool:
+    """Whether a build goes into the repo after kept newer ones totalling kept_bytes"""
+    if kept >= app.keep:
+        return False
+    if kept == 0:
+        return True  # the newest build always stays
+    now = now or time.time()
+    if app.max_age_days and released and now - released > app.max_age_days * DAY:
+        return False
+    if app.max_bytes and kept_bytes + (size or 0) > app.max_bytes:
+        return False
+    return True
+
+
+def builds(directory: Path, app_id: str, index, archived=False) -> list:
+    """Builds in directory, newest versionCode first"""
+    found = []
+    for apk in directory.glob("*.apk"):
+        st = apk.stat()
+        found.append(Build(apk, app_id, index.get(apk)["versionCode"], st.st_size, st.st_mtime,
+                           archived))
+    found.sort(key=lambda b: b.version, reverse=True)
+    return found
+
+
+# -----------------------------------------
+# Budget eviction record
+# -----------------------------------------
+def load_state() -> dict:
+    """{"evicted": {app id: {apk name: size}}}, read once per process"""
+    global _state
+    with _state_lock:
+        if _state is None:
+            try:
+                _state = json.loads(STATE_FILE.read_text())
+            except (OSError, ValueError):
+                _state = {}
+            _state.setdefault("evicted", {})
+        return _state
+
+
+def save_state():
+    state = load_state()
+    with _state_lock:
+        state["evicted"] = {k: v for k, v in state["evicted"].items() if v}
+        STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = STATE_FILE.with_name(f".{STATE_FILE.name}.tmp")
+        tmp.write_text(json.dumps(state, indent=1, sort_keys=True))
+        os.replace(tmp, STATE_FILE)
+
+
+def evicted(app_id: str) -> set:
+    """Asset names the disk budget pushed out of app_id's repo"""
+    return set(load_state()["evicted"].get(app_id, {}))
+
+
+# -----------------------------------------
+# Per-app policy
+# -----------------------------------------
+def _remove(build: Build, index, reason: str):
+    logging.info(f"Removing {build.path.name} ({reason})")
+    metrics.count("pruned", reason=reason)
+    build.path.unlink()
+    index.forget(build.path)
+
+
+def _archive(build: Build, index, reason: str):
+    target = ARCHIVE_DIR / build.app_id / build.path.name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    logging.info(f"Archiving {build.path.name} ({reason})")
+    metrics.count("archived", reason=reason)
+    os.replace(build.path, target)
+    index.forget(build.path)
+
+
+def apply(app, index, now=None) -> dict:
+    """Enforce app's policy on its repo and archive builds; returns what is left"""
+    now = now or time.time()
+    repo = builds(APKS_DIR / app.id, app.id, index)
+    kept, kept_bytes, closed = [], 0, False
+    for build in repo:
+        if build.version < 0:
+            _remove(build, index, "invalid")
+            continue
+        if not closed and admit(app, len(kept), kept_bytes, build.size, build.released, now):
+            kept.append(build)
+            kept_bytes += build.size
+            continue
+        # everything older than the first build that is not admitted leaves too
+        closed = True
+        reason = ("count" if len(kept) >= app.keep else
+                  "age" if app.max_age_days and now - build.released > app.max_age_days * DAY else
+                  "bytes")
+        if app.archive:
+            _archive(build, index, reason)
+        else:
+            _remove(build, index, reason)
+    archive = builds(ARCHIVE_DIR / app.id, app.id, index, archived=True)
+    return {"repo": kept, "archive": _trim_archive(app, archive, kept, index)}
+
+
+def _trim_archive(app, archive: list, kept: list, index) -> list:
+    """Drop archived builds that are off, duplicated in the repo or past archive_keep"""
+    lowest = min((b.version for b in kept), default=None)
+    names = {b.path.name for b in kept}
+    left = []
+    for build in archive:
+        if not app.archive:
+            _remove(build, index, "archive-off")
+        elif build.version < 0 or build.path.name in names or (
+                lowest is not None and build.version >= lowest):
+            # back in the repo (or newer than it), and fdroid would move it there
+            _remove(build, index, "archive-duplicate")
+        else:
+            left.append(build)
+    for build in left[app.archive_keep:]:
+        _remove(build, index, "archive-count")
+    return left[:app.archive_keep]
+
+
+# -----------------------------------------
+# Global budget
+# -----------------------------------------
+def enforce_budget(held: dict, index, budget=DISK_BUDGET, now=None) -> int:
+    """Evict from {app id: apply() result} until the total fits budget; returns bytes freed"""
+    if not budget:
+        return 0
+    now = now or time.time()
+    state = load_state()["evicted"]
+    total = sum(b.size for h in held.values() for b in h["repo"] + h["archive"])
+    freed = 0
+
+    if total <= budget:
+        # let earlier budget evictions back in (downloaded next run) while they fit
+        room = budget - total
+        for app_id, names in state.items():
+            for name, size in sorted(names.items(), key=lambda item: item[1]):
+                if size <= room:
+                    room -= size
+                    del names[name]
+        return 0
+
+    # archived builds first, each app's oldest first; then repo builds except the newest
+    for tier in ("archive", "repo"):
+        queue = []
+        for app_id, h in held.items():
+            stack = h[tier][1:] if tier == "repo" else list(h[tier])
+            if stack:
+                heapq.heappush(queue, (-stack[-1].score(now), app_id, stack))
+        while queue and total > budget:
+            _, app_id, stack = heapq.heappop(queue)
+            build = stack.pop()
+            _remove(build, index, f"budget-{tier}")
+            h = held[app_id]
+            h[tier].remove(build)
+            total -= build.size
+            freed += build.size
+            if tier == "repo":
+                state.setdefault(app_id, {})[build.path.name] = build.size
+            if stack:
+                heapq.heappush(queue, (-stack[-1].score(now), app_id, stack))
+    if total > budget:
+        logging.warning(f"APKs use {total / 1e6:.0f} MB even with only the newest build per app, "
+                        f"over the {budget / 1e6:.1f} MB budget")
+    logging.info(f"Disk budget: freed {freed / 1e6:.1f} MB, {total / 1e6:.1f} MB "
+                 f"of {budget / 1e6:.1f} MB in use")
+    return freed
+
+
+# -----------------------------------------
+# fdroid metadata
+# -----------------------------------------
+def archive_older() -> int:
+    """archive_older from fdroid/config.yml, the ArchivePolicy of apps without one"""
+    try:
+        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+            return int((yaml.safe_load(f) or {}).get("archive_older", FDROID_ARCHIVE_OLDER))
+    except (OSError, ValueError, TypeError, yaml.YAMLError):
+        return FDROID_ARCHIVE_OLDER
+
+
+def archive_policy(app, kept: int, default: int):
+    """The ArchivePolicy app needs with kept repo builds, or None to leave it unset"""
+    if not kept:
+        return None  # nothing to split; ArchivePolicy: 0 would only be reported by fdroid
+    if app.archive or kept > default:
+        return kept
+    return None
+
+
+def set_archive_policy(app_id: str, keep) -> bool:
+    """Write ArchivePolicy: keep (None: drop it) into fdroid/metadata/<id>.yml; True if it changed"""
+    metadata_file = METADATA_DIR / f"{app_id}.yml"
+    if not metadata_file.exists():
+        return False
+    with open(metadata_file, "r") as f:
+        current = yaml.load(f, Loader=SafeLoader) or {}
+    if current.get("ArchivePolicy") == keep:
+        return False
+    metadata = dict(current, ArchivePolicy=keep)
+    if keep is None:
+        del metadata["ArchivePolicy"]
+    tmp = metadata_file.with_name(f".{metadata_file.name}.tmp")
+    with open(tmp, "w") as f:
+        yaml.dump(metadata, f, sort_keys=False, allow_unicode=True)
+    os.replace(tmp, metadata_file)
+    return True
+
+
+def finish(apps, index, held=None, budget=DISK_BUDGET) -> set:
+    """After every app went through apply(): disk budget, then ArchivePolicy where needed
+
+    held is {app id: apply() result}; everything else on disk (apps not in it,
+    other apps when working on a subset) is read as it is, since the budget
+    covers all of it. Returns the ids whose metadata changed.
+    """
+    held = dict(held or {})
+    on_disk = {entry.name for directory in (APKS_DIR, ARCHIVE_DIR) if directory.is_dir()
+               for entry in os.scandir(directory) if entry.is_dir() and entry.name[0] != "."}
+    for app_id in on_disk.union(app.id for app in apps) - set(held):
+        held[app_id] = {"repo": builds(APKS_DIR / app_id, app_id, index),
+                        "archive": builds(ARCHIVE_DIR / app_id, app_id, index, archived=True)}
+    enforce_budget(held, index, budget)
+    save_state()
+
+    default = archive_older()
+    changed = {app.id for app in apps
+               if set_archive_policy(app.id, archive_policy(app, len(held[app.id]["repo"]), default))}
+    if changed:
+        metrics.count("archive_policy_written", len(changed))
+    repo = sum(b.size for h in held.values() for b in h["repo"])
+    archive = sum(b.size for h in held.values() for b in h["archive"])
+    metrics.count("repo_bytes", repo)
+    metrics.count("archive_bytes", archive)
+    logging.info(f"Retention: {repo / 1e6:.1f} MB in the repo, {archive / 1e6:.1f} MB archived")
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the APK retention policy")
+    parser.add_argument("--budget", help="disk budget, overrides FDROID_DISK_BUDGET")
+    args = parser.parse_args()
+    from apk_index import ApkIndex
+    try:
+        apps = catalog.load()
+    except catalog.CatalogError as e:
+        logging.error(f"{e}. Cannot continue.")
+        sys.exit(1)
+    index = ApkIndex()
+    held = {app.id: apply(app, index) for app in apps}
+    finish(apps, index, held, parse_size(args.budget) if args.budget else DISK_BUDGET)
+    index.save()
+    metrics.finish("retention")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,117 @@
 #!/usr/bin/env python3
-import yaml, sys, logging
+"""
+App setup for Fury's F-Droid Repository
+
+Creates the missing apks/<id>/ directories and keeps fdroid/metadata/<id>.yml
+in step with the catalog. The desired metadata is compared with the parsed
+file on disk, not its text, and a file is only rewritten (atomically) when a
+value differs, so a run with no catalog changes writes nothing. The ids whose
+metadata changed are written to fdroid/tmp/dirty-metadata.json (absent when
+none did) and, in Actions, reported as the metadata_changed step output; the
+pipeline's index stage is skipped when no metadata, APK or icon changed.
+
+Phase 2 runs this without installing the requirements, so it imports nothing
+beyond PyYAML and the standard library (catalog.py, metrics.py).
+
+Tuning (environment):
+  FDROID_WORKERS  metadata files synced in parallel (default 8)
+"""
+
+import os, sys, json, yaml, logging
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import catalog
+import metrics
+from catalog import SafeLoader
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
 ROOT = Path(__file__).resolve().parents[1]
-APPS = ROOT / "apps.yaml"
 APKS = ROOT / "apks"
 META = ROOT / "fdroid" / "metadata" / "icons"
+METADATA_DIR = ROOT / "fdroid" / "metadata"
+# ids whose metadata the last setup() rewrote, for the index stage
+DIRTY_FILE = ROOT / "fdroid" / "tmp" / "dirty-metadata.json"
+# same knob as github_client.DEFAULT_WORKERS, which would pull in requests
+WORKERS = int(os.environ.get("FDROID_WORKERS", "8"))
 
-if not APPS.exists():
-    logging.error("apps.yaml missing. Phase 2 cannot continue.")
-    sys.exit(1)
 
-APKS.mkdir(parents=True, exist_ok=True)
-META.mkdir(parents=True, exist_ok=True)
-METADATA_DIR = ROOT / "fdroid" / "metadata"
-METADATA_DIR.mkdir(parents=True, exist_ok=True)
+def load_apps() -> catalog.Catalog:
+    try:
+        return catalog.load()
+    except catalog.CatalogError as e:
+        logging.error(f"{e}. Phase 2 cannot continue.")
+        sys.exit(1)
+
+
+def desired_metadata(app, current: dict) -> dict:
+    """current metadata with the fields apps.yaml owns brought up to date"""
+    metadata = dict(current)
+    metadata['Name'] = app.name
+    metadata['AuthorName'] = app.author
+    metadata['WebSite'] = app.url or ''
+    metadata['SourceCode'] = app.url or ''
+    if app.categories:
+        metadata['Categories'] = list(app.categories)
+    return metadata
+
+
+def sync_metadata(app) -> bool:
+    """Rewrite fdroid/metadata/<id>.yml only if its content would change; True if it did"""
+    metadata_file = METADATA_DIR / f"{app.id}.yml"
+    current = {}
+    if metadata_file.exists():
+        with open(metadata_file, 'r') as f:
+            current = yaml.load(f, Loader=SafeLoader) or {}
+    metadata = desired_metadata(app, current)
+    if metadata == current:
+        return False
+
+    tmp = metadata_file.with_name(f".{metadata_file.name}.tmp")
+    with open(tmp, 'w') as f:
+        yaml.dump(metadata, f, sort_keys=False, allow_unicode=True)
+    os.replace(tmp, metadata_file)
+    return True
 
-with open(APPS, "r") as f:
-    data = yaml.safe_load(f)
 
-if not isinstance(data, dict) or 'apps' not in data:
-    logging.error("apps.yaml format invalid. Expected a dict with 'apps' key.")
-    sys.exit(1)
+def setup(apps: catalog.Catalog) -> set:
+    """Create missing app directories and sync metadata; returns the ids whose metadata changed"""
+    for directory in (APKS, META, METADATA_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
 
-for app in data['apps']:
-    if "id" not in app:
-        logging.error(f"Invalid entry: {app}")
-        continue
+    existing = {entry.name for entry in os.scandir(APKS) if entry.is_dir()}
+    for app in apps:
+        if app.id not in existing:
+            (APKS / app.id).mkdir(exist_ok=True)
 
-    pkg = app["id"]
-    (APKS / pkg).mkdir(exist_ok=True)
+    named = [app for app in apps if app.name]
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        changed = list(pool.map(sync_metadata, named))
+    dirty = {app.id for app, c in zip(named, changed) if c}
+    metrics.count("metadata_written", len(dirty))
 
-    # Sync metadata
-    name = app.get('name')
-    if name:
-        metadata_file = METADATA_DIR / f"{pkg}.yml"
-        metadata = {}
-        if metadata_file.exists():
-            with open(metadata_file, 'r') as f:
-                metadata = yaml.safe_load(f) or {}
+    logging.info(f"Setup complete: {len(dirty)} of {len(named)} metadata files changed.")
+    return dirty
 
-        metadata['Name'] = name
-        metadata['AuthorName'] = app.get('author', '')
-        metadata['WebSite'] = app.get('url', '')
-        metadata['SourceCode'] = app.get('url', '')
 
-        categories = app.get('fdroid', {}).get('categories', [])
-        if categories:
-            metadata['Categories'] = categories
+def write_dirty(dirty: set):
+    """Publish the changed ids for later steps: dirty-metadata.json and $GITHUB_OUTPUT"""
+    text = json.dumps(sorted(dirty))
+    if not dirty:
+        DIRTY_FILE.unlink(missing_ok=True)  # an earlier run's ids must not linger
+    elif not DIRTY_FILE.exists() or DIRTY_FILE.read_text() != text:
+        DIRTY_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = DIRTY_FILE.with_suffix(".tmp")
+        tmp.write_text(text)
+        os.replace(tmp, DIRTY_FILE)
+    path = os.environ.get("GITHUB_OUTPUT")
+    if path:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"metadata_changed={str(bool(dirty)).lower()}\n")
 
-        with open(metadata_file, 'w') as f:
-            yaml.dump(metadata, f, sort_keys=False, allow_unicode=True)
 
-logging.info("Setup complete (Apps + Metadata synced).")
\ No newline at end of file
+if __name__ == "__main__":
+    with metrics.span("setup"):
+        write_dirty(setup(load_apps()))
+    metrics.finish("setup_apps")
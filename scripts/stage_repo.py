@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Stage downloaded APKs into fdroid/repo without copying them
+
+Every APK under apks/<package>/ is linked into a content-addressed store
+(apks/.store/<sha256[:2]>/<sha256>.apk) and fdroid/repo is populated with
+hardlinks to those objects (reflink, then plain copy, where hardlinks are not
+possible). Only entries that changed since the last staging are touched, and
+entries that are no longer wanted are removed. A manifest of what was staged
+is kept in apks/.store/staged.json.
+
+Archived builds (apks-archive/<package>/, see retention.py) are staged into
+fdroid/archive the same way, with their manifest in staged-archive.json.
+"""
+
+import os, sys, json, shutil, logging
+from pathlib import Path
+
+from apk_index import ApkIndex
+from retention import ARCHIVE_DIR
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+APKS_DIR = ROOT / "apks"
+STORE = APKS_DIR / ".store"
+MANIFEST = STORE / "staged.json"
+ARCHIVE_MANIFEST = STORE / "staged-archive.json"
+REPO_DIR = ROOT / "fdroid" / "repo"
+ARCHIVE_REPO_DIR = ROOT / "fdroid" / "archive"
+
+FICLONE = 0x40049409  # linux/fs.h
+
+
+def reflink(src: Path, dst: Path):
+    import fcntl
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def place(src: Path, dst: Path) -> str:
+    """Make dst share src's data: hardlink > reflink > copy; returns the method used"""
+    tmp = dst.with_name(f".{dst.name}.staging")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+        method = "hardlink"
+    except OSError:
+        try:
+            reflink(src, tmp)
+            method = "reflink"
+        except (OSError, ImportError):
+            tmp.unlink(missing_ok=True)
+            shutil.copy2(src, tmp)
+            method = "copy"
+    os.replace(tmp, dst)
+    return method
+
+
+def same_file(a: Path, b: Path) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def unchanged_copy(target: Path, obj: Path) -> bool:
+    try:
+        return target.stat().st_size == obj.stat().st_size
+    except OSError:
+        return False
+
+
+def store_object(sha: str) -> Path:
+    return STORE / sha[:2] / f"{sha}.apk"
+
+
+def desired_entries(index: ApkIndex, source: Path = APKS_DIR) -> dict:
+    """{repo file name: source apk} for every APK under source/<package>/"""
+    by_name = {}
+    for apk in sorted(source.glob("*/*.apk")):
+        if apk.parent == STORE:
+            continue
+        by_name.setdefault(apk.name, []).append(apk)
+
+    wanted = {}
+    for name, apks in by_name.items():
+        if len(apks) == 1:
+            wanted[name] = apks[0]
+        else:
+            # Same file name in several packages; the old flat cp let them overwrite each other
+            for apk in apks:
+                wanted[f"{apk.parent.name}_{name}"] = apk
+    return wanted
+
+
+def stage_section(index: ApkIndex, source: Path, repo_dir: Path, manifest: Path, counts: dict) -> dict:
+    """Sync repo_dir with the APKs under source; returns {name: sha256} staged"""
+    repo_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        previous = json.loads(manifest.read_text())
+    except (OSError, ValueError):
+        previous = {}
+
+    staged = {}
+    for name, apk in desired_entries(index, source).items():
+        sha = index.sha256(apk)
+        obj = store_object(sha)
+        if not obj.exists():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            place(apk, obj)
+        target = repo_dir / name
+        if previous.get(name) == sha and (same_file(target, obj) or unchanged_copy(target, obj)):
+            counts["kept"] += 1
+        else:
+            counts[place(obj, target)] += 1
+            counts["added"] += 1
+        staged[name] = sha
+
+    # Only remove what we staged before, never files fdroid generated
+    for name in set(previous) - set(staged):
+        target = repo_dir / name
+        if target.exists():
+            target.unlink()
+            counts["removed"] += 1
+
+    manifest.parent.mkdir(parents=True, exist_ok=True)
+    manifest.write_text(json.dumps(staged, indent=1, sort_keys=True))
+    return staged
+
+
+def stage(index: ApkIndex, repo_dir: Path = REPO_DIR, archive_dir: Path = ARCHIVE_REPO_DIR) -> dict:
+    """Sync repo_dir with apks/ and archive_dir with archived builds; returns added/kept/removed counts"""
+    counts = {"added": 0, "kept": 0, "removed": 0, "hardlink": 0, "reflink": 0, "copy": 0}
+    live = set(stage_section(index, APKS_DIR, repo_dir, MANIFEST, counts).values())
+    if ARCHIVE_DIR.is_dir() or ARCHIVE_MANIFEST.exists():
+        live.update(stage_section(index, ARCHIVE_DIR, archive_dir, ARCHIVE_MANIFEST, counts).values())
+
+    # Store objects nothing links to any more
+    for obj in STORE.glob("*/*.apk"):
+        try:
+            if obj.stat().st_nlink == 1 and obj.stem not in live:
+                obj.unlink()
+        except OSError:
+            pass
+    return counts
+
+
+def main():
+    if not APKS_DIR.exists():
+        logging.error("apks/ missing. Run the download step first.")
+        sys.exit(1)
+
+    index = ApkIndex()
+    counts = stage(index)
+    index.save()
+    logging.info(f"Staged fdroid/repo: {counts['added']} added, {counts['kept']} unchanged, "
+                 f"{counts['removed']} removed ({counts['hardlink']} hardlinks, "
+                 f"{counts['reflink']} reflinks, {counts['copy']} copies)")
+
+
+if __name__ == "__main__":
+    main()
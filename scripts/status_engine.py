@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+App status report for Fury's F-Droid Repository
+
+Builds the app status table from three sources:
+
+  - the catalog (catalog.py) for names, sources and the configured channel
+  - the newest release of every app, from releases the caller already has
+    (the pipeline's fetch stage), the previous report, or GitHub
+  - the versions already shipped, from the generated index and the APK index
+    (repo_query.py)
+
+The previous report (docs/app-status.json) doubles as a cache: an entry is
+only looked up again when it is older than FDROID_STATUS_MAX_AGE, its catalog
+entry changed, or the last lookup failed. A failed lookup keeps the release
+fields of the last successful one and sets "failed" to when it happened;
+"checked" stays the time of the last successful lookup. Stale entries are resolved with
+batched GraphQL queries where possible and one REST call per remaining repo,
+all in parallel over the shared GitHubClient (HTTP pool, ETag cache, rate
+limiting). docs/app-status.md is only rewritten when the table changed.
+With --offline nothing is looked up and the page is built from local data.
+
+Usage:
+  status_engine.py            refresh stale entries and write both reports
+  status_engine.py --force    look every app up again
+  status_engine.py --offline  no network: upstream versions from the last report
+
+Tuning (environment):
+  FDROID_STATUS_MAX_AGE  seconds before an entry is looked up again (default 21600)
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import catalog
+import metrics
+from repo_query import RepoQuery
+from github_client import GitHubClient, DEFAULT_WORKERS
+from github_graphql import batch_releases, latest_release
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+STATUS_PAGE = ROOT / "docs" / "app-status.md"
+STATUS_JSON = ROOT / "docs" / "app-status.json"
+MAX_AGE = float(os.environ.get("FDROID_STATUS_MAX_AGE", str(6 * 3600)))
+
+REPORT_VERSION = 1
+
+TABLE_HEADER = ("| App Name | Latest Version | Shipped | Source | Pre-release | Status |\n"
+                "|----------|----------------|---------|--------|-------------|--------|\n")
+
+
+def load_report(path: Path = STATUS_JSON) -> dict:
+    """{app id: entry} from the previous JSON report, {} if there is none"""
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return data.get("apps", {}) if data.get("version") == REPORT_VERSION else {}
+
+
+def is_stale(entry, app, now: float, max_age: float) -> bool:
+    """Apps without releases wait max_age like the rest; failed lookups are retried"""
+    return (not entry or entry.get("digest") != app.digest or bool(entry.get("failed"))
+            or now - entry.get("checked", 0) > max_age)
+
+
+def release_fields(releases) -> dict:
+    """latest/prerelease/published_at of what /releases/latest would return"""
+    latest = latest_release(releases)
+    if not latest:
+        return {"latest": None, "prerelease": False, "published_at": None}
+    return {"latest": latest.get("tag_name"), "prerelease": bool(latest.get("prerelease")),
+            "published_at": latest.get("published_at")}
+
+
+def lookup(client: GitHubClient, repos, workers=DEFAULT_WORKERS) -> dict:
+    """{repo: releases} for repos; GraphQL batches first, then REST in parallel"""
+    found = batch_releases(client, repos)
+
+    def first_page(repo):
+        try:
+            return client.releases(repo)
+        except Exception as e:
+            logging.warning(f"{repo}: release lookup failed: {e}")
+            return None
+
+    missing = [r for r in repos if r not in found]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for repo, page in zip(missing, pool.map(first_page, missing)):
+            if page is not None:
+                found[repo] = page
+    return found
+
+
+def refresh(apps, client, prefetched=None, shipped=None, previous=None,
+            max_age=MAX_AGE, now=None) -> dict:
+    """{app id: status entry} for every app, looking up only what is stale
+
+    shipped is {app id: versionName}; with client None nothing is looked up.
+    """
+    now = time.time() if now is None else now
+    prefetched = prefetched or {}
+    previous = load_report() if previous is None else previous
+    if shipped is None:
+        shipped = RepoQuery.load().shipped()
+
+    stale = {app.id: app.repo for app in apps if client is not None and app.repo
+             and app.repo not in prefetched and is_stale(previous.get(app.id), app, now, max_age)}
+    with metrics.span("status lookup"):
+        fetched = lookup(client, sorted(set(stale.values()))) if stale else {}
+    metrics.count("status_lookups", len(stale))
+    logging.info(f"Status: {len(stale)} stale entries looked up, "
+                 f"{len(fetched)} resolved")
+
+    report = {}
+    for app in apps:
+        old = previous.get(app.id) or {}
+        releases = prefetched.get(app.repo, fetched.get(app.repo))
+        failed = None
+        if releases is not None:
+            fields, checked = release_fields(releases), now
+        elif not app.repo:
+            fields, checked = release_fields(None), now
+        else:
+            # not looked up, or the lookup failed: the last known release stands
+            fields = {k: old.get(k) for k in ("latest", "prerelease", "published_at")}
+            checked = old.get("checked", now)
+            failed = now if app.id in stale else old.get("failed")
+
+        report[app.id] = {
+            "name": app.name,
+            "url": app.url,
+            "digest": app.digest,
+            "configured_prerelease": app.prerelease,
+            **fields,
+            "shipped": shipped.get(app.id),
+            "status": "Active" if fields["latest"] else "Inactive",
+            "checked": checked,
+            "failed": failed,
+        }
+    return report
+
+
+def render_table(report: dict) -> str:
+    rows = [TABLE_HEADER]
+    for app_id, e in report.items():
+        prerelease = "Yes" if e["configured_prerelease"] or e["prerelease"] else "No"
+        rows.append(f"| {e['name'] or 'N/A'} | {e['latest'] or 'N/A'} | {e['shipped'] or '-'} "
+                    f"| [{app_id}]({e['url'] or 'N/A'}) | {prerelease} | {e['status']} |\n")
+    return "".join(rows)
+
+
+def write_reports(report: dict, page: Path = STATUS_PAGE, json_path: Path = STATUS_JSON) -> bool:
+    """Write the JSON report and, if the table changed, the markdown page; True if it did"""
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = json_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"version": REPORT_VERSION, "apps": report}, indent=1))
+    os.replace(tmp, json_path)
+
+    table = render_table(report)
+    try:
+        if page.read_text(encoding="utf-8").endswith(table):
+            return False
+    except OSError:
+        pass
+    tmp = page.with_suffix(".tmp")
+    tmp.write_text("# App Status Table\n\n"
+                   "This table shows the current status of all apps in the repository.\n\n"
+                   f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+                   + table, encoding="utf-8")
+    os.replace(tmp, page)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write docs/app-status.md and app-status.json")
+    parser.add_argument("--force", action="store_true", help="look every app up again")
+    parser.add_argument("--offline", action="store_true", help="do not query GitHub")
+    args = parser.parse_args()
+
+    try:
+        apps = catalog.load()
+    except catalog.CatalogError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+    client = None if args.offline else GitHubClient()
+    report = refresh(apps, client, max_age=0 if args.force else MAX_AGE)
+    if client is not None:
+        client.close()
+    changed = write_reports(report)
+    metrics.finish("status_engine")
+    logging.info(f"App status for {len(report)} apps written to {STATUS_JSON.relative_to(ROOT)}"
+                 f"{' and ' + str(STATUS_PAGE.relative_to(ROOT)) if changed else ' (table unchanged)'}")
+
+
+if __name__ == "__main__":
+    main()
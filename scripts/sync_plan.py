@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Minimal-transfer deploys for Fury's F-Droid Repository
+
+Phase 3/4 used to upload the whole repo, every APK included, as an artifact,
+and Phase 5 downloaded all of it again, even when a single APK had changed.
+The live site carries publish-manifest.json (publish.py) with the size and
+sha256 of every deployed file, so only what differs from it has to travel:
+
+  plan     (Phase 3/4) hash the local trees (repo/, archive/), compare them
+           with the published manifest and put only the added and changed
+           files into the delta directory, next to sync-plan.json: the full
+           target listing (size and sha256 of every file) plus the
+           added/changed/removed paths
+  rebuild  (Phase 5) recreate the full trees from the delta and, for every
+           unchanged file, the content store in .cache/sync or else the live
+           site; each file is checked against the plan before it is placed
+
+Paths are relative to the site root, as in the manifest: repo/index-v1.jar,
+archive/<name>.apk. Without a published manifest (first deploy, or
+FDROID_PUBLISHED_MANIFEST=0) every file is "added" and the delta is the whole
+tree, as before.
+
+Usage:
+  sync_plan.py plan DELTA TREE[=PREFIX] ...   (PREFIX defaults to the tree's name)
+  sync_plan.py rebuild DELTA DEST
+
+Tuning (environment):
+  FDROID_PUBLISHED_MANIFEST  path or URL of the live publish-manifest.json
+                             (default <site>/publish-manifest.json, "0" disables)
+  FDROID_SITE_URL            site root rebuild fetches from (default: repo_url
+                             in fdroid/config.yml without its last segment)
+  FDROID_SYNC_STORE          rebuild's content store (default .cache/sync)
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import apk_download
+from apk_index import sha256sum
+from github_client import GitHubClient, DEFAULT_WORKERS
+from incremental_index import load_config
+from publish import MANIFEST_NAME
+from stage_repo import place, same_file
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ROOT = Path(__file__).resolve().parents[1]
+PUBLISHED_MANIFEST = os.environ.get("FDROID_PUBLISHED_MANIFEST", "")
+SITE_URL = os.environ.get("FDROID_SITE_URL", "")
+STORE_DIR = Path(os.environ.get("FDROID_SYNC_STORE", ROOT / ".cache" / "sync"))
+
+PLAN_NAME = "sync-plan.json"
+PLAN_VERSION = 1
+
+
+class SyncError(Exception):
+    pass
+
+
+def site_url() -> str:
+    """Site root: FDROID_SITE_URL, or repo_url from fdroid/config.yml minus /repo"""
+    if SITE_URL:
+        return SITE_URL.rstrip("/")
+    repo_url = str(load_config().get("repo_url", "")).rstrip("/")
+    return repo_url.rpartition("/")[0] if "/" in repo_url.partition("://")[2] else repo_url
+
+
+def load_published(source: str):
+    """The published manifest (path or URL), or None when there is none"""
+    try:
+        if source.startswith(("http://", "https://")):
+            client = GitHubClient(cache=None)
+            try:
+                r = client.get(source)
+            finally:
+                client.close()
+            if r.status_code != 200:
+                logging.info(f"No published manifest at {source} (HTTP {r.status_code})")
+                return None
+            manifest = r.json()
+        else:
+            manifest = json.loads(Path(source).read_text())
+    except Exception as e:
+        logging.warning(f"Could not read published manifest {source}: {e}")
+        return None
+    return manifest if isinstance(manifest, dict) and "files" in manifest else None
+
+
+def hash_tree(tree: Path, prefix: str) -> dict:
+    """{prefix/path: {"size", "sha256"}} for the files publish.py lists"""
+    names = set()
+    for dirpath, _, filenames in os.walk(tree):
+        rel_dir = Path(dirpath).relative_to(tree).as_posix()
+        names.update(name if rel_dir == "." else f"{rel_dir}/{name}"
+                     for name in filenames if not name.startswith("."))
+    names = sorted(names)
+
+    def entry(rel):
+        path = tree / rel
+        return {"size": path.stat().st_size, "sha256": sha256sum(path)}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return {f"{prefix}{rel}": e for rel, e in zip(names, pool.map(entry, names))}
+
+
+def plan(trees: dict, published) -> dict:
+    """Compare {prefix: tree} with the published manifest (None: nothing published)"""
+    files = {}
+    for prefix, tree in trees.items():
+        if tree.is_dir():
+            files.update(hash_tree(tree, prefix))
+    old = {rel: e["sha256"] for rel, e in ((published or {}).get("files") or {}).items()
+           if rel.startswith(tuple(trees))}
+    return {
+        "version": PLAN_VERSION,
+        "prefixes": sorted(trees),
+        "files": files,
+        "added": sorted(rel for rel in files if rel not in old),
+        "changed": sorted(rel for rel in files if rel in old and old[rel] != files[rel]["sha256"]),
+        "removed": sorted(rel for rel in old if rel not in files),
+    }
+
+
+def write_delta(result: dict, trees: dict, delta: Path) -> int:
+    """Link the added and changed files into delta with the plan; returns their bytes"""
+    delta.mkdir(parents=True, exist_ok=True)
+    total = 0
+    for rel in result["added"] + result["changed"]:
+        prefix = next(p for p in trees if rel.startswith(p))
+        target = delta / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        place(trees[prefix] / rel[len(prefix):], target)
+        total += result["files"][rel]["size"]
+    tmp = delta / f".{PLAN_NAME}.tmp"
+    tmp.write_text(json.dumps(result, indent=1, sort_keys=True))
+    os.replace(tmp, delta / PLAN_NAME)
+    return total
+
+
+def store_object(sha256: str) -> Path:
+    return STORE_DIR / sha256[:2] / sha256
+
+
+def _matches(path: Path, entry: dict) -> bool:
+    try:
+        return path.stat().st_size == entry["size"] and sha256sum(path) == entry["sha256"]
+    except OSError:
+        return False
+
+
+def rebuild(delta: Path, dest: Path, site: str = None) -> dict:
+    """Recreate every file in delta's plan under dest; returns file counts by source"""
+    try:
+        result = json.loads((delta / PLAN_NAME).read_text())
+    except (OSError, ValueError) as e:
+        raise SyncError(f"{delta / PLAN_NAME} unreadable: {e}")
+    site = (site or site_url()).rstrip("/")
+    counts = {"delta": 0, "store": 0, "fetched": 0, "fetched_bytes": 0, "delta_bytes": 0}
+    client = GitHubClient(cache=None)
+
+    # identical files (icons shared by several builds) are restored once
+    groups = {}
+    for rel, entry in sorted(result["files"].items()):
+        groups.setdefault(entry["sha256"], []).append(rel)
+
+    def restore(group):
+        sha, rels = group
+        entry = result["files"][rels[0]]
+        obj = store_object(sha)
+        shipped = next((delta / rel for rel in rels if (delta / rel).exists()), None)
+        if shipped is not None:
+            if not _matches(shipped, entry):
+                raise SyncError(f"{shipped.relative_to(delta)}: delta copy does not match the plan")
+            source = "delta"
+            if obj.exists() and not same_file(obj, shipped) and not _matches(obj, entry):
+                obj.unlink()  # a stale object must not be placed instead of the delta copy
+            if not obj.exists():
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                place(shipped, obj)
+        elif obj.exists() and _matches(obj, entry):
+            source = "store"
+        else:
+            if obj.exists():
+                logging.warning(f"{rels[0]}: stored copy does not match the plan, fetching it again")
+                obj.unlink()
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                apk_download.download(client, f"{site}/{rels[0]}", obj, size=entry["size"],
+                                      digest=f"sha256:{sha}")
+            except Exception as e:
+                raise SyncError(f"{rels[0]}: could not fetch the published copy from {site}: {e}")
+            source = "fetched"
+        for rel in rels:
+            target = dest / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            place(obj, target)
+        return source, entry["size"], len(rels)
+
+    try:
+        with ThreadPoolExecutor(max_workers=DEFAULT_WORKERS) as pool:
+            for source, size, placed in pool.map(restore, groups.items()):
+                counts[source] += placed
+                if source in ("delta", "fetched"):
+                    counts[f"{source}_bytes"] += size
+    finally:
+        client.close()
+
+    # objects no file of this deploy uses
+    live = {e["sha256"] for e in result["files"].values()}
+    for obj in STORE_DIR.glob("*/*"):
+        if obj.name not in live:
+            obj.unlink()
+    return counts
+
+
+def summary(result: dict) -> str:
+    sizes = result["files"]
+    moved = sum(sizes[rel]["size"] for rel in result["added"] + result["changed"])
+    return (f"{len(result['added'])} added, {len(result['changed'])} changed, "
+            f"{len(result['removed'])} removed of {len(sizes)} files; "
+            f"{moved / 1e6:.1f} of {sum(e['size'] for e in sizes.values()) / 1e6:.1f} MB to transfer")
+
+
+def parse_trees(specs) -> dict:
+    trees = {}
+    for spec in specs:
+        path, _, prefix = spec.partition("=")
+        prefix = (prefix or Path(path).name).strip("/") + "/"
+        trees[prefix] = Path(path)
+    return trees
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan and rebuild minimal-transfer deploys")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("plan", help="write the files that differ from the live site to DELTA")
+    p.add_argument("delta", type=Path)
+    p.add_argument("trees", nargs="+", metavar="TREE[=PREFIX]")
+    p.add_argument("--manifest", default=PUBLISHED_MANIFEST,
+                   help="published manifest path or URL (default: the live site's)")
+    r = sub.add_parser("rebuild", help="recreate the full trees from DELTA and the live site")
+    r.add_argument("delta", type=Path)
+    r.add_argument("dest", type=Path)
+    r.add_argument("--site", default=SITE_URL, help="site root to fetch unchanged files from")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        trees = parse_trees(args.trees)
+        source = args.manifest or f"{site_url()}/{MANIFEST_NAME}"
+        published = load_published(source) if source != "0" else None
+        if published is None:
+            logging.info("Nothing published to compare with, the delta is the whole tree")
+        result = plan(trees, published)
+        write_delta(result, trees, args.delta)
+        logging.info(f"Deploy delta: {summary(result)}")
+    else:
+        try:
+            counts = rebuild(args.delta, args.dest, args.site or None)
+        except SyncError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        logging.info(f"Rebuilt {args.dest}: {counts['delta']} files from the delta "
+                     f"({counts['delta_bytes'] / 1e6:.1f} MB), {counts['store']} from the store, "
+                     f"{counts['fetched']} fetched from the site "
+                     f"({counts['fetched_bytes'] / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
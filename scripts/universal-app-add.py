@@ -16,6 +16,9 @@ import re
 import requests
 from pathlib import Path
 
+import catalog
+from catalog import repo_from_url
+
 
 def extract_info_from_repo(repo_path):
     """Extract app information from a cloned repository"""
@@ -107,9 +110,8 @@ def extract_info_from_repo(repo_path):
             app_info['icon_url'] = f"https://raw.githubusercontent.com/{app_info['author']}/{repo_name}/main/{icon_loc}"
             break
     
-    # If no icon found, use a default GitHub repo icon reference
-    if not app_info['icon_url']:
-        app_info['icon_url'] = f"https://github.com/{app_info['author']}/{repo_name}"
+    # No icon found: leave it out rather than pointing at the repo page;
+    # icons.py probes the usual icon paths of the repository instead
     
     return app_info
 
@@ -219,8 +221,8 @@ def get_manual_app_info():
 
 def validate_github_url(url):
     """Basic validation of GitHub URL"""
-    if 'github.com' not in url:
-        print(f"Warning: URL doesn't appear to be a GitHub URL: {url}")
+    if not repo_from_url(url):
+        print(f"Warning: URL doesn't appear to be a GitHub repository URL: {url}")
         confirm = input("Continue anyway? (y/n): ").strip().lower()
         if confirm not in ['y', 'yes']:
             sys.exit(0)
@@ -237,15 +239,16 @@ def create_app_entry(app_info):
             'domain': app_info['category'],
             'type': app_info['category'],
         },
-        'assets': {
+    }
+    if app_info['icon_url']:
+        entry['assets'] = {
             'icon': {
                 'type': 'github-repo',
                 'url': app_info['icon_url']
             }
-        },
-        'fdroid': {
-            'categories': [app_info['category']]
         }
+    entry['fdroid'] = {
+        'categories': [app_info['category']]
     }
     
     # Add content type if provided
@@ -360,6 +363,13 @@ def main():
     # Create app entry
     app_entry = create_app_entry(app_info)
     
+    # With a per-app catalog directory the entry gets its own file
+    if catalog.CATALOG_DIR.is_dir():
+        path = catalog.write_shard(catalog.CATALOG_DIR, app_entry)
+        catalog.refresh_index(catalog.CATALOG_DIR)
+        print(f"\nApp entry written to {path} and {catalog.INDEX_NAME} updated")
+        return
+    
     # Generate just the app entry
     yaml_content = yaml.dump([app_entry], default_flow_style=False, allow_unicode=True, indent=2)
     
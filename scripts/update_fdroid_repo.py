@@ -1,28 +1,36 @@
 #!/usr/bin/env python3
-import os, sys, json, yaml, logging, subprocess, shutil
+import os, sys, logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from fdroidserver import common
+import catalog
+from catalog import App
+from github_client import GitHubClient, DEFAULT_WORKERS
+from github_graphql import batch_releases, fill_digest
+import apk_download
+import abi_select
+import metrics
+import retention
+from apk_index import ApkIndex
+from poll_schedule import published
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
 ROOT = Path(__file__).resolve().parents[1]
 APKS_DIR = ROOT / "apks"
-APPS_FILE = ROOT / "apps.yaml"
+
+# Parsed APK metadata, persisted between runs so unchanged files aren't re-read
+APK_INDEX = ApkIndex()
 
 # -----------------------------------------
 # Load app list
 # -----------------------------------------
-if not APPS_FILE.exists():
-    logging.error("apps.yaml missing. Cannot continue.")
-    sys.exit(1)
-
-with open(APPS_FILE, "r") as f:
-    apps = yaml.safe_load(f)
-
-if not isinstance(apps, dict) or 'apps' not in apps:
-    logging.error("apps.yaml format invalid. Expected a dict with 'apps' key.")
-    sys.exit(1)
+def load_apps() -> catalog.Catalog:
+    try:
+        return catalog.load()
+    except catalog.CatalogError as e:
+        logging.error(f"{e}. Cannot continue.")
+        sys.exit(1)
 
 # -----------------------------------------
 # Helpers
@@ -38,82 +46,36 @@ def sign_apk(apk_path: Path):
     return
 
 def get_version(apk: Path):
-    try:
-        appid, versionCode, versionName = common.get_apk_id(str(apk))
-        return int(versionCode)
-    except Exception as e:
-        logging.warning(f"Failed to parse {apk.name}: {e}")
-        return -1  # invalid apk gets purged later
+    # invalid apks are indexed with versionCode -1 and get purged later
+    return APK_INDEX.get(apk)["versionCode"]
 
-def prune(package: str):
-    pkg_dir = APKS_DIR / package
-    if not pkg_dir.exists():
-        return
-
-    apks = list(pkg_dir.glob("*.apk"))
-    if not apks:
-        return
-
-    data = []
-    for apk in apks:
-        v = get_version(apk)
-        label = "prerelease" if is_prerelease(apk.name) else "stable"
-        data.append((apk, v, label))
+def unwanted_arch(apk: Path) -> bool:
+    # Decided by the lib/<abi>/ entries, not the file name; no native code runs anywhere
+    return abi_select.kind_from_abis(APK_INDEX.get(apk)["abis"]) == abi_select.SKIP
 
-    stable = sorted([x for x in data if x[2] == "stable"], key=lambda x: x[1], reverse=True)
-    pre = sorted([x for x in data if x[2] == "prerelease"], key=lambda x: x[1], reverse=True)
-
-    purge = stable[2:] + pre[2:]  # keep 2 of each
-    for apk, v, label in purge:
-        logging.info(f"Removing old {label}: {apk.name}")
-        apk.unlink()
+def prune(app: App) -> dict:
+    """Apply the app's retention policy (repo, archive) to what is on disk"""
+    return retention.apply(app, APK_INDEX)
 
 # -----------------------------------------
-# Main — Download loop
+# Per-app worker
 # -----------------------------------------
-for entry in apps['apps']:
-    if "url" not in entry or "id" not in entry:
-        logging.error(f"Invalid entry: {entry}")
-        continue
-
-    # Extract repo from URL
-    repo_url = entry.get('url')
-    if 'github.com/' in repo_url:
-        parts = repo_url.split('github.com/')[1].split('/')
-        if len(parts) >= 2:
-            repo = f"{parts[0]}/{parts[1]}"
-        else:
-            logging.warning(f"Invalid repo URL: {repo_url}")
-            continue
-    else:
-        logging.warning(f"Not a GitHub URL: {repo_url}")
-        continue
-
-    package = entry["id"]
-    prerelease = entry.get("fdroid", {}).get("prefer_prerelease", False)
-
-    pkg_dir = APKS_DIR / package
-    pkg_dir.mkdir(parents=True, exist_ok=True)
-
-    # fetch from releases
-    api = f"https://api.github.com/repos/{repo}/releases"
-    token = os.environ.get("GH_TOKEN", "")
-    curl = ["curl", "-s"]
-    if token: curl += ["-H", f"Authorization: token {token}"]
-    curl.append(api)
-
-    result = subprocess.check_output(curl).decode("utf-8")
-    try:
-        releases = json.loads(result)
-        # Ensure releases is a list
-        if not isinstance(releases, list):
-            logging.warning(f"Expected a list of releases, but got {type(releases)}: {releases}")
-            continue
-    except json.JSONDecodeError:
-        logging.error(f"Failed to decode JSON response for {repo}: {result}")
-        continue
+def select_assets(client: GitHubClient, app: App, prefetched=None) -> list:
+    """(asset, score, abi, published) of each release to keep, newest first"""
+    if not app.repo:
+        # already reported by catalog.load()
+        return []
+
+    prerelease = app.prerelease
+
+    # Walk releases newest first (GraphQL batch first, then REST pages on
+    # demand) and stop at the first build the retention policy would not
+    # keep: anything older would only be archived or deleted by prune().
+    selected = []
+    kept_bytes = 0
+    skip = retention.evicted(app.id)
+    releases = client.iter_releases(app.repo, first_page=(prefetched or {}).get(app.repo))
 
-    # sort newest first by GitHub release ordering
     # For each release, select the BEST single APK based on architecture priority
     for r in releases:
         # Ensure r is a dictionary
@@ -123,54 +85,118 @@ for entry in apps['apps']:
             continue
         if not r.get("prerelease") and prerelease:
             continue
-        
+
         release_assets = []
         for a in r.get("assets", []):
             if isinstance(a, dict) and a.get("name", "").endswith(".apk"):
                 release_assets.append(a)
-        
+
         if not release_assets:
             continue
 
-        # Logic: arm64 > universal > generic > skip x86/other
-        best_asset = None
-        best_score = -1
-
-        for asset in release_assets:
-            name = asset["name"].lower()
-            
-            # Exclude unwanted architectures
-            if any(x in name for x in ["x86", "x64", "amd64", "desktop", "windows", "linux", "macos"]):
-                continue
-            
-            score = 0
-            if "arm64" in name or "aarch64" in name:
-                score = 3
-            elif "universal" in name or "all" in name:
-                score = 2
-            elif not any(x in name for x in ["arm", "7a", "eabi"]): # Generic/Clean name often means universal
-                score = 1
-            
-            if score > best_score:
-                best_score = score
-                best_asset = asset
-        
+        # arm64 > universal > generic > 32-bit arm; x86/desktop builds are skipped
+        best_asset, best_score, abi = abi_select.select_asset(client, release_assets)
         if best_asset:
-            url = best_asset["browser_download_url"]
-            name = best_asset["name"]
-            target = pkg_dir / name
-            if not target.exists():
-                logging.info(f"Downloading ({best_score}): {name}")
-                subprocess.run(["curl", "-L", "-o", str(target), url], check=True)
-                sign_apk(target)
-
+            released = published(r)
+            size = best_asset.get("size") or 0
+            if best_asset.get("name") in skip or not retention.admit(
+                    app, len(selected), kept_bytes, size, released):
+                break
+            selected.append((best_asset, best_score, abi, released))
+            kept_bytes += size
+            if len(selected) >= app.keep:
+                break
+    return selected
+
+def download_assets(client: GitHubClient, package: str, selected: list):
+    pkg_dir = APKS_DIR / package
+    pkg_dir.mkdir(parents=True, exist_ok=True)
+    for best_asset, best_score, abi, released in selected:
+        url = best_asset["browser_download_url"]
+        name = best_asset["name"]
+        target = pkg_dir / name
+        size = best_asset.get("size")
+        if not apk_download.is_complete(target, size):
+            logging.info(f"Downloading ({best_score}, {abi or 'generic'}): {name}")
+            with metrics.span("apk download", asset=name):
+                apk_download.download(client, url, target, size=size,
+                                      digest=fill_digest(client, best_asset))
+            if released:
+                # retention ages builds by release date
+                os.utime(target, (released, released))
+            metrics.count("downloaded")
+            metrics.count("downloaded_bytes", target.stat().st_size)
+            sign_apk(target)
+        # re-recorded every run: a re-parsed entry (new checkout) starts without it
+        APK_INDEX.annotate(target, selectedAbi=abi)
+
+def cleanup(app: App) -> dict:
+    pkg_dir = APKS_DIR / app.id
     # Cleanup unwanted architectures from disk
     for f in pkg_dir.glob("*.apk"):
-        name = f.name.lower()
-        if any(x in name for x in ["x86", "x64", "amd64"]):
+        if unwanted_arch(f):
             logging.info(f"Removing unwanted arch: {f.name}")
+            metrics.count("pruned", reason="arch")
             f.unlink()
+            APK_INDEX.forget(f)
+
+    return prune(app)
+
+def process_app(client: GitHubClient, app: App, prefetched=None):
+    if not app.repo:
+        return None
+    with metrics.span("app", app=app.id):
+        with metrics.span("select"):
+            selected = select_assets(client, app, prefetched)
+        with metrics.span("download"):
+            download_assets(client, app.id, selected)
+        with metrics.span("prune"):
+            return cleanup(app)
+
+# -----------------------------------------
+# Main — Download loop
+# -----------------------------------------
+def main():
+    apps = load_apps()
+    client = GitHubClient(workers=DEFAULT_WORKERS)
+    failed = []
+    held = {}
+
+    # One aliased GraphQL query per batch of repos instead of a REST call per app
+    with metrics.span("graphql"):
+        prefetched = batch_releases(client, [app.repo for app in apps])
+
+    # Apps are independent (one directory each), so wall time is bound by the
+    # slowest repo instead of the sum of all of them.
+    with ThreadPoolExecutor(max_workers=DEFAULT_WORKERS) as pool:
+        futures = {pool.submit(process_app, client, app, prefetched): app for app in apps}
+        for fut in as_completed(futures):
+            app = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                logging.error(f"{app.id}: {e}")
+                failed.append(app.id)
+                continue
+            if result is not None:
+                held[app.id] = result
+
+    # Disk budget across all apps, then ArchivePolicy for fdroid update
+    with metrics.span("retention"):
+        retention.finish(apps, APK_INDEX, held)
+
+    client.close()
+    APK_INDEX.save()
+    abi_select.save_cache()
+    metrics.count("failed_apps", len(failed))
+    metrics.finish("update_fdroid_repo")
+
+    if failed:
+        logging.error(f"Download failed for: {', '.join(map(str, failed))}")
+        sys.exit(1)
+
+    logging.info("Download + sign complete.")
 
-    prune(package)
 
-logging.info("Download + sign complete.")
+if __name__ == "__main__":
+    main()
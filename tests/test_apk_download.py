@@ -0,0 +1,68 @@
+"""
+apk_download against the mock GitHub release server
+
+  python3 -m pytest tests/
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import apk_download  # noqa: E402
+from github_client import GitHubClient  # noqa: E402
+from mock_github import MockGitHub  # noqa: E402
+
+ASSET = "/dl/fury/app/v1.3.0/app-v1.3.0-arm64-v8a.apk"
+
+
+@pytest.fixture
+def mock():
+    server = MockGitHub(apk_size=4096)
+    server.start()
+    yield server
+    server.stop()
+
+
+def run(fn, timeout=10):
+    """fn() in a thread; fails instead of hanging on a deadlock"""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=fn()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "download did not finish (deadlock?)"
+    return result["value"]
+
+
+def test_stale_part_longer_than_asset(mock, tmp_path):
+    # one slot per host: retrying inside the first response would wait forever
+    client = GitHubClient(cache=None, default_limit=1)
+    target = tmp_path / "app.apk"
+    (tmp_path / "app.apk.part").write_bytes(b"x" * 10000)
+    try:
+        written = run(lambda: apk_download.download(client, mock.url + ASSET, target))
+    finally:
+        client.close()
+    data = mock.apk("fury", "app", "v1.3.0", "app-v1.3.0-arm64-v8a.apk")
+    assert written == len(data)
+    assert target.read_bytes() == data
+    assert not (tmp_path / "app.apk.part").exists()
+
+
+def test_resume_partial(mock, tmp_path):
+    client = GitHubClient(cache=None, default_limit=1)
+    data = mock.apk("fury", "app", "v1.3.0", "app-v1.3.0-arm64-v8a.apk")
+    target = tmp_path / "app.apk"
+    (tmp_path / "app.apk.part").write_bytes(data[:1000])
+    try:
+        written = run(lambda: apk_download.download(client, mock.url + ASSET, target,
+                                                    size=len(data)))
+    finally:
+        client.close()
+    assert written == len(data) - 1000
+    assert target.read_bytes() == data
@@ -0,0 +1,57 @@
+"""
+apk_header against fdroidserver.common.get_apk_id on generated APKs
+
+The APKs come from benchmarks/mock_github.py (real zips with a binary
+AndroidManifest.xml), so nothing binary is checked in.
+
+  python3 -m pytest tests/
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import apk_header  # noqa: E402
+import mock_github  # noqa: E402
+
+common = pytest.importorskip("fdroidserver.common")
+
+
+def write_apk(tmp_path, name, **kwargs) -> Path:
+    args = dict(package="org.fury.test", version_code=1234, version_name="1.2.3",
+                abi=mock_github.ARM64, size=0)
+    args.update(kwargs)
+    path = tmp_path / name
+    path.write_bytes(mock_github.build_apk(**args))
+    return path
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"abi": None},
+    {"version_code": 2147483647, "version_name": "9.9.9-beta"},
+    {"package": "a.b", "version_code": 1, "version_name": "1", "size": 64 * 1024},
+])
+def test_matches_fdroidserver(tmp_path, kwargs):
+    apk = write_apk(tmp_path, "app.apk", **kwargs)
+    fast = apk_header.read_manifest(apk)
+    assert (fast["package"], fast["versionCode"], fast["versionName"]) == common.get_apk_id(str(apk))
+
+
+def test_version_code_major_falls_back(tmp_path):
+    apk = write_apk(tmp_path, "major.apk", version_code_major=3)
+    with pytest.raises(apk_header.ApkHeaderError):
+        apk_header.read_manifest(apk)
+    assert apk_header.get_apk_id(apk) == common.get_apk_id(str(apk))
+
+
+def test_not_an_apk(tmp_path):
+    path = tmp_path / "broken.apk"
+    path.write_bytes(b"PK\x03\x04 not really a zip")
+    with pytest.raises(apk_header.ApkHeaderError):
+        apk_header.read_manifest(path)
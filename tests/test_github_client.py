@@ -0,0 +1,73 @@
+"""
+GitHubClient.iter_releases against the mock GitHub release server
+
+  python3 -m pytest tests/
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import github_client  # noqa: E402
+from github_client import GitHubClient  # noqa: E402
+from mock_github import MockGitHub  # noqa: E402
+
+REPO = "fury/app"
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    server = MockGitHub(releases=25, apk_size=1024)
+    server.start()
+    monkeypatch.setattr(github_client, "API_URL", server.url)
+    yield server
+    server.stop()
+
+
+def tags(releases) -> list:
+    return [r["tag_name"] for r in releases]
+
+
+@pytest.mark.parametrize("first, per_page", [
+    (10, 10),   # first page as REST returns it
+    (7, 10),    # a GraphQL batch smaller than a REST page
+    (15, 10),   # a GraphQL batch larger than a REST page
+    (4, 3),
+])
+def test_continues_after_first_page(mock, monkeypatch, first, per_page):
+    monkeypatch.setattr(github_client, "GRAPHQL_RELEASES", first)
+    everything = mock.releases(REPO)
+    client = GitHubClient(cache=None)
+    try:
+        walked = list(client.iter_releases(REPO, first_page=everything[:first], per_page=per_page,
+                                           limit=100))
+    finally:
+        client.close()
+    assert tags(walked) == tags(everything)
+
+
+def test_short_first_page_is_the_whole_history(mock, monkeypatch):
+    monkeypatch.setattr(github_client, "GRAPHQL_RELEASES", 10)
+    first = mock.releases(REPO)[:5]
+    client = GitHubClient(cache=None)
+    try:
+        walked = list(client.iter_releases(REPO, first_page=first, per_page=10))
+        requests = mock.stats.snapshot()["api"]
+    finally:
+        client.close()
+    assert tags(walked) == tags(first)
+    assert requests == 0
+
+
+def test_limit(mock):
+    client = GitHubClient(cache=None)
+    try:
+        walked = list(client.iter_releases(REPO, per_page=4, limit=9))
+    finally:
+        client.close()
+    assert tags(walked) == tags(mock.releases(REPO)[:9])
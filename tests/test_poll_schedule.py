@@ -0,0 +1,74 @@
+"""
+poll_schedule.expected_gap and the intervals derived from it
+
+  python3 -m pytest tests/
+"""
+
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import poll_schedule  # noqa: E402
+
+DAY = 86400
+NOW = 1_700_000_000
+
+
+def release(days_ago: float, **fields) -> dict:
+    when = datetime.fromtimestamp(NOW - days_ago * DAY, timezone.utc)
+    return dict({"published_at": when.strftime("%Y-%m-%dT%H:%M:%SZ")}, **fields)
+
+
+@pytest.mark.parametrize("releases, gap", [
+    (None, None),
+    ([], None),
+    ([{"published_at": None}, {"published_at": "not a date"}], None),
+    # a single release: the time since it
+    ([release(4)], 4 * DAY),
+    # weekly releases, the last one a day ago: the median gap
+    ([release(1), release(8), release(15), release(22)], 7 * DAY),
+    # weekly once, quiet for 60 days since: half the silence
+    ([release(60), release(67), release(74)], 30 * DAY),
+    # unordered input and a created_at fallback
+    ([release(15), {"created_at": release(1)["published_at"]}, release(8)], 7 * DAY),
+    # two releases on the same day count as one gap of 7 days
+    ([release(1), release(1), release(8)], 7 * DAY),
+    # a release dated in the future (clock skew) is not a negative age
+    ([release(-1)], 0),
+])
+def test_expected_gap(releases, gap):
+    assert poll_schedule.expected_gap(releases, NOW) == gap
+
+
+def test_interval_is_clamped(tmp_path):
+    schedule = poll_schedule.PollSchedule(path=tmp_path / "s.json", min_interval=3600,
+                                          max_interval=3 * DAY, factor=0.1)
+    assert schedule.interval([], NOW) == 3 * DAY
+    assert schedule.interval([release(0.01)], NOW) == 3600
+    assert schedule.interval([release(1), release(11)], NOW) == pytest.approx(DAY)
+    assert schedule.interval([release(400), release(800)], NOW) == 3 * DAY
+
+
+def test_due_and_order(tmp_path):
+    schedule = poll_schedule.PollSchedule(path=tmp_path / "s.json")
+    schedule.apps = {
+        "daily": {"checked": NOW - 2 * 3600, "interval": 3600, "latest": "v2"},
+        "weekly": {"checked": NOW - 3600, "interval": DAY, "latest": "v1"},
+    }
+    assert schedule.order(["weekly", "daily", "new"], NOW) == ["new", "daily", "weekly"]
+    assert schedule.due(["weekly", "daily", "new"], NOW) == ["new", "daily"]
+
+
+def test_save_round_trip(tmp_path):
+    path = tmp_path / "s.json"
+    schedule = poll_schedule.PollSchedule(path=path)
+    schedule.observe("app", [release(1, tag_name="v2", draft=True), release(2, tag_name="v1")], NOW)
+    schedule.save()
+    again = poll_schedule.PollSchedule(path=path)
+    assert again.apps["app"]["latest"] == "v1"
+    assert again.apps["app"]["checked"] == NOW
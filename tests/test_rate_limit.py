@@ -0,0 +1,135 @@
+"""
+rate_limit.RateLimiter backoff and token buckets, on a fake clock
+
+  python3 -m pytest tests/
+"""
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import rate_limit  # noqa: E402
+
+NOW = 1_700_000_000
+
+
+class Clock:
+    """time.time/time.sleep stand-ins: sleeping moves the clock"""
+
+    def __init__(self, now=NOW):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def limiter(clock, **kwargs):
+    return rate_limit.RateLimiter(clock=clock.time, sleep=clock.sleep, **kwargs)
+
+
+def response(status, text="", **headers):
+    return SimpleNamespace(status_code=status, text=text,
+                           headers={k.replace("_", "-"): v for k, v in headers.items()})
+
+
+def rate_headers(limit, remaining, reset, resource="core"):
+    return {"x-ratelimit-limit": str(limit), "x-ratelimit-remaining": str(remaining),
+            "x-ratelimit-reset": str(reset), "x-ratelimit-resource": resource}
+
+
+@pytest.mark.parametrize("resp, attempt, wait", [
+    (response(200), 0, None),
+    (response(404), 0, None),
+    (response(403, "Resource not accessible by integration"), 0, None),
+    (response(403, retry_after="30"), 0, 30),
+    (response(429, retry_after="0"), 0, 1),
+    (response(403, x_ratelimit_remaining="0", x_ratelimit_reset=str(NOW + 120)), 0, 121),
+    (response(403, x_ratelimit_remaining="0", x_ratelimit_reset=str(NOW - 5)), 0, 1),
+    (response(429), 0, rate_limit.SECONDARY_BACKOFF),
+    (response(429), 2, rate_limit.SECONDARY_BACKOFF * 4),
+    (response(403, "You have exceeded a secondary rate limit"), 1, rate_limit.SECONDARY_BACKOFF * 2),
+])
+def test_backoff(resp, attempt, wait):
+    assert limiter(Clock()).backoff(resp, attempt) == wait
+
+
+def test_acquire_without_headers_does_not_wait():
+    clock = Clock()
+    rl = limiter(clock)
+    for _ in range(100):
+        rl.acquire()
+    assert clock.slept == []
+
+
+def test_acquire_takes_tokens_down_to_the_reserve():
+    clock = Clock()
+    rl = limiter(clock, reserve=2)
+    rl.update(rate_headers(10, 5, NOW + 60))
+    for _ in range(3):
+        rl.acquire()
+    assert rl.buckets["core"].remaining == 2
+    assert clock.slept == []
+
+
+def test_acquire_waits_for_the_reset():
+    clock = Clock()
+    rl = limiter(clock, reserve=2, max_wait=300)
+    rl.update(rate_headers(10, 2, NOW + 60))
+    rl.acquire()
+    assert clock.slept == [61]
+    assert rl.waited == 61
+    # the new window starts full, minus the token just taken
+    assert rl.buckets["core"].remaining == 9
+
+
+def test_acquire_raises_past_max_wait():
+    clock = Clock()
+    rl = limiter(clock, reserve=2, max_wait=30)
+    rl.update(rate_headers(10, 2, NOW + 600))
+    with pytest.raises(rate_limit.RateLimitExceeded) as e:
+        rl.acquire()
+    assert e.value.resource == "core" and e.value.reset == NOW + 600
+    assert clock.slept == []
+
+
+def test_buckets_are_per_resource():
+    clock = Clock()
+    rl = limiter(clock, reserve=2, max_wait=30)
+    rl.update(rate_headers(10, 2, NOW + 600))
+    rl.update(rate_headers(5000, 4000, NOW + 600, resource="graphql"))
+    rl.acquire("graphql")
+    assert rl.buckets["graphql"].remaining == 3999
+    with pytest.raises(rate_limit.RateLimitExceeded):
+        rl.acquire("core")
+
+
+def test_update_keeps_local_count_within_a_window():
+    rl = limiter(Clock(), reserve=0)
+    rl.update(rate_headers(10, 8, NOW + 60))
+    rl.acquire()
+    rl.acquire()
+    # a response sent before those two requests must not hand their tokens back
+    rl.update(rate_headers(10, 7, NOW + 60))
+    assert rl.buckets["core"].remaining == 6
+    # a new reset time is a new window
+    rl.update(rate_headers(10, 10, NOW + 3660))
+    assert rl.buckets["core"].remaining == 10
+
+
+@pytest.mark.parametrize("path, resource", [
+    ("/graphql", "graphql"),
+    ("/search/repositories", "search"),
+    ("/repos/fury/app/releases", "core"),
+])
+def test_resource_for(path, resource):
+    assert rate_limit.resource_for(path) == resource
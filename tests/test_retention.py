@@ -0,0 +1,178 @@
+"""
+retention's apply, _trim_archive and enforce_budget on a temporary repo
+
+  python3 -m pytest tests/
+"""
+
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import retention  # noqa: E402
+
+NOW = 1_700_000_000
+DAY = retention.DAY
+
+
+class Index:
+    """The parts of ApkIndex retention uses: versionCode by path, forget()"""
+
+    def __init__(self):
+        self.versions = {}
+        self.forgotten = []
+
+    def get(self, path):
+        return {"versionCode": self.versions[Path(path).name]}
+
+    def forget(self, path):
+        self.forgotten.append(Path(path).name)
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(retention, "APKS_DIR", tmp_path / "apks")
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", tmp_path / "apks-archive")
+    monkeypatch.setattr(retention, "STATE_FILE", tmp_path / "retention.json")
+    monkeypatch.setattr(retention, "_state", None)
+    return tmp_path
+
+
+def app(**kwargs):
+    fields = dict(id="org.fury.app", keep=2, max_age_days=None, max_bytes=None, archive=False,
+                  archive_keep=5)
+    fields.update(kwargs)
+    return SimpleNamespace(**fields)
+
+
+def add(index, directory: Path, version: int, size=100, age_days=0) -> Path:
+    """An APK of size bytes released age_days before NOW"""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"app-{version}.apk"
+    path.write_bytes(b"x" * size)
+    os.utime(path, (NOW - age_days * DAY, NOW - age_days * DAY))
+    index.versions[path.name] = version
+    return path
+
+
+def names(builds) -> list:
+    return [b.path.name for b in builds]
+
+
+def listing(directory: Path) -> list:
+    return sorted(p.name for p in directory.glob("*.apk")) if directory.is_dir() else []
+
+
+def test_apply_keeps_newest(repo):
+    index, a = Index(), app(keep=2)
+    for version in (1, 2, 3, 4):
+        add(index, repo / "apks" / a.id, version)
+    held = retention.apply(a, index, now=NOW)
+    assert names(held["repo"]) == ["app-4.apk", "app-3.apk"]
+    assert held["archive"] == []
+    assert listing(repo / "apks" / a.id) == ["app-3.apk", "app-4.apk"]
+    assert sorted(index.forgotten) == ["app-1.apk", "app-2.apk"]
+
+
+def test_apply_archives_everything_older_than_a_rejected_build(repo):
+    index, a = Index(), app(keep=5, max_age_days=30, archive=True)
+    add(index, repo / "apks" / a.id, 4, age_days=1)
+    add(index, repo / "apks" / a.id, 3, age_days=40)
+    # released recently but older than an aged-out build: leaves with it
+    add(index, repo / "apks" / a.id, 2, age_days=2)
+    held = retention.apply(a, index, now=NOW)
+    assert names(held["repo"]) == ["app-4.apk"]
+    assert names(held["archive"]) == ["app-3.apk", "app-2.apk"]
+    assert listing(repo / "apks-archive" / a.id) == ["app-2.apk", "app-3.apk"]
+
+
+def test_apply_newest_build_always_stays(repo):
+    index, a = Index(), app(keep=3, max_age_days=1, max_bytes=10)
+    add(index, repo / "apks" / a.id, 7, size=500, age_days=100)
+    add(index, repo / "apks" / a.id, 6, size=500, age_days=200)
+    held = retention.apply(a, index, now=NOW)
+    assert names(held["repo"]) == ["app-7.apk"]
+    assert listing(repo / "apks" / a.id) == ["app-7.apk"]
+
+
+def test_apply_removes_invalid_version(repo):
+    index, a = Index(), app()
+    add(index, repo / "apks" / a.id, 3)
+    add(index, repo / "apks" / a.id, -1)
+    held = retention.apply(a, index, now=NOW)
+    assert names(held["repo"]) == ["app-3.apk"]
+    assert index.forgotten == ["app--1.apk"]
+
+
+def test_trim_archive(repo):
+    index, a = Index(), app(archive=True, archive_keep=2)
+    kept = [retention.Build(add(index, repo / "apks" / a.id, 5), a.id, 5, 100, NOW, False)]
+    archive_dir = repo / "apks-archive" / a.id
+    for version in (6, 5, 4, 3, 2):
+        add(index, archive_dir, version)
+    archive = retention.builds(archive_dir, a.id, index, archived=True)
+    left = retention._trim_archive(a, archive, kept, index)
+    # 6 and 5 are not older than the repo's builds, 2 is past archive_keep
+    assert names(left) == ["app-4.apk", "app-3.apk"]
+    assert listing(archive_dir) == ["app-3.apk", "app-4.apk"]
+
+
+def test_trim_archive_off(repo):
+    index, a = Index(), app(archive=False)
+    archive_dir = repo / "apks-archive" / a.id
+    add(index, archive_dir, 1)
+    archive = retention.builds(archive_dir, a.id, index, archived=True)
+    assert retention._trim_archive(a, archive, [], index) == []
+    assert listing(archive_dir) == []
+
+
+def held_for(index, repo, app_id, repo_sizes, archive_sizes=()):
+    """{app_id: apply() result} with one build per size, newest first, a day apart"""
+    result = {"repo": [], "archive": []}
+    for tier, directory, sizes, version in (
+            ("repo", repo / "apks" / app_id, repo_sizes, 100),
+            ("archive", repo / "apks-archive" / app_id, archive_sizes, 50)):
+        for i, size in enumerate(sizes):
+            path = add(index, directory, version - i, size=size, age_days=i)
+            result[tier].append(retention.Build(path, app_id, version - i, size, NOW - i * DAY,
+                                                tier == "archive"))
+    return {app_id: result}
+
+
+def test_budget_evicts_archive_first(repo):
+    index = Index()
+    held = held_for(index, repo, "a", [100, 100], [100, 100])
+    freed = retention.enforce_budget(held, index, budget=250, now=NOW)
+    assert freed == 200
+    assert held["a"]["archive"] == [] and len(held["a"]["repo"]) == 2
+    assert retention.load_state()["evicted"] == {}
+
+
+def test_budget_keeps_newest_and_records_evictions(repo):
+    index = Index()
+    held = held_for(index, repo, "a", [100, 100])
+    held.update(held_for(index, repo, "b", [100, 300]))
+    freed = retention.enforce_budget(held, index, budget=350, now=NOW)
+    # across apps the largest size x age goes first; each app's newest build stays
+    assert freed == 300
+    assert names(held["a"]["repo"]) == ["app-100.apk", "app-99.apk"]
+    assert names(held["b"]["repo"]) == ["app-100.apk"]
+    assert retention.load_state()["evicted"] == {"b": {"app-99.apk": 300}}
+    assert retention.evicted("b") == {"app-99.apk"}
+
+    # once there is room again, the eviction is forgotten so it is downloaded again
+    retention.enforce_budget(held, index, budget=1000, now=NOW)
+    assert retention.load_state()["evicted"]["b"] == {}
+
+
+def test_budget_never_evicts_newest(repo):
+    index = Index()
+    held = held_for(index, repo, "a", [500, 100])
+    retention.enforce_budget(held, index, budget=10, now=NOW)
+    assert names(held["a"]["repo"]) == ["app-100.apk"]
+    assert listing(repo / "apks" / "a") == ["app-100.apk"]